@@ -0,0 +1,683 @@
+"""
+Micro-benchmarks for the LED send path.
+
+Run one of the benchmarks, for example:
+
+    python ./benchmark.py packet
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+import requests
+import websockets
+
+from config import load_config, parse_walls
+from frames import (FRAME_HEADER, FRAME_MAGIC, PacketLayout, as_frame, downsample, parse_frame_message,
+                    parse_hex_differences, parse_hex_frame)
+from layout import VideoSampler
+from protocols import ENCODERS, PROTOCOLS
+from render import LatencyStat
+from transport import BACKENDS, BatchUdpTransport, UdpTransport
+from wall import StreamSource, Wall, hex_to_rgb
+from worker import WallProcess
+
+LEDS_PER_CONTROLLER = 100
+
+
+def time_per_call(func: Callable[[], object], repeat: int,
+                  clock: Callable[[], float] = time.perf_counter) -> float:
+    """
+    Returns the average time of func in microseconds, wall time by default
+    or e.g. process CPU time with clock=time.process_time.
+    """
+    func()  # warm up
+    start = clock()
+    for _ in range(repeat):
+        func()
+    return (clock() - start) / repeat * 1e6
+
+
+def legacy_build_packet(colors: List[Tuple[int, int, int]]) -> bytes:
+    """
+    The original per-LED packet builder, kept as the baseline.
+    """
+    reversed_colors = colors[::-1]
+    packet = bytearray()
+    for (r, g, b) in reversed_colors:
+        packet += bytes([r, g, b])
+    return packet
+
+
+def bench_packet(args) -> None:
+    """
+    Compares building every controller packet of a frame at several sizes.
+    """
+    print(f"{'LEDs':>8} {'legacy (us)':>14} {'slices (us)':>14} {'layout (us)':>14} {'speedup':>9}")
+    for num_leds in (400, 4_000, 40_000):
+        controllers = num_leds // LEDS_PER_CONTROLLER
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 256, size=(num_leds, 3), dtype=np.uint8)
+        colors = [tuple(c) for c in frame.tolist()]
+        layout = PacketLayout([LEDS_PER_CONTROLLER] * controllers)
+
+        def legacy():
+            return [legacy_build_packet(colors[i * LEDS_PER_CONTROLLER:(i + 1) * LEDS_PER_CONTROLLER])
+                    for i in range(controllers)]
+
+        def slices():
+            return [frame[i * LEDS_PER_CONTROLLER:(i + 1) * LEDS_PER_CONTROLLER][::-1].tobytes()
+                    for i in range(controllers)]
+
+        assert [bytes(p) for p in layout.build(frame)] == legacy()
+        repeat = max(args.repeat * 400 // num_leds, 5)
+        legacy_us = time_per_call(legacy, repeat)
+        slices_us = time_per_call(slices, args.repeat)
+        layout_us = time_per_call(lambda: layout.build(frame), args.repeat)
+        print(f"{num_leds:>8} {legacy_us:>14.1f} {slices_us:>14.1f} {layout_us:>14.1f} "
+              f"{legacy_us / layout_us:>8.0f}x")
+
+
+def legacy_downsample(image: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    """
+    The original frame reduction, converting the full frame to RGB before
+    resizing, kept as the baseline.
+    """
+    image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+    return cv.resize(image, (cols, rows), interpolation=cv.INTER_AREA)
+
+
+def bench_downsample(args) -> None:
+    """
+    Compares the CPU time of reducing a decoded BGR frame to the 4x5 window
+    grid at 720p, 1080p and 4K.
+    """
+    print(f"{'source':>8} {'legacy (ms)':>12} {'native (ms)':>12} {'stride 4 (ms)':>14} "
+          f"{'stride 8 (ms)':>14} {'speedup':>9}")
+    repeat = max(args.repeat // 10, 10)
+    for name, (height, width) in (("720p", (720, 1280)), ("1080p", (1080, 1920)), ("4K", (2160, 3840))):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        timings = [
+            time_per_call(lambda: legacy_downsample(image, 4, 5), repeat, time.process_time),
+            time_per_call(lambda: downsample(image, 4, 5), repeat, time.process_time),
+            time_per_call(lambda: downsample(image, 4, 5, row_stride=4), repeat, time.process_time),
+            time_per_call(lambda: downsample(image, 4, 5, row_stride=8), repeat, time.process_time),
+        ]
+        legacy_ms, native_ms, stride4_ms, stride8_ms = [t / 1000 for t in timings]
+        print(f"{name:>8} {legacy_ms:>12.2f} {native_ms:>12.2f} {stride4_ms:>14.2f} "
+              f"{stride8_ms:>14.2f} {legacy_ms / stride4_ms:>8.1f}x")
+
+
+def bench_mapping(args) -> None:
+    """
+    Compares the CPU time of mapping a decoded BGR frame onto the wall layout
+    at window resolution and at LED resolution, against the 60 FPS frame budget.
+    """
+    layout = load_config().layout
+    samplers = [
+        ("window", VideoSampler(layout)),
+        ("led", VideoSampler(layout, per_led=True)),
+        ("led stride 4", VideoSampler(layout, per_led=True, row_stride=4)),
+    ]
+    budget_ms = 1000 / 60
+    print(f"{layout.num_leds} LEDs, {layout.rows}x{layout.cols} windows, "
+          f"LED sample grid {layout.sample_shape[0]}x{layout.sample_shape[1]}, 60 FPS budget {budget_ms:.1f} ms")
+    print(f"{'source':>8} {'mode':>14} {'colors':>7} {'ms/frame':>9} {'of budget':>10}")
+    repeat = max(args.repeat // 10, 10)
+    for name, (height, width) in (("720p", (720, 1280)), ("1080p", (1080, 1920)), ("4K", (2160, 3840))):
+        # Smooth gradients, so every LED that samples its own spot gets its own color
+        y, x = np.mgrid[0:height, 0:width]
+        image = np.dstack((x * 256 // width, y * 256 // height, (x // 8) % 256)).astype(np.uint8)
+        for mode, sampler in samplers:
+            colors = len(np.unique(sampler.map(image), axis=0))
+            ms = time_per_call(lambda: sampler.map(image), repeat, time.process_time) / 1000
+            print(f"{name:>8} {mode:>14} {colors:>7} {ms:>9.2f} {ms / budget_ms:>9.0%}")
+
+
+def bench_protocols(args) -> None:
+    """
+    Compares encoding a frame of 4 controllers in every WLED realtime protocol,
+    with 100 LEDs per controller and, for the protocols that split a
+    controller over several packets, 1,000.
+    """
+    print(f"{'protocol':>8} {'LEDs/controller':>16} {'packets':>8} {'bytes':>8} {'build (us)':>11}")
+    for protocol in PROTOCOLS:
+        for leds in (LEDS_PER_CONTROLLER, 1_000):
+            if leds > ENCODERS[protocol].max_leds and not ENCODERS[protocol].chunked:
+                continue
+            layout = PacketLayout([leds] * 4, protocols=[protocol] * 4)
+            frame = np.random.default_rng(0).integers(0, 256, size=(layout.num_leds, 3), dtype=np.uint8)
+            build_us = time_per_call(lambda: layout.build(frame), args.repeat)
+            size = sum(len(p) for p in layout.packets)
+            print(f"{protocol:>8} {leds:>16} {len(layout.packets):>8} {size:>8} {build_us:>11.1f}")
+
+
+def parse_dmx(packet: bytes) -> Tuple[str, int, int, bytes]:
+    """
+    Decodes an E1.31 or Art-Net packet into (kind, universe, sequence, channels),
+    kind being "data" or "sync".
+    """
+    if packet.startswith(b"Art-Net\0"):
+        if packet[8:10] == b"\x00\x52":
+            return "sync", 0, 0, b""
+        length = int.from_bytes(packet[16:18], "big")
+        return "data", packet[14] | packet[15] << 8, packet[12], packet[18:18 + length]
+    if int.from_bytes(packet[18:22], "big") == 0x08:
+        return "sync", int.from_bytes(packet[45:47], "big"), packet[44], b""
+    slots = int.from_bytes(packet[123:125], "big") - 1
+    return "data", int.from_bytes(packet[113:115], "big"), packet[111], packet[126:126 + slots]
+
+
+def bench_dmx(args) -> None:
+    """
+    Packs frames into E1.31 and Art-Net universes and sends them to a local
+    UDP listener standing in for a DMX bridge, checking that the universes
+    received add up to the frame.
+    """
+    print(f"{'protocol':>8} {'LEDs':>7} {'universes':>10} {'build (us)':>11} {'send (us)':>10} {'received':>9}")
+    ip = "127.0.0.2"
+    for protocol in ("e131", "artnet"):
+        for num_leds in (400, 4_000, 40_000):
+            layout = PacketLayout([num_leds], protocols=[protocol])
+            listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+            listener.bind((ip, layout.ports[0]))
+            listener.setblocking(False)
+            transport = BatchUdpTransport([ip] * len(layout.packets), layout.ports,
+                                          groups=layout.destinations, sequences=layout.sequences)
+            rng = np.random.default_rng(0)
+            frame = rng.integers(0, 256, size=(num_leds, 3), dtype=np.uint8)
+            build_us = time_per_call(lambda: layout.build(frame), args.repeat)
+
+            repeat = max(args.repeat * 400 // num_leds, 5)
+            samples, received = [], []
+            for _ in range(repeat):
+                frame = rng.integers(0, 256, size=(num_leds, 3), dtype=np.uint8)
+                packets = layout.build(frame)
+                start = time.perf_counter_ns()
+                transport.send_all(packets)
+                samples.append(time.perf_counter_ns() - start)
+                received = []
+                while True:
+                    try:
+                        received.append(listener.recv(2048))
+                    except BlockingIOError:
+                        break
+            transport.close()
+            listener.close()
+
+            # The last frame: every universe in order with the same sequence number, then the sync packet
+            decoded = [parse_dmx(packet) for packet in received]
+            data = sorted((universe, channels) for kind, universe, _, channels in decoded if kind == "data")
+            ok = (len(received) == len(layout.packets) and decoded[-1][0] == "sync" and
+                  len({sequence for _, _, sequence, _ in decoded[:-1]}) == 1 and
+                  b"".join(channels for _, channels in data)[:num_leds * 3] == frame[layout.index].tobytes())
+            print(f"{protocol:>8} {num_leds:>7} {len(data):>10} {build_us:>11.1f} "
+                  f"{np.mean(samples) / 1000:>10.1f} {'ok' if ok else 'MISMATCH':>9}")
+
+
+def bench_transport(args) -> None:
+    """
+    Sends frames to local UDP listeners (one loopback address per controller)
+    with every transport backend and reports syscalls and send latency.
+    """
+    print(f"{'controllers':>11} {'backend':>16} {'syscalls/frame':>15} {'avg (us)':>10} "
+          f"{'p50 (us)':>10} {'p99 (us)':>10} {'skew p99 (us)':>14}")
+    port = 19446
+    for controllers in (4, 40, 200):
+        ips = [f"127.0.{i // 250}.{i % 250 + 2}" for i in range(controllers)]
+        listeners = []
+        for ip in ips:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((ip, port))
+            listeners.append(sock)
+        layout = PacketLayout([LEDS_PER_CONTROLLER] * controllers)
+        frame = np.zeros((layout.num_leds, 3), dtype=np.uint8)
+        backends = [
+            ("threaded", lambda: UdpTransport(ips, port)),
+            ("threaded (sync)", lambda: UdpTransport(ips, port, sync=True)),
+            ("batch (sendto)", lambda: BatchUdpTransport(ips, port, use_sendmmsg=False)),
+            ("batch (sendmmsg)", lambda: BatchUdpTransport(ips, port)),
+        ]
+        for name, factory in backends:
+            transport = factory()
+            if name.endswith("(sendmmsg)") and not transport.use_sendmmsg:
+                transport.close()
+                continue
+            samples = []
+            for _ in range(args.repeat):
+                packets = layout.build(frame)
+                start = time.perf_counter_ns()
+                transport.send_all(packets)
+                samples.append(time.perf_counter_ns() - start)
+            samples = np.array(samples) / 1000
+            print(f"{controllers:>11} {name:>16} {transport.syscalls / transport.frames_sent:>15.2f} "
+                  f"{samples.mean():>10.1f} {np.percentile(samples, 50):>10.1f} "
+                  f"{np.percentile(samples, 99):>10.1f} {transport.stats()['skew_us']['p99']:>14.1f}")
+            transport.close()
+        for sock in listeners:
+            sock.close()
+
+
+def bench_stream(args) -> None:
+    """
+    Compares the CPU time of taking a full frame from a WebSocket message:
+    the legacy update command (hex colors joined by ", ") against a binary
+    frame, bare and with a header, copied into the frame buffer.
+    """
+    print(f"{'LEDs':>6} {'legacy (us)':>12} {'binary (us)':>12} {'header (us)':>12} {'speedup':>8}")
+    for num_leds in (400, 4000, 40000):
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 256, (num_leds, 3), dtype=np.uint8)
+        update = b", ".join(bytes(color).hex().encode() for color in frame)
+        bare = frame.tobytes()
+        with_header = FRAME_HEADER.pack(FRAME_MAGIC, 1, time.monotonic_ns() // 1000, 0) + bare
+        source = StreamSource(num_leds)
+
+        def legacy():
+            colors = [c.decode() for c in update.split(b", ")]
+            return as_frame([hex_to_rgb(c) for c in colors], num_leds)
+
+        def binary(message: bytes):
+            _, sequence, timestamp, rgb = parse_frame_message(message)
+            source.push(rgb, sequence, timestamp)
+
+        assert (legacy() == frame).all()
+        binary(with_header)
+        assert (source.frame == frame).all()
+        repeat = max(args.repeat * 400 // num_leds, 10)
+        legacy_us = time_per_call(legacy, max(repeat // 10, 10), time.process_time)
+        binary_us = time_per_call(lambda: binary(bare), repeat, time.process_time)
+        header_us = time_per_call(lambda: binary(with_header), repeat, time.process_time)
+        print(f"{num_leds:>6} {legacy_us:>12.1f} {binary_us:>12.1f} {header_us:>12.1f} "
+              f"{legacy_us / binary_us:>7.0f}x")
+
+
+def bench_legacy(args) -> None:
+    """
+    Compares legacy update and difference commands per second (parsing and
+    applying the payload to the legacy frame) with the original per-color
+    parsing and the vectorized parsers, and checks both give the same frame.
+    """
+    config = load_config()
+    with tempfile.TemporaryDirectory() as video_dir:
+        wall = Wall("bench", config, video_dir, video_dir)
+    num_leds = config.num_leds
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (num_leds, 3), dtype=np.uint8)
+    hex_colors = [bytes(color).hex().encode() for color in frame]
+
+    def original_update(payload: bytes):
+        wall.update_matrix_legacy([c.decode() for c in payload.split(b", ")])
+
+    def vectorized_update(payload: bytes):
+        wall.update_matrix_legacy(parse_hex_frame(payload))
+
+    def original_difference(payload: bytes):
+        parts = payload.split(b", ")
+        wall.update_differences([[parts[i].decode().strip("()"), parts[i+1].decode().strip("()")]
+                                 for i in range(0, len(parts), 2)])
+
+    def vectorized_difference(payload: bytes):
+        wall.apply_differences(*parse_hex_differences(payload))
+
+    commands = [("update", b", ".join(hex_colors), original_update, vectorized_update)]
+    for pairs in (1, 20, num_leds):
+        indices = rng.choice(num_leds, pairs, replace=False)
+        payload = b", ".join(b"(%d, %s)" % (idx, hex_colors[idx]) for idx in indices)
+        commands.append((f"difference x{pairs}", payload, original_difference, vectorized_difference))
+
+    print(f"{num_leds} LEDs")
+    print(f"{'command':>16} {'bytes':>6} {'original/s':>11} {'vectorized/s':>13} {'speedup':>8}")
+    for name, payload, original, vectorized in commands:
+        results = []
+        for func in (original, vectorized):
+            wall.legacy_frame[:] = 0
+            func(payload)
+            results.append(wall.legacy_frame.copy())
+        assert (results[0] == results[1]).all()
+        original_us = time_per_call(lambda: original(payload), max(args.repeat // 10, 10), time.process_time)
+        vectorized_us = time_per_call(lambda: vectorized(payload), args.repeat, time.process_time)
+        print(f"{name:>16} {len(payload):>6} {1e6 / original_us:>11.0f} {1e6 / vectorized_us:>13.0f} "
+              f"{original_us / vectorized_us:>7.1f}x")
+
+
+def write_test_video(path: str, seconds: float = 4, fps: int = 60, size: Tuple[int, int] = (1280, 720)) -> None:
+    """
+    Writes a video of moving gradients with noise, so every frame takes a full decode.
+    """
+    width, height = size
+    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"mp4v"), fps, size)
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    for i in range(int(seconds * fps)):
+        image = np.dstack(((x + i * 16) % 256, (y + i * 8) % 256, (x + y) // 16 % 256)).astype(np.uint8)
+        writer.write(image + rng.integers(0, 32, image.shape, dtype=np.uint8))
+    writer.release()
+
+
+def bench_walls(args) -> None:
+    """
+    Plays a 60 FPS 720p video on N walls at once, decoded live, with every
+    wall in this process and with every wall in its own worker process, and
+    reports the frame rate the walls keep up, their dropped frames and the
+    CPU cores used.
+    """
+    seconds = 5.0
+    print(f"{os.cpu_count()} CPU cores, {seconds:.0f}s of a 60 FPS 720p video per run")
+    print(f"{'walls':>5} {'mode':>10} {'avg fps':>8} {'min fps':>8} {'dropped':>8} {'cores':>6}")
+    with tempfile.TemporaryDirectory() as video_dir:
+        video_path = os.path.join(video_dir, "bench.mp4")
+        write_test_video(video_path)
+        for count in (1, 2, 4, 8):
+            # Four controllers per wall, on local UDP listeners
+            ips = [[f"127.0.{w + 1}.{c + 2}" for c in range(4)] for w in range(count)]
+            listeners = []
+            for ip in sum(ips, []):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.bind((ip, 19446))
+                listeners.append(sock)
+            for mode in ("process", "workers"):
+                data = {
+                    "rows": 2, "cols": 10,
+                    "settings": {"transport": "batch", "clip_workers": 0, "worker_process": mode == "workers"},
+                    "walls": {f"wall{w}": {"controllers": [
+                        {"ip": ip, "origin": origin} for ip, origin in zip(ips[w], ([0, 5], [0, 0], [1, 5], [1, 0]))]}
+                        for w in range(count)},
+                }
+                walls = [(WallProcess if config.settings["worker_process"] else Wall)(
+                    wall_id, config, video_dir, os.path.join(video_dir, ".ledclips", wall_id))
+                    for wall_id, config in parse_walls(data).items()]
+                fps, dropped, cores = asyncio.run(run_walls(walls, "bench.mp4", seconds))
+                print(f"{count:>5} {mode:>10} {np.mean(fps):>8.1f} {np.min(fps):>8.1f} "
+                      f"{np.mean(dropped):>7.1%} {cores:>6.2f}")
+            for sock in listeners:
+                sock.close()
+
+
+async def run_walls(walls: List, video_name: str, seconds: float) -> Tuple[List[float], List[float], float]:
+    """
+    Plays the video on all walls and returns the frame rate and the share of
+    dropped frames of every wall over the measured seconds, and the CPU cores used.
+    """
+    for wall in walls:
+        await wall.start()
+    try:
+        for wall in walls:
+            await wall.start_video(video_name)
+        await asyncio.sleep(1.0)  # Warm up
+
+        def measure():
+            stats = [wall.stats() for wall in walls]
+            cpu = time.process_time() + sum(s["process"]["cpu_time"] for s in stats if "process" in s)
+            return stats, cpu, time.perf_counter()
+
+        before, cpu_before, start = await asyncio.to_thread(measure)
+        await asyncio.sleep(seconds)
+        after, cpu_after, end = await asyncio.to_thread(measure)
+    finally:
+        for wall in walls:
+            await wall.close()
+
+    fps, dropped = [], []
+    for first, last in zip(before, after):
+        ticks = last["render"]["ticks"] - first["render"]["ticks"]
+        drops = (last["render"]["source_stats"].get("dropped_frames", 0)
+                 - first["render"]["source_stats"].get("dropped_frames", 0))
+        fps.append(ticks / (end - start))
+        dropped.append(drops / max(ticks + drops, 1))
+    return fps, dropped, (cpu_after - cpu_before) / (end - start)
+
+
+def bench_websocket(args) -> None:
+    """
+    Sends legacy update commands to the API (a uvicorn server in a
+    subprocess) at a fixed rate and as fast as possible, per ack mode, and
+    reports the commands per second it takes, the frames per second that
+    reach the controllers (local UDP listeners) and the latency from
+    sending a command to its frame arriving on the wire.
+    """
+    seconds = 3.0
+    ips = [f"127.0.9.{c + 2}" for c in range(4)]
+    listeners = []
+    for ip in ips:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((ip, 19446))
+        sock.settimeout(0.1)
+        listeners.append(sock)
+    # Every update colors all LEDs with its sequence number; note when each first arrives
+    arrivals: Dict[int, float] = {}
+    stop = threading.Event()
+
+    def receive():
+        while not stop.is_set():
+            try:
+                packet = listeners[0].recv(65536)
+            except socket.timeout:
+                continue
+            arrivals.setdefault(int.from_bytes(packet[-3:], "big"), time.perf_counter())
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = os.path.join(directory, "config.json")
+        with open(config_path, "w") as f:
+            json.dump({"rows": 2, "cols": 10, "settings": {"transport": "batch", "clip_workers": 0},
+                       "controllers": [{"ip": ip, "origin": origin}
+                                       for ip, origin in zip(ips, ([0, 5], [0, 0], [1, 5], [1, 0]))]}, f)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, "LED_CONFIG": config_path},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        try:
+            for _ in range(100):
+                try:
+                    num_leds = len(requests.get(f"http://127.0.0.1:{port}/frame", timeout=1).json()["frame"])
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+            else:
+                raise RuntimeError("The API server did not start")
+            print(f"{num_leds} LEDs, {seconds:.0f}s per run")
+            print(f"{'acks':>5} {'sent/s':>8} {'took/s':>8} {'wire fps':>9} {'p50 ms':>8} {'p99 ms':>8}")
+            sequence = 0
+            for acks in ("each", "batch", "none"):
+                for rate in (60, 240, None):
+                    first = sequence + 1
+                    sent, took, sequence = asyncio.run(send_updates(
+                        f"ws://127.0.0.1:{port}/ws/v1?acks={acks}", num_leds, first, rate, seconds))
+                    time.sleep(0.3)  # Let the last frame arrive
+                    latencies = [(arrivals[i] - sent[i]) * 1000 for i in range(first, sequence + 1) if i in arrivals]
+                    print(f"{acks:>5} {rate or 'flood':>8} {took:>8.0f} {len(latencies) / seconds:>9.1f} "
+                          f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f}")
+        finally:
+            stop.set()
+            receiver.join()
+            server.terminate()
+            server.wait()
+            for sock in listeners:
+                sock.close()
+
+
+async def send_updates(url: str, num_leds: int, first: int, rate: Optional[float],
+                       seconds: float) -> Tuple[Dict[int, float], float, int]:
+    """
+    Sends update commands numbered from first for the given seconds, at the
+    given rate or as fast as possible, and returns their send times, the
+    commands per second and the last number.
+    """
+    sent: Dict[int, float] = {}
+    async with websockets.connect(url, max_queue=None) as ws:
+        each = url.endswith("acks=each")
+        drain = None if each else asyncio.create_task(ws.recv())
+        sequence, start = first, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            color = b"%06x" % sequence
+            sent[sequence] = time.perf_counter()
+            await ws.send(b"update; " + b", ".join([color] * num_leds))
+            if each:
+                await ws.recv()
+            if drain is not None and drain.done():
+                drain = asyncio.create_task(ws.recv())
+            if rate:
+                await asyncio.sleep(max(start + (sequence - first + 1) / rate - time.perf_counter(), 0))
+            else:
+                await asyncio.sleep(0)
+            sequence += 1
+        took = (sequence - first) / (time.perf_counter() - start)
+        if drain is not None:
+            drain.cancel()
+    return sent, took, sequence - 1
+
+
+def bench_piano(args) -> None:
+    """
+    Key press latency, from the key event to its packets being sent, with the
+    original full frame send and with the piano path of Wall.handle_piano
+    (only the changed controllers' packets), per transport backend. The
+    packets are received by local UDP listeners and checked against a full
+    build of the piano frame.
+    """
+    ips = [f"127.0.8.{c + 2}" for c in range(4)]
+    listeners = []
+    for ip in ips:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        sock.bind((ip, 19446))
+        sock.setblocking(False)
+        listeners.append(sock)
+    print(f"{args.repeat} key presses per run, 4 controllers")
+    print(f"{'LEDs':>5} {'backend':>8} {'path':>6} {'p50 (us)':>9} {'p99 (us)':>9} {'max (us)':>9} {'packets/key':>12}")
+    for leds in (100, 480):
+        for backend in BACKENDS:
+            data = {"leds": leds, "rows": 2, "cols": 10, "settings": {"transport": backend, "clip_workers": 0},
+                    "controllers": [{"ip": ip, "origin": origin}
+                                    for ip, origin in zip(ips, ([0, 5], [0, 0], [1, 5], [1, 0]))]}
+            config = next(iter(parse_walls(data).values()))
+            with tempfile.TemporaryDirectory() as video_dir:
+                wall = Wall("bench", config, video_dir, video_dir)
+                for path, stats, packets in asyncio.run(press_keys(wall, listeners, args.repeat)):
+                    print(f"{leds * 4:>5} {backend:>8} {path:>6} {stats['p50_us']:>9.1f} {stats['p99_us']:>9.1f} "
+                          f"{stats['max_us']:>9.1f} {packets / args.repeat:>12.1f}")
+    for sock in listeners:
+        sock.close()
+
+
+async def press_keys(wall: Wall, listeners: List[socket.socket], presses: int) -> List[Tuple[str, Dict, int]]:
+    """
+    Presses every window in turn, with the original full frame send and with
+    Wall.handle_piano, and returns the latency stats and the packets received
+    per path.
+    """
+    last: List[Optional[bytes]] = [None] * len(listeners)
+
+    def drain() -> int:
+        count = 0
+        for idx, sock in enumerate(listeners):
+            while True:
+                try:
+                    last[idx] = sock.recv(65536)
+                    count += 1
+                except BlockingIOError:
+                    break
+        return count
+
+    def key(i: int) -> Tuple[int, int, Tuple[int, int, int]]:
+        return i % 4, i // 4 % 5, (i % 256, 255 - i % 256, 128)
+
+    await wall.start()
+    results = []
+    try:
+        # The original path: rebuild the whole frame from the window states and send all controllers
+        latency = LatencyStat()
+        states = np.zeros_like(wall.piano_states)
+        drain()
+        for i in range(presses):
+            controller_idx, window_idx, color = key(i)
+            received_ns = time.monotonic_ns()
+            states[:] = 0
+            states[wall.config.window_offsets[controller_idx] + window_idx] = color
+            await wall.send_frames(states[wall.config.led_windows])
+            latency.add((time.monotonic_ns() - received_ns) / 1e9)
+            if i % 64 == 0:
+                await asyncio.sleep(0)
+        results.append(("full", latency.as_dict(), drain()))
+
+        wall.piano_latency = LatencyStat()
+        await wall.handle_piano(0, 0)  # Shows the piano frame, the next keys only send their controllers
+        drain()
+        wall.piano_latency = LatencyStat()
+        packets = 0
+        for i in range(presses):
+            controller_idx, window_idx, color = key(i)
+            await wall.handle_piano(controller_idx, window_idx, color, received_ns=time.monotonic_ns())
+            if i % 64 == 0:
+                await asyncio.sleep(0)
+                packets += drain()
+        results.append(("piano", wall.piano_latency.as_dict(), packets + drain()))
+        # Every controller last got the packet of the piano frame
+        expected = [bytes(packet) for packet in wall.packet_layout.build(wall.build_piano_colors())]
+        assert last == expected, "the controllers got different packets than a full build"
+    finally:
+        await wall.close()
+    return results
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks for the LED send path")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1000,
+        help="Number of iterations per measurement."
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    subparsers.add_parser(
+        "packet", help="Packet building at 400, 4,000 and 40,000 LEDs.").set_defaults(func=bench_packet)
+    subparsers.add_parser(
+        "downsample", help="Video frame reduction CPU time at 720p, 1080p and 4K.").set_defaults(func=bench_downsample)
+    subparsers.add_parser(
+        "mapping", help="Window and per-LED video mapping CPU time at 720p, 1080p and 4K.").set_defaults(func=bench_mapping)
+    subparsers.add_parser(
+        "protocols", help="Frame encoding per WLED realtime protocol.").set_defaults(func=bench_protocols)
+    subparsers.add_parser(
+        "dmx", help="E1.31 and Art-Net universe packing, checked against a local listener.").set_defaults(func=bench_dmx)
+    subparsers.add_parser(
+        "transport", help="Frame send latency and syscalls per transport backend.").set_defaults(func=bench_transport)
+    subparsers.add_parser(
+        "legacy", help="Legacy update and difference commands per second.").set_defaults(func=bench_legacy)
+    subparsers.add_parser(
+        "stream", help="Legacy update command against binary frames, CPU time per frame.").set_defaults(func=bench_stream)
+    subparsers.add_parser(
+        "walls", help="Simultaneous video walls in one process and in worker processes.").set_defaults(func=bench_walls)
+    subparsers.add_parser(
+        "websocket", help="Legacy update commands through the API per ack mode, latency to the wire.").set_defaults(
+        func=bench_websocket)
+    subparsers.add_parser(
+        "piano", help="Key press to UDP send latency, full frame against per-controller sends.").set_defaults(
+        func=bench_piano)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,581 @@
+"""
+Pre-compiled LED clips.
+
+A clip is a video rendered once into the raw wall frames it produces, so
+looping it costs no decoding at all. The file is a fixed 128-byte header
+followed by frame_count frames of num_leds * 3 bytes (R, G, B per LED). The
+header holds these little-endian fields (84 bytes), padded with zeros:
+
+    magic        8s   b"LEDCLIP3"
+    version      u32  3
+    fps          f64
+    grid_rows    u32
+    grid_cols    u32
+    num_leds     u32
+    frame_count  u32
+    source_size  u64  size of the video the clip was compiled from
+    source_mtime u64  mtime (ns) of the video the clip was compiled from
+    source_hash  16s  BLAKE2b digest of the video the clip was compiled from
+    mapping_hash 16s  VideoSampler.digest() of the frame mapping the clip was compiled with
+
+Clips of another magic or version are recompiled.
+
+Clips live in a cache directory kept up to date by a ClipCompiler.
+
+Run `python ./clips.py <video> [<video> ...]` to compile clips offline.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Event, RLock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import struct
+import time
+
+import cv2 as cv
+import numpy as np
+
+from config import DEFAULT_WALL, Config, load_walls
+from frames import Frame
+from layout import VideoSampler, create_sampler
+from render import FrameSource, PlaybackClock
+
+MAGIC = b"LEDCLIP3"
+VERSION = 3
+HEADER = struct.Struct("<8sIdIIIIQQ16s16s")
+HEADER_SIZE = 128
+CLIP_EXTENSION = ".ledclip"
+PARTIAL_EXTENSION = ".part"
+
+VIDEO_DIR = os.path.join(os.path.dirname(__file__), "videos")
+
+
+def clip_cache_dir(wall_id: str, config: Config) -> str:
+    """
+    Returns the directory of a wall's compiled LED clips: every wall maps the
+    videos onto its own layout, so the walls of a multi-wall config each get
+    their own directory within the cache.
+    """
+    cache_dir = config.settings["clip_cache"] or os.path.join(VIDEO_DIR, ".ledclips")
+    return cache_dir if wall_id == DEFAULT_WALL else os.path.join(cache_dir, wall_id)
+
+
+def clip_path_for(video_path: str, cache_dir: str = None) -> str:
+    """
+    Returns the path of the compiled clip for a video: in cache_dir if given,
+    otherwise next to the video.
+    """
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(cache_dir or os.path.dirname(video_path), stem + CLIP_EXTENSION)
+
+
+def file_digest(path: str) -> bytes:
+    """
+    Returns the 16-byte BLAKE2b digest of a file's content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class LedClip:
+    """
+    A compiled clip, memory-mapped read-only.
+
+    Attributes:
+        frames (np.memmap): (frame_count, num_leds, 3) uint8 wall frames.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not an LED clip (truncated header)")
+        (magic, version, self.fps, self.grid_rows, self.grid_cols, self.num_leds,
+         self.frame_count, self.source_size, self.source_mtime,
+         self.source_hash, self.mapping_hash) = HEADER.unpack_from(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} LED clip")
+        self.path = path
+        self.frames = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_SIZE,
+                                shape=(self.frame_count, self.num_leds, 3))
+
+    def is_fresh(self, video_path: str) -> bool:
+        """
+        Returns True if the clip was compiled from the current version of the video.
+        """
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            return False
+        return st.st_size == self.source_size and st.st_mtime_ns == self.source_mtime
+
+
+def open_clip(video_path: str, sampler: VideoSampler, clip_path: str = None) -> Optional[LedClip]:
+    """
+    Opens the compiled clip of a video if there is one that is up to date and
+    was compiled with the same frame mapping (layout and resolution).
+    """
+    path = clip_path or clip_path_for(video_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        clip = LedClip(path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring LED clip {path} => {e}")
+        return None
+    if clip.mapping_hash != sampler.digest() or clip.frame_count == 0 or not clip.is_fresh(video_path):
+        return None
+    return clip
+
+
+def compile_clip(video_path: str, sampler: VideoSampler, clip_path: str = None) -> str:
+    """
+    Decodes a video once and writes every wall frame to a clip file.
+
+    The clip is written to a partial file and renamed into place, so readers
+    never see a partial clip. While compiling, the partial file's header holds
+    the expected frame count, see compile_progress().
+
+    Args:
+        video_path (str): Path to the video file.
+        sampler (VideoSampler): Maps the decoded frames onto the wall.
+        clip_path (str): Output path, defaults to clip_path_for(video_path).
+
+    Returns:
+        str: The path of the compiled clip.
+    """
+    clip_path = clip_path or clip_path_for(video_path)
+    st = os.stat(video_path)
+    source_hash = file_digest(video_path)
+    cap = cv.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Failed to open video file: {video_path}")
+    fps = cap.get(cv.CAP_PROP_FPS) or 30
+    expected_frames = max(int(cap.get(cv.CAP_PROP_FRAME_COUNT)), 0)
+
+    def header(frame_count: int) -> bytes:
+        layout = sampler.layout
+        return HEADER.pack(MAGIC, VERSION, fps, layout.rows, layout.cols, layout.num_leds,
+                           frame_count, st.st_size, st.st_mtime_ns, source_hash, sampler.digest())
+
+    tmp_path = clip_path + PARTIAL_EXTENSION
+    frame_count = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header(expected_frames).ljust(HEADER_SIZE, b"\0"))
+            f.flush()
+            while True:
+                frame = sampler.read(cap)
+                if frame is None:
+                    break
+                f.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+                frame_count += 1
+            f.seek(0)
+            f.write(header(frame_count))
+        os.replace(tmp_path, clip_path)
+    finally:
+        cap.release()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logging.info(f"Compiled {video_path} into {clip_path} ({frame_count} frames at {fps:.2f} FPS)")
+    return clip_path
+
+
+def compile_progress(clip_path: str) -> Optional[float]:
+    """
+    Returns the progress (0-1) of the compilation writing clip_path, or None
+    if it is not being compiled.
+    """
+    tmp_path = clip_path + PARTIAL_EXTENSION
+    try:
+        with open(tmp_path, "rb") as f:
+            header = f.read(HEADER.size)
+        size = os.path.getsize(tmp_path)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return 0.0
+    fields = HEADER.unpack(header)
+    num_leds, expected_frames = fields[5], fields[6]
+    if not expected_frames or not num_leds:
+        return 0.0
+    written = max(size - HEADER_SIZE, 0) // (num_leds * 3)
+    return round(min(written / expected_frames, 1.0), 3)
+
+
+def refresh_clip(video_path: str, sampler: VideoSampler, clip_path: str) -> bool:
+    """
+    Brings the clip of a video up to date; runs in a ClipCompiler worker process.
+
+    A clip whose size and content hash still match the video (e.g. the video
+    was copied or touched) only gets its recorded mtime updated; anything
+    else is compiled again.
+
+    Returns:
+        bool: True if the clip was compiled, False if it was only revalidated.
+    """
+    try:
+        clip = LedClip(clip_path)
+    except (OSError, ValueError):
+        clip = None
+    if clip is not None and clip.mapping_hash == sampler.digest() and clip.frame_count:
+        st = os.stat(video_path)
+        if clip.source_size == st.st_size and clip.source_hash == file_digest(video_path):
+            with open(clip_path, "r+b") as f:
+                fields = list(HEADER.unpack(f.read(HEADER.size)))
+                fields[8] = st.st_mtime_ns  # source_mtime
+                f.seek(0)
+                f.write(HEADER.pack(*fields))
+            logging.info(f"LED clip {clip_path} is still valid for {video_path}")
+            return False
+    compile_clip(video_path, sampler, clip_path)
+    return True
+
+
+class ClipCompiler:
+    """
+    Background job queue keeping the compiled clips of a video directory up
+    to date.
+
+    A watcher thread scans the video directory and queues new or changed
+    videos (by size and mtime, confirmed by content hash). The clips are
+    compiled by a process pool, so decoding never holds the GIL of the API
+    process. The cache directory is kept under max_bytes by evicting the
+    least recently played clips; an evicted clip is only compiled again when
+    its video is played.
+    """
+
+    def __init__(self, video_dir: str, cache_dir: str, sampler: VideoSampler, max_bytes: int,
+                 workers: int = 1, scan_interval: float = 10.0):
+        """
+        Args:
+            video_dir (str): Directory with the .mp4 videos.
+            cache_dir (str): Directory for the compiled clips.
+            sampler (VideoSampler): Maps the decoded frames onto the wall.
+            max_bytes (int): Size budget of the cache directory.
+            workers (int): Number of compiler processes.
+            scan_interval (float): Seconds between scans of the video directory.
+        """
+        self.video_dir = video_dir
+        self.cache_dir = cache_dir
+        self.sampler = sampler
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.scan_interval = scan_interval
+        self.on_compiled: Optional[Callable[[str], None]] = None
+
+        self._lock = RLock()
+        self._pending: "OrderedDict[str, None]" = OrderedDict()  # videos waiting for a worker
+        self._running: Dict[str, Future] = {}
+        # Videos not to queue again until they change: (size, mtime_ns) when failed or evicted
+        self._failed: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._evicted: Dict[str, Tuple[int, int]] = {}
+        self._last_opened: Optional[str] = None  # the clip playing, never evicted
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stop = Event()
+
+    def start(self, on_compiled: Callable[[str], None] = None) -> None:
+        """
+        Starts the worker processes and the directory watcher; with no
+        workers, nothing is compiled and videos are always decoded live.
+
+        Args:
+            on_compiled (Callable[[str], None]): Called with the video path
+                (from a background thread) whenever a clip is ready.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.on_compiled = on_compiled
+        if not self.workers:
+            return
+        self._executor = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"))
+        Thread(target=self._watch, name="clip-watch", daemon=True).start()
+
+    def close(self) -> None:
+        """
+        Stops the watcher and cancels the queued jobs.
+        """
+        self._stop.set()
+        with self._lock:
+            self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def clip_path(self, video_path: str) -> str:
+        return clip_path_for(video_path, self.cache_dir)
+
+    def open(self, video_path: str) -> Optional[LedClip]:
+        """
+        Opens the up-to-date clip of a video and marks it as recently used.
+        """
+        clip = open_clip(video_path, self.sampler, self.clip_path(video_path))
+        if clip is not None:
+            self._last_opened = clip.path
+            try:
+                os.utime(clip.path)
+            except OSError:
+                pass
+        return clip
+
+    def is_compiled(self, video_path: str) -> bool:
+        return open_clip(video_path, self.sampler, self.clip_path(video_path)) is not None
+
+    def request(self, video_path: str, urgent: bool = False) -> None:
+        """
+        Queues a video for compilation unless it is already queued or compiling.
+
+        Args:
+            urgent (bool): Put the video at the front of the queue, e.g. because
+                it is being played.
+        """
+        with self._lock:
+            if self._executor is None or self._stop.is_set() or video_path in self._running:
+                return
+            if urgent:
+                self._failed.pop(video_path, None)
+                self._evicted.pop(video_path, None)
+            self._pending[video_path] = None
+            if urgent:
+                self._pending.move_to_end(video_path, last=False)
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        with self._lock:
+            while self._pending and len(self._running) < self.workers:
+                video_path, _ = self._pending.popitem(last=False)
+                try:
+                    future = self._executor.submit(
+                        refresh_clip, video_path, self.sampler, self.clip_path(video_path))
+                except RuntimeError:
+                    return  # Shut down
+                self._running[video_path] = future
+                future.add_done_callback(lambda f, v=video_path: self._done(v, f))
+
+    def _done(self, video_path: str, future: Future) -> None:
+        with self._lock:
+            self._running.pop(video_path, None)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                logging.error(f"Failed to compile {video_path} into an LED clip => {error}")
+                self._failed[video_path] = (_stat_key(video_path), str(error))
+            else:
+                self._failed.pop(video_path, None)
+                self.evict(keep=self.clip_path(video_path))
+            self._dispatch()
+        if error is None and self.on_compiled is not None and not self._stop.is_set():
+            self.on_compiled(video_path)
+
+    def _videos(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.video_dir, "*.mp4")))
+
+    def _watch(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                logging.error(f"Scanning {self.video_dir} for LED clips failed => {e}")
+            self._stop.wait(self.scan_interval)
+
+    def scan(self) -> None:
+        """
+        Queues new and changed videos, removes the clips of deleted videos and
+        evicts clips above the size budget.
+        """
+        videos = self._videos()
+        for video_path in videos:
+            with self._lock:
+                if video_path in self._running or video_path in self._pending:
+                    continue
+                key = _stat_key(video_path)
+                if video_path in self._failed and self._failed[video_path][0] == key:
+                    continue
+                if self._evicted.get(video_path) == key:
+                    continue
+            if not self.is_compiled(video_path):
+                self.request(video_path)
+
+        stems = {os.path.splitext(os.path.basename(v))[0] for v in videos}
+        for clip_path in glob.glob(os.path.join(self.cache_dir, "*" + CLIP_EXTENSION)):
+            if os.path.splitext(os.path.basename(clip_path))[0] not in stems:
+                logging.info(f"Removing LED clip of deleted video: {clip_path}")
+                _remove(clip_path)
+        self.evict()
+
+    def _cached_clips(self) -> List[Tuple[float, int, str]]:
+        """Returns (last use, size, path) of every clip, least recently used first."""
+        clips = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*" + CLIP_EXTENSION)):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            clips.append((st.st_mtime, st.st_size, path))
+        return sorted(clips)
+
+    def evict(self, keep: str = None) -> None:
+        """
+        Removes the least recently used clips until the cache fits in max_bytes.
+        The last opened clip is never evicted.
+
+        Args:
+            keep (str): Another clip path not to evict, e.g. the one just compiled.
+        """
+        clips = self._cached_clips()
+        total = sum(size for _, size, _ in clips)
+        for _, size, path in clips:
+            if total <= self.max_bytes:
+                break
+            if path in (keep, self._last_opened):
+                continue
+            stem = os.path.splitext(os.path.basename(path))[0]
+            video_path = os.path.join(self.video_dir, stem + ".mp4")
+            logging.info(f"Evicting LED clip {path} to stay under {self.max_bytes} bytes")
+            if _remove(path):
+                total -= size
+                with self._lock:
+                    self._evicted[video_path] = _stat_key(video_path)
+
+    def status(self) -> Dict[str, object]:
+        """
+        Returns the compile state of every video and the cache usage.
+        """
+        videos = []
+        with self._lock:
+            for video_path in self._videos():
+                clip_path = self.clip_path(video_path)
+                entry = {"name": os.path.splitext(os.path.basename(video_path))[0]}
+                if video_path in self._running:
+                    entry["state"] = "compiling"
+                    entry["progress"] = compile_progress(clip_path) or 0.0
+                elif video_path in self._pending:
+                    entry["state"] = "queued"
+                elif self.is_compiled(video_path):
+                    entry["state"] = "compiled"
+                elif video_path in self._failed:
+                    entry["state"] = "failed"
+                    entry["error"] = self._failed[video_path][1]
+                elif video_path in self._evicted:
+                    entry["state"] = "evicted"
+                else:
+                    entry["state"] = "stale"
+                videos.append(entry)
+        clips = self._cached_clips()
+        return {
+            "videos": videos,
+            "cache": {
+                "dir": self.cache_dir,
+                "clips": len(clips),
+                "bytes": sum(size for _, size, _ in clips),
+                "max_bytes": self.max_bytes,
+            },
+            "workers": self.workers,
+        }
+
+
+def _stat_key(path: str) -> Tuple[int, int]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (-1, -1)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError as e:
+        logging.warning(f"Failed to remove {path} => {e}")
+        return False
+
+
+class ClipSource(FrameSource):
+    """
+    Loops a compiled clip on a PlaybackClock straight from the memory map,
+    without any decoding.
+    """
+
+    name = "video"
+
+    def __init__(self, clip: LedClip, max_fps: float = None, start_frame: int = 0, video_path: str = None):
+        """
+        Args:
+            clip (LedClip): The compiled clip.
+            max_fps (float): Maximum FPS to cap the playback.
+            start_frame (int): Frame to start at, e.g. to take over from a
+                VideoSource without jumping back to the start.
+            video_path (str): The video the clip was compiled from, to pick
+                it up again when the frame mapping changes.
+        """
+        self.clip = clip
+        self.max_fps = max_fps
+        self.start_frame = start_frame
+        self.video_path = video_path
+        self.fps = min(clip.fps, max_fps) if max_fps else clip.fps
+        self.clock: Optional[PlaybackClock] = None
+        logging.info(f"Playing compiled clip in a loop: {clip.path} at {self.fps:.2f} FPS")
+
+    async def next_frame(self) -> Optional[Frame]:
+        now = time.monotonic_ns()
+        if self.clock is None:
+            self.clock = PlaybackClock(self.fps)
+        self.clock.drop(self.clock.frames_behind(now))
+        frame = self.clip.frames[(self.start_frame + self.clock.position) % self.clip.frame_count]
+        self.clock.presented(now)
+        return frame
+
+    @property
+    def position(self) -> int:
+        """Frame of the clip to present next."""
+        return (self.start_frame + (self.clock.position if self.clock else 0)) % self.clip.frame_count
+
+    def next_deadline_ns(self) -> Optional[int]:
+        if self.clock is None:
+            return None
+        return self.clock.deadline_ns(self.clock.position)
+
+    def close(self) -> None:
+        logging.info("Video playback stopped or finished.")
+
+    def stats(self) -> Dict[str, object]:
+        stats = self.clock.stats() if self.clock else {}
+        return {**stats, "compiled": True, "frame_count": self.clip.frame_count}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compile videos into LED clips")
+    parser.add_argument(
+        "videos",
+        nargs="+",
+        help="Paths to the video files."
+    )
+    parser.add_argument(
+        "--config",
+        help="Installation config of the walls to compile for (default: LED_CONFIG or config.json)."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    for wall_id, config in load_walls(args.config).items():
+        cache_dir = clip_cache_dir(wall_id, config)
+        sampler = create_sampler(config.layout, config.settings)
+        os.makedirs(cache_dir, exist_ok=True)
+        for video in args.videos:
+            compile_clip(video, sampler, clip_path_for(video, cache_dir))
+
+
+if __name__ == "__main__":
+    main()
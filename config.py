@@ -0,0 +1,298 @@
+"""
+Installation config shared by the web API (main.py) and the piano.py and
+video.py scripts.
+
+Everything about an installation is described in one file, config.json next
+to this module by default or the file set with LED_CONFIG (JSON, or TOML for
+a .toml file):
+
+    {
+        "leds": 100,
+        "windows": 5,
+        "rows": 2,
+        "cols": 10,
+        "controllers": [
+            {"ip": "192.168.107.123", "origin": [0, 5], "direction": "right"},
+            ...
+        ],
+        "settings": {"transport": "batch"}
+    }
+
+"leds" and "windows" are the defaults for the controllers, "rows" and "cols"
+the window grid of the wall. Every controller needs its "ip" and takes the
+placement and protocol keys described in layout.py. The optional "settings"
+override the defaults in SETTINGS, and every setting can in turn be
+overridden with a LED_<NAME> environment variable, e.g. LED_TRANSPORT=batch.
+
+One process can drive several walls, each with its own controllers, layout
+and settings, under a top-level "walls" object keyed by wall id:
+
+    {
+        "leds": 100,
+        "windows": 5,
+        "settings": {"transport": "batch"},
+        "walls": {
+            "shop": {"rows": 2, "cols": 10, "controllers": [...]},
+            "window": {"rows": 1, "cols": 5, "controllers": [...], "settings": {"sync": false}}
+        }
+    }
+
+The config is validated when it is loaded, and everything the send path needs
+(the layout, packet layout and transport) is created from it once. The web API
+reloads it when the file changes (see the "config_watch" setting) or on
+POST /config/reload, without restarting the render loop.
+"""
+from typing import Dict, List, Optional
+import ipaddress
+import json
+import logging
+import os
+import re
+import tomllib
+
+import numpy as np
+
+from frames import PacketLayout
+from layout import Layout, parse_layout
+from transport import BACKENDS, Transport, create_transport
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+# Id of the wall of a config file without "walls", and the routes without a wall id
+DEFAULT_WALL = "default"
+WALL_ID = re.compile(r"[A-Za-z0-9_-]+")
+
+# Settings and their defaults, each overridable with LED_<NAME>; the type of the default is the type of the setting
+SETTINGS: Dict[str, object] = {
+    "transport": "asyncio",       # UDP transport backend, see transport.BACKENDS
+    "keepalive": 1.0,             # resend interval of unchanged packets in seconds, 0 = send every packet
+    "sync": True,                 # send every frame as one burst, sync packets last
+    "render_fps": 30.0,           # tick rate of sources without their own
+    "precise_sleep": False,       # spin for the last 2ms before every deadline
+    "video_resolution": "window",  # "window" (one color per window) or "led"
+    "video_row_stride": 1,        # average every Nth row when downsampling video frames
+    "video_lookahead": 8,         # frames decoded ahead of playback
+    "clip_cache": "",             # compiled clip directory, "" for videos/.ledclips
+    "clip_cache_mb": 1024.0,      # clip cache budget
+    "clip_workers": 1,            # clip compiler processes, 0 = always decode videos live
+    "config_watch": 2.0,          # seconds between checks of the config file for changes, 0 = never
+    "worker_process": False,      # run the wall in its own process, see worker.py
+}
+
+# Settings only read on startup; a reload keeps their running values
+RESTART_SETTINGS = ("clip_cache", "clip_cache_mb", "clip_workers", "worker_process")
+
+VIDEO_RESOLUTIONS = ("window", "led")
+
+
+def _parse_setting(name: str, value: object) -> object:
+    """Converts a setting from the config file or the environment to the type of its default."""
+    default = SETTINGS[name]
+    if isinstance(default, bool):
+        if isinstance(value, str):
+            if value.lower() not in ("1", "0", "true", "false", "yes", "no", "on", "off"):
+                raise ValueError(f"Setting {name} must be a boolean, got {value!r}")
+            return value.lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    try:
+        return type(default)(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Setting {name} must be a {type(default).__name__}, got {value!r}") from None
+
+
+class Config:
+    """
+    A loaded and validated installation config.
+
+    Attributes:
+        path (str): The file the config was loaded from.
+        wall_id (str): The wall the config describes.
+        ips (List[str]): IP address of every controller, in frame order.
+        leds (int): Default LEDs per controller.
+        windows (int): Default windows per controller.
+        layout (Layout): Placement and protocol of every controller on the wall.
+        settings (Dict[str, object]): Every setting of SETTINGS, with the
+            config file and environment overrides applied.
+        controller_offsets (np.ndarray): Frame index of the first LED of every controller.
+        window_offsets (np.ndarray): Number of the first window of every controller,
+            windows being numbered across the controllers in frame order.
+        led_windows (np.ndarray): (num_leds,) window number of every LED.
+    """
+
+    def __init__(self, data: Dict, path: str = "", environ: Optional[Dict[str, str]] = None,
+                 wall_id: str = DEFAULT_WALL):
+        """
+        Args:
+            data (Dict): The parsed config of the wall.
+            path (str): The file it was read from, for error messages.
+            environ (Optional[Dict[str, str]]): Environment with the LED_<NAME>
+                overrides, os.environ by default.
+            wall_id (str): The wall it describes, see parse_walls().
+        """
+        self.path = path
+        self.wall_id = wall_id
+        try:
+            self._load(data, os.environ if environ is None else environ)
+        except (KeyError, TypeError, ValueError) as e:
+            detail = f"missing key {e}" if isinstance(e, KeyError) else str(e)
+            wall = "" if wall_id == DEFAULT_WALL else f" (wall {wall_id})"
+            raise ValueError(f"Invalid config {path or '<dict>'}{wall}: {detail}") from None
+
+    def _load(self, data: Dict, environ: Dict[str, str]) -> None:
+        controllers = data["controllers"]
+        if not controllers:
+            raise ValueError("no controllers")
+        self.ips: List[str] = []
+        for idx, controller in enumerate(controllers):
+            ip = controller["ip"]
+            try:
+                ipaddress.IPv4Address(ip)
+            except ValueError:
+                raise ValueError(f"controller {idx}: invalid IP address {ip!r}") from None
+            if ip in self.ips:
+                raise ValueError(f"controller {idx}: {ip} is listed twice")
+            self.ips.append(ip)
+
+        self.leds = int(data.get("leds", 100))
+        self.windows = int(data.get("windows", 5))
+        self.layout: Layout = parse_layout(data, self.leds, self.windows)
+
+        unknown = set(data.get("settings", {})) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown settings {sorted(unknown)}, expected some of {list(SETTINGS)}")
+        self.settings: Dict[str, object] = {}
+        for name in SETTINGS:
+            value = data.get("settings", {}).get(name, SETTINGS[name])
+            self.settings[name] = _parse_setting(name, environ.get(f"LED_{name.upper()}", value))
+        if self.settings["transport"] not in BACKENDS:
+            raise ValueError(f"unknown transport {self.settings['transport']!r}, expected one of {list(BACKENDS)}")
+        if self.settings["video_resolution"] not in VIDEO_RESOLUTIONS:
+            raise ValueError(f"unknown video_resolution {self.settings['video_resolution']!r}, "
+                             f"expected one of {list(VIDEO_RESOLUTIONS)}")
+        for name in ("render_fps", "video_row_stride", "video_lookahead"):
+            if self.settings[name] <= 0:
+                raise ValueError(f"{name} must be positive")
+        for name in ("keepalive", "clip_cache_mb", "clip_workers", "config_watch"):
+            if self.settings[name] < 0:
+                raise ValueError(f"{name} cannot be negative")
+
+        leds = np.array(self.leds_per_controller)
+        windows = np.array(self.windows_per_controller)
+        self.controller_offsets = np.concatenate(([0], np.cumsum(leds)[:-1])).astype(np.intp)
+        self.window_offsets = np.concatenate(([0], np.cumsum(windows)[:-1])).astype(np.intp)
+        self.led_windows = np.concatenate([
+            offset + np.arange(count) // (count // num_windows)
+            for offset, count, num_windows in zip(self.window_offsets, leds, windows)]).astype(np.intp)
+
+    @property
+    def num_leds(self) -> int:
+        return self.layout.num_leds
+
+    @property
+    def num_windows(self) -> int:
+        return sum(self.windows_per_controller)
+
+    @property
+    def leds_per_controller(self) -> List[int]:
+        return self.layout.leds_per_controller
+
+    @property
+    def windows_per_controller(self) -> List[int]:
+        return [c.windows for c in self.layout.controllers]
+
+    def window_leds(self, controller_idx: int, window_idx: int) -> slice:
+        """
+        Returns the frame slice of the LEDs of a controller's window.
+        """
+        controller = self.layout.controllers[controller_idx]
+        start = self.controller_offsets[controller_idx] + window_idx * controller.leds_per_window
+        return slice(int(start), int(start) + controller.leds_per_window)
+
+    def create_packet_layout(self) -> PacketLayout:
+        """
+        Precomputes the packets of every controller in its protocol.
+        """
+        layout = self.layout
+        return PacketLayout(layout.leds_per_controller, layout.reverse, layout.protocols, layout.ports,
+                            universes=layout.universes, sync=self.settings["sync"])
+
+    def create_transport(self, packet_layout: PacketLayout, backend: Optional[str] = None) -> Transport:
+        """
+        Creates the transport sending the packets of packet_layout to the controllers.
+
+        Args:
+            packet_layout (PacketLayout): The packet layout, see create_packet_layout().
+            backend (Optional[str]): Transport backend, the "transport" setting by default.
+        """
+        return create_transport([self.ips[idx] for idx in packet_layout.destinations], packet_layout.ports,
+                                backend or self.settings["transport"], self.settings["keepalive"] or None,
+                                packet_layout.destinations, packet_layout.sequences, self.settings["sync"])
+
+
+def parse_walls(data: Dict, path: str = "", environ: Optional[Dict[str, str]] = None) -> Dict[str, Config]:
+    """
+    Splits a parsed config file into the configs of its walls, by wall id.
+
+    A file without "walls" describes a single wall, DEFAULT_WALL. Otherwise
+    "walls" maps every wall id to the keys of a single-wall config; keys
+    at the top level (and its "settings") are the defaults of every wall.
+    """
+    if "walls" not in data:
+        return {DEFAULT_WALL: Config(data, path, environ)}
+    if not data["walls"]:
+        raise ValueError(f"Invalid config {path}: no walls")
+    shared = {key: value for key, value in data.items() if key != "walls"}
+    walls: Dict[str, Config] = {}
+    owners: Dict[str, str] = {}
+    for wall_id, wall in data["walls"].items():
+        if not WALL_ID.fullmatch(wall_id):
+            raise ValueError(f"Invalid config {path}: wall id {wall_id!r} must be letters, digits, - and _")
+        settings = {**shared.get("settings", {}), **wall.get("settings", {})}
+        config = Config({**shared, **wall, "settings": settings}, path, environ, wall_id)
+        for ip in config.ips:
+            if ip in owners:
+                raise ValueError(f"Invalid config {path}: {ip} is on walls {owners[ip]} and {wall_id}")
+            owners[ip] = wall_id
+        walls[wall_id] = config
+    spinning = [wall_id for wall_id, config in walls.items()
+                if config.settings["precise_sleep"] and not config.settings["worker_process"]]
+    in_process = [wall_id for wall_id, config in walls.items() if not config.settings["worker_process"]]
+    if spinning and len(in_process) > 1:
+        # The spinning threads of several walls take turns on the GIL of one process
+        logging.warning(f"Config {path}: precise_sleep on wall {', '.join(spinning)} shares a process with "
+                        f"walls {', '.join(in_process)}, whose spins contend for the GIL; "
+                        f"set worker_process for precise pacing")
+    return walls
+
+
+def load_walls(path: Optional[str] = None) -> Dict[str, Config]:
+    """
+    Loads and validates the configs of all walls of an installation.
+
+    Args:
+        path (Optional[str]): JSON or TOML file, LED_CONFIG or config.json by default.
+    """
+    path = path or os.environ.get("LED_CONFIG", DEFAULT_PATH)
+    if path.endswith(".toml"):
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    return parse_walls(data, path)
+
+
+def load_config(path: Optional[str] = None, wall_id: Optional[str] = None) -> Config:
+    """
+    Loads and validates the config of one wall.
+
+    Args:
+        path (Optional[str]): JSON or TOML file, LED_CONFIG or config.json by default.
+        wall_id (Optional[str]): The wall, the first one by default.
+    """
+    walls = load_walls(path)
+    if wall_id is None:
+        return next(iter(walls.values()))
+    if wall_id not in walls:
+        raise ValueError(f"Unknown wall {wall_id!r}, expected one of {list(walls)}")
+    return walls[wall_id]
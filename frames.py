@@ -0,0 +1,360 @@
+"""
+LED frame buffers.
+
+A frame is a C-contiguous NumPy array of shape (num_leds, 3) and dtype uint8,
+one (R, G, B) row per LED, so packet bytes can be taken straight from memory.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import struct
+
+import cv2 as cv
+import numpy as np
+
+from protocols import DEFAULT_TIMEOUT, Encoder, create_encoder
+
+# (num_leds, 3) uint8 array, one (R, G, B) row per LED
+Frame = np.ndarray
+
+BLACK = (0, 0, 0)
+
+
+def new_frame(num_leds: int, color: Tuple[int, int, int] = BLACK) -> Frame:
+    """
+    Creates a frame with every LED set to the same color.
+
+    Args:
+        num_leds (int): Number of LEDs in the frame.
+        color (Tuple[int, int, int]): RGB color tuple (0-255).
+    """
+    frame = np.empty((num_leds, 3), dtype=np.uint8)
+    frame[:] = color
+    return frame
+
+
+def as_frame(colors: Sequence, num_leds: int) -> Frame:
+    """
+    Converts colors (a frame, array or list of RGB tuples) into a frame of
+    exactly num_leds LEDs, padding with black or truncating as needed.
+
+    Args:
+        colors (Sequence): (R, G, B) values for the LEDs.
+        num_leds (int): Number of LEDs in the resulting frame.
+    """
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+    if len(colors) == num_leds:
+        return np.ascontiguousarray(colors)
+    frame = new_frame(num_leds)
+    count = min(len(colors), num_leds)
+    frame[:count] = colors[:count]
+    return frame
+
+
+# A binary frame message (see parse_frame_message) may start with this header:
+# magic, sequence number, timestamp in microseconds and the length of the wall id following it
+FRAME_MAGIC = b"LEDF"
+FRAME_HEADER = struct.Struct("<4sIQB")
+
+
+def parse_frame_message(data: bytes) -> Tuple[Optional[str], Optional[int], Optional[int], memoryview]:
+    """
+    Splits a binary frame message into its header fields and RGB bytes.
+
+    A message starting with FRAME_MAGIC has a FRAME_HEADER and the wall id,
+    followed by the RGB bytes of the frame; any other message is a bare
+    frame: 3 bytes (R, G, B) per LED in frame order. The number of RGB bytes
+    is left to the caller to check against the wall the frame is for. (A
+    bare frame that happens to start with the bytes of FRAME_MAGIC must be
+    sent with a header.)
+
+    Args:
+        data (bytes): The message.
+
+    Returns:
+        Tuple[Optional[str], Optional[int], Optional[int], memoryview]: The
+            wall id (None for the wall of the connection, also when the
+            header has an empty one), sequence number, timestamp and the RGB
+            bytes, without copying them.
+
+    Raises:
+        ValueError: if the header is truncated.
+    """
+    view = memoryview(data)
+    if view[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+        return None, None, None, view
+    if len(view) < FRAME_HEADER.size:
+        raise ValueError("Frame header truncated")
+    _, sequence, timestamp, id_length = FRAME_HEADER.unpack_from(view)
+    start = FRAME_HEADER.size + id_length
+    if len(view) < start:
+        raise ValueError("Frame header truncated")
+    wall_id = bytes(view[FRAME_HEADER.size:start]).decode(errors="replace") or None
+    return wall_id, sequence, timestamp, view[start:]
+
+
+HEX_DIGITS = b"0123456789abcdefABCDEF"
+
+
+def decode_hex_colors(digits: bytes) -> Frame:
+    """
+    Decodes concatenated 6-digit hex colors ("rrggbbrrggbb...") into a frame.
+
+    Raises:
+        ValueError: if any byte is not a hex digit.
+    """
+    if len(digits) % 6 or digits.translate(None, HEX_DIGITS):
+        raise ValueError("Colors must be 6-digit hex strings")
+    return np.frombuffer(bytearray.fromhex(digits.decode("ascii")), dtype=np.uint8).reshape(-1, 3)
+
+
+def parse_hex_frame(data: bytes, separator: bytes = b", ") -> Frame:
+    """
+    Parses the colors of the legacy update command, 6 hex digits each joined
+    by separator ("ff8040, 00ff00, ..."), in a single pass over the payload.
+
+    Raises:
+        ValueError: if the payload is not exactly in this format; the legacy
+            parser also accepts some variations, such as longer colors.
+    """
+    record = 6 + len(separator)
+    count = (len(data) + len(separator)) // record
+    if not data or (len(data) + len(separator)) % record or any(
+            data[6 + i::record] != separator[i:i + 1] * (count - 1) for i in range(len(separator))):
+        raise ValueError("Colors are not 6-digit hex strings joined by the separator")
+    return decode_hex_colors(data.replace(separator, b""))
+
+
+def parse_hex_differences(data: bytes, separator: bytes = b", ") -> Tuple[np.ndarray, Frame]:
+    """
+    Parses the (index, color) pairs of the legacy difference command,
+    "(23, ff8040), (45, 00ff00)" or "23, ff8040, 45, 00ff00", into an
+    array of LED indices and a frame of their colors.
+
+    Raises:
+        ValueError: if a pair is not a decimal index and a 6-digit hex
+            color; the legacy parser then reports the pairs one by one.
+    """
+    tokens = [token.strip(b"()") for token in data.split(separator)]
+    if len(tokens) % 2:
+        raise ValueError("Odd number of items")
+    indices, colors = tokens[0::2], tokens[1::2]
+    if not b"".join(indices).isdigit() or not all(indices) or max(map(len, indices)) > 18:
+        raise ValueError("Indices must be decimal numbers")
+    if max(map(len, colors)) != 6 or min(map(len, colors)) != 6:
+        raise ValueError("Colors must be 6-digit hex strings")
+    return np.array(indices).astype(np.intp), decode_hex_colors(b"".join(colors))
+
+
+def downsample(image: np.ndarray, rows: int, cols: int, row_stride: int = 1) -> np.ndarray:
+    """
+    Area-averages a decoded OpenCV image (gray, BGR or BGRA) down to a
+    (rows, cols, 3) RGB image.
+
+    The averaging runs in the decoder's native color space and only the
+    rows x cols result is color converted, instead of converting every
+    source pixel first. Blocks are summed with NumPy, which is faster than
+    cv.resize(INTER_AREA) for scale factors that are not whole numbers.
+
+    Args:
+        image (np.ndarray): Decoded frame, (h, w), (h, w, 3) or (h, w, 4) uint8.
+        rows (int): Number of rows of the result.
+        cols (int): Number of columns of the result.
+        row_stride (int): If > 1, average every row_stride-th row only.
+            Several times faster, but thin horizontal detail may be missed.
+    """
+    height, width = image.shape[:2]
+    if height >= rows and width >= cols:
+        small = _block_mean(image, rows, cols, row_stride)
+    else:
+        small = cv.resize(image, (cols, rows), interpolation=cv.INTER_AREA)
+
+    if small.ndim == 2:
+        return cv.cvtColor(small, cv.COLOR_GRAY2RGB)
+    if small.shape[2] == 4:
+        return cv.cvtColor(small, cv.COLOR_BGRA2RGB)
+    if small.shape[2] == 3:
+        return cv.cvtColor(small, cv.COLOR_BGR2RGB)
+    raise ValueError(f"Unexpected number of channels: {small.shape[2]}")
+
+
+def _block_mean(image: np.ndarray, rows: int, cols: int, row_stride: int) -> np.ndarray:
+    """
+    Mean of every grid block over every row_stride-th row, in the image's own
+    channels. Block edges are rounded to whole pixels.
+    """
+    pixels = image if image.ndim == 3 else image[..., None]
+    row_edges = np.linspace(0, pixels.shape[0], rows + 1).astype(np.intp)
+    col_edges = np.linspace(0, pixels.shape[1], cols + 1).astype(np.intp)
+    blocks = list(zip(row_edges[:-1], row_edges[1:]))
+    # Sum down the rows of every block row first, so the bulk of the work runs over contiguous memory
+    row_sums = np.stack([pixels[top:bottom:row_stride].sum(axis=0, dtype=np.uint32)
+                         for top, bottom in blocks])
+    sums = np.add.reduceat(row_sums, col_edges[:-1], axis=1, dtype=np.uint64)
+    row_counts = np.array([len(range(top, bottom, row_stride)) for top, bottom in blocks])
+    counts = row_counts[:, None, None] * np.diff(col_edges)[None, :, None]
+    mean = (sums // counts).astype(np.uint8)
+    return mean if image.ndim == 3 else mean[..., 0]
+
+
+class PacketLayout:
+    """
+    Precomputed mapping from a frame to the packets of every controller.
+
+    Every controller's packets are encoded in its protocol (see protocols.py),
+    with its LEDs reversed as WLED expects them. The packets of all controllers
+    with the same LED size share one preallocated buffer of one LED per row,
+    with the headers (and trailers) padded to whole rows, so building all
+    packets is a single NumPy gather per buffer followed by restoring the
+    constant rows, and the packets are memoryview slices of the buffers.
+
+    With sync, the sync packets of all controllers (E1.31 and Art-Net sync,
+    DDP push) come after the data packets of all controllers, so a burst of
+    tiny packets at the end of the frame makes every controller output it.
+
+    Attributes:
+        packets (List[memoryview]): Every packet of a frame, in controller order;
+            a controller's sync packet, if any, comes after its other packets,
+            or after those of all controllers with sync.
+        destinations (List[int]): Index of the controller of every packet.
+        ports (List[int]): UDP port of every packet.
+        sequences (List[Optional[int]]): Byte of the sequence number of every
+            packet, to be stamped by the transport, or None.
+        controller_packets (List[List[int]]): Index of every packet of each
+            controller, in send order.
+    """
+
+    def __init__(self, leds_per_controller: List[int], reverse: Union[bool, List[bool]] = True,
+                 protocols: Optional[List[str]] = None, ports: Optional[List[Optional[int]]] = None,
+                 timeout: int = DEFAULT_TIMEOUT, universes: Optional[List[Optional[int]]] = None,
+                 sync: bool = False):
+        """
+        Args:
+            leds_per_controller (List[int]): LED count of each controller, in frame order.
+            reverse (Union[bool, List[bool]]): If True, send each controller's
+                LEDs in reverse order; a list sets it per controller.
+            protocols (Optional[List[str]]): Protocol of each controller (see
+                protocols.PROTOCOLS), headerless "raw" RGB by default.
+            ports (Optional[List[Optional[int]]]): UDP port of each controller,
+                None for the default port of its protocol.
+            timeout (int): Realtime timeout sent to the controllers, in seconds.
+            universes (Optional[List[Optional[int]]]): First universe of each
+                DMX controller, None for the protocol's default.
+            sync (bool): Send the sync packets after the data of all controllers.
+        """
+        offsets = np.concatenate(([0], np.cumsum(leds_per_controller))).astype(np.intp)
+        ranges = [np.arange(start, end) for start, end in zip(offsets[:-1], offsets[1:])]
+        if isinstance(reverse, bool):
+            reverse = [reverse] * len(ranges)
+        ranges = [r[::-1] if rev else r for r, rev in zip(ranges, reverse)]
+        self.num_leds = int(offsets[-1])
+        self.index = np.concatenate(ranges).astype(np.intp)
+        protocols = protocols or ["raw"] * len(ranges)
+        universes = universes or [None] * len(ranges)
+        self.encoders = [create_encoder(protocol, timeout, universe, sync)
+                         for protocol, universe in zip(protocols, universes)]
+        ports = ports or [None] * len(ranges)
+
+        # Every packet as (encoder, LED indices, start, header, trailer), grouped by LED size
+        groups: Dict[Tuple[int, int], List[int]] = {}
+        chunks: List[Tuple[Encoder, np.ndarray, int, bytes, bytes]] = []
+        self.destinations: List[int] = []
+        self.ports: List[int] = []
+        self.sequences: List[Optional[int]] = []
+        syncs: List[int] = []
+        for idx, (encoder, r, port) in enumerate(zip(self.encoders, ranges, ports)):
+            packet_chunks = encoder.chunks(len(r))
+            group = groups.setdefault((encoder.channels, encoder.color_offset), [])
+            for n, (start, count) in enumerate(packet_chunks):
+                group.append(len(chunks))
+                chunks.append((encoder, r[start:start + count], start,
+                               encoder.header(start, count, last=n == len(packet_chunks) - 1),
+                               encoder.trailer(count)))
+                self.sequences.append(encoder.sequence_offset)
+            sync_packet = encoder.sync_packet()
+            if sync_packet is not None:
+                syncs.append(len(chunks))
+                group.append(len(chunks))
+                chunks.append((encoder, r[:0], 0, sync_packet, b""))
+                self.sequences.append(encoder.sync_sequence_offset)
+            self.destinations += [idx] * (len(chunks) - len(self.destinations))
+            self.ports += [port or encoder.port] * (len(chunks) - len(self.ports))
+
+        self.packets: List[memoryview] = [memoryview(b"")] * len(chunks)
+        # The colors of every packet in its buffer and the frame indices they come from
+        self._payloads: List[Tuple[np.ndarray, np.ndarray]] = [(np.zeros((0, 3), dtype=np.uint8), np.zeros(0, dtype=np.intp))] * len(chunks)
+        self._gathers: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+        for (channels, color_offset), members in groups.items():
+            # Headers are right-aligned and trailers left-aligned in whole rows,
+            # so every payload starts on a row
+            rows = [(-(-len(chunks[i][3]) // channels), len(chunks[i][1]), -(-len(chunks[i][4]) // channels))
+                    for i in members]
+            buffer = np.zeros((sum(map(sum, rows)), channels), dtype=np.uint8)
+            view = memoryview(buffer.reshape(-1))
+            index = np.zeros(len(buffer), dtype=np.intp)
+            colors = buffer[:, color_offset:color_offset + 3]
+            constant_rows, constant_values = [], []
+            row = 0
+            for i, (head_rows, count, tail_rows) in zip(members, rows):
+                encoder, leds, start, head, tail = chunks[i]
+                pad = head_rows * channels - len(head)
+                payload = slice(row + head_rows, row + head_rows + count)
+                constant_rows += [np.arange(row, payload.start), np.arange(payload.stop, payload.stop + tail_rows)]
+                constant_values += [np.frombuffer(bytes(pad) + head, dtype=np.uint8),
+                                    np.frombuffer(tail + bytes(tail_rows * channels - len(tail)), dtype=np.uint8)]
+                index[payload] = leds
+                encoder.fill(buffer[payload], start)
+                self.packets[i] = view[row * channels + pad:payload.stop * channels + len(tail)]
+                self._payloads[i] = (colors[payload], leds)
+                row = payload.stop + tail_rows
+            constant_rows = np.concatenate(constant_rows).astype(np.intp)
+            constant_values = np.concatenate(constant_values).reshape(-1, channels)
+            buffer[constant_rows] = constant_values  # For build_controller() before the first build()
+            self._gathers.append((buffer, index, colors, constant_rows, constant_values))
+
+        if sync and syncs:
+            last = set(syncs)
+            order = [i for i in range(len(chunks)) if i not in last] + syncs
+            self.packets = [self.packets[i] for i in order]
+            self.destinations = [self.destinations[i] for i in order]
+            self.ports = [self.ports[i] for i in order]
+            self.sequences = [self.sequences[i] for i in order]
+            self._payloads = [self._payloads[i] for i in order]
+        self.controller_packets: List[List[int]] = [[] for _ in ranges]
+        for idx, controller in enumerate(self.destinations):
+            self.controller_packets[controller].append(idx)
+
+    def build(self, frame: Frame) -> List[memoryview]:
+        """
+        Encodes the frame into the packet buffers.
+
+        The returned memoryviews are overwritten by the next call, so they
+        must be sent before building the next frame.
+
+        Args:
+            frame (Frame): (num_leds, 3) uint8 frame.
+
+        Returns:
+            List[memoryview]: Every packet, in controller order (see destinations).
+        """
+        for buffer, index, colors, constant_rows, constant_values in self._gathers:
+            np.take(frame, index, axis=0, out=colors, mode="clip")
+            if len(constant_rows):
+                buffer[constant_rows] = constant_values
+        return self.packets
+
+    def build_controller(self, frame: Frame, controller_idx: int) -> List[int]:
+        """
+        Encodes only the LEDs of one controller into its packets, for a frame
+        that differs from the last one built only on that controller.
+
+        Args:
+            frame (Frame): (num_leds, 3) uint8 frame.
+            controller_idx (int): Index of the controller.
+
+        Returns:
+            List[int]: Index of every packet of the controller in packets.
+        """
+        indices = self.controller_packets[controller_idx]
+        for idx in indices:
+            colors, leds = self._payloads[idx]
+            frame.take(leds, axis=0, out=colors, mode="clip")
+        return indices
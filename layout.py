@@ -0,0 +1,358 @@
+"""
+Physical layout of the LED wall.
+
+The wall is a grid of windows. Every controller drives a run of windows,
+starting at its origin cell and continuing in its direction, optionally
+wrapping onto the next line (serpentine or not). From that description the
+layout precomputes, for every LED in frame order, where it sits on the wall,
+so mapping an image onto the wall is a single NumPy gather.
+
+A layout is described by the "rows", "cols" and "controllers" of the
+installation config (see config.py), or loaded from a JSON file of its own:
+
+    {
+        "rows": 2,
+        "cols": 10,
+        "controllers": [
+            {"name": "Top Right", "origin": [0, 5], "direction": "right"},
+            ...
+        ]
+    }
+
+Controllers are listed in frame (IP) order. Besides the origin, each one
+may set "leds" and "windows" (defaults from the wall config), "direction"
+("right", "left", "down" or "up", default "right"), "wrap" (windows per line,
+default all), "serpentine" (reverse the direction on every other line),
+"arrangement" of the LEDs within a window (default "strip", see
+ARRANGEMENTS), "reverse" (send its LEDs last-to-first, as WLED expects;
+default true), "protocol" (see protocols.PROTOCOLS, default "raw"), "port"
+(default the protocol's port) and, for the E1.31 and Art-Net protocols of DMX
+bridges, "universe" (the first universe).
+"""
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import math
+
+import cv2 as cv
+import numpy as np
+
+from frames import Frame, downsample
+from protocols import PROTOCOLS
+
+DIRECTIONS = {
+    "right": (0, 1),
+    "left": (0, -1),
+    "down": (1, 0),
+    "up": (-1, 0),
+}
+
+# How the LEDs of a window are placed inside it:
+#   strip      in a line through the middle, following the run direction
+#   perimeter  clockwise around the window, from the top left corner
+#   center     all in the middle (one color per window whatever the resolution)
+ARRANGEMENTS = ("strip", "perimeter", "center")
+
+
+class ControllerLayout:
+    """
+    Placement of one controller's windows on the wall grid.
+    """
+
+    def __init__(self, origin: Tuple[int, int], leds: int, windows: int, direction: str = "right",
+                 wrap: Optional[int] = None, serpentine: bool = False, arrangement: str = "strip",
+                 reverse: bool = True, protocol: str = "raw", port: Optional[int] = None,
+                 universe: Optional[int] = None, name: str = ""):
+        """
+        Args:
+            origin (Tuple[int, int]): (row, col) of the controller's first window.
+            leds (int): Number of LEDs on the controller.
+            windows (int): Number of windows the LEDs are split over.
+            direction (str): Direction of the following windows.
+            wrap (int): Windows per line before continuing on the next line.
+            serpentine (bool): Reverse the direction on every other line.
+            arrangement (str): Placement of the LEDs within a window.
+            reverse (bool): Send the LEDs last-to-first.
+            protocol (str): WLED realtime protocol of the controller.
+            port (Optional[int]): UDP port, None for the protocol's default port.
+            universe (Optional[int]): First DMX universe, None for the protocol's default.
+            name (str): Label for logs and errors.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction {direction!r}, expected one of {list(DIRECTIONS)}")
+        if arrangement not in ARRANGEMENTS:
+            raise ValueError(f"Unknown arrangement {arrangement!r}, expected one of {list(ARRANGEMENTS)}")
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol {protocol!r}, expected one of {list(PROTOCOLS)}")
+        if windows <= 0 or leds % windows:
+            raise ValueError(f"{leds} LEDs cannot be split over {windows} windows")
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.leds = leds
+        self.windows = windows
+        self.direction = direction
+        self.wrap = wrap or windows
+        self.serpentine = serpentine
+        self.arrangement = arrangement
+        self.reverse = reverse
+        self.protocol = protocol
+        self.port = port
+        self.universe = universe
+        self.name = name
+
+    @property
+    def leds_per_window(self) -> int:
+        return self.leds // self.windows
+
+    def window_cells(self) -> List[Tuple[int, int]]:
+        """
+        Returns the (row, col) of every window, in LED order.
+        """
+        step = DIRECTIONS[self.direction]
+        # The next line is below a horizontal run and right of a vertical one
+        line_step = (1, 0) if step[0] == 0 else (0, 1)
+        cells = []
+        for i in range(self.windows):
+            line, offset = divmod(i, self.wrap)
+            if self.serpentine and line % 2:
+                offset = self.wrap - 1 - offset
+            cells.append((self.origin[0] + line * line_step[0] + offset * step[0],
+                          self.origin[1] + line * line_step[1] + offset * step[1]))
+        return cells
+
+    def sub_grid(self) -> Tuple[int, int]:
+        """
+        Returns the (rows, cols) of the grid within a window the LEDs sit on.
+        """
+        n = self.leds_per_window
+        if self.arrangement == "strip":
+            return (1, n) if DIRECTIONS[self.direction][0] == 0 else (n, 1)
+        if self.arrangement == "perimeter":
+            side = -(-n // 4) + 1
+            return (side, side)
+        return (1, 1)
+
+    def _window_leds(self, backwards: bool) -> List[Tuple[int, int]]:
+        """Returns the sub-grid cell of every LED of a window, in LED order."""
+        n = self.leds_per_window
+        sub_rows, sub_cols = self.sub_grid()
+        if self.arrangement == "strip":
+            order = range(n - 1, -1, -1) if backwards else range(n)
+            return [(0, i) if sub_rows == 1 else (i, 0) for i in order]
+        if self.arrangement == "perimeter":
+            side = sub_rows
+            ring = ([(0, c) for c in range(side)] + [(r, side - 1) for r in range(1, side)] +
+                    [(side - 1, c) for c in range(side - 2, -1, -1)] + [(r, 0) for r in range(side - 2, 0, -1)])
+            return [ring[i * len(ring) // n] for i in range(n)]
+        return [(0, 0)] * n
+
+    def led_positions(self) -> np.ndarray:
+        """
+        Returns the (y, x) wall position of every LED in window units, in LED order.
+        """
+        sub_rows, sub_cols = self.sub_grid()
+        positions = []
+        for i, (row, col) in enumerate(self.window_cells()):
+            backwards = self.direction in ("left", "up")
+            if self.serpentine and (i // self.wrap) % 2:
+                backwards = not backwards
+            positions += [(row + (y + 0.5) / sub_rows, col + (x + 0.5) / sub_cols)
+                          for y, x in self._window_leds(backwards)]
+        return np.array(positions, dtype=np.float64)
+
+
+class Layout:
+    """
+    The wall: a rows x cols window grid and the controllers placed on it.
+
+    Attributes:
+        led_cells (np.ndarray): (num_leds,) flat grid cell of every LED, in frame order.
+        led_positions (np.ndarray): (num_leds, 2) (y, x) of every LED in window
+            units, (0, 0) being the top left corner of the wall.
+        sample_shape (Tuple[int, int]): (height, width) of the smallest image
+            of the wall with a pixel of its own under every LED.
+    """
+
+    def __init__(self, rows: int, cols: int, controllers: List[ControllerLayout]):
+        self.rows = rows
+        self.cols = cols
+        self.controllers = controllers
+
+        seen: Dict[Tuple[int, int], str] = {}
+        for idx, controller in enumerate(controllers):
+            label = controller.name or f"controller {idx}"
+            for row, col in controller.window_cells():
+                if not (0 <= row < rows and 0 <= col < cols):
+                    raise ValueError(f"{label}: window ({row}, {col}) is outside the {rows}x{cols} grid")
+                if (row, col) in seen:
+                    raise ValueError(f"{label}: window ({row}, {col}) is already used by {seen[(row, col)]}")
+                seen[(row, col)] = label
+        self.led_positions = np.concatenate([c.led_positions() for c in controllers])
+        self.num_leds = len(self.led_positions)
+        cells = self.led_positions.astype(np.intp)
+        self.led_cells = cells[:, 0] * cols + cells[:, 1]
+        sub_grids = [c.sub_grid() for c in controllers]
+        self.sample_shape = (rows * math.lcm(*(g[0] for g in sub_grids)),
+                             cols * math.lcm(*(g[1] for g in sub_grids)))
+        self._sampling: Dict[Tuple[int, int], np.ndarray] = {}
+
+    @property
+    def leds_per_controller(self) -> List[int]:
+        return [c.leds for c in self.controllers]
+
+    @property
+    def reverse(self) -> List[bool]:
+        return [c.reverse for c in self.controllers]
+
+    @property
+    def protocols(self) -> List[str]:
+        return [c.protocol for c in self.controllers]
+
+    @property
+    def ports(self) -> List[Optional[int]]:
+        return [c.port for c in self.controllers]
+
+    @property
+    def universes(self) -> List[Optional[int]]:
+        return [c.universe for c in self.controllers]
+
+    def digest(self) -> bytes:
+        """
+        Returns a 16-byte fingerprint of the LED placement, e.g. to tell whether
+        frames rendered for another layout are still valid.
+        """
+        return hashlib.blake2b(
+            np.ascontiguousarray(self.led_positions).tobytes() + np.array([self.rows, self.cols]).tobytes(),
+            digest_size=16).digest()
+
+    def sampling_index(self, height: int, width: int) -> np.ndarray:
+        """
+        Returns the flat index of the pixel under every LED in a height x width
+        image of the whole wall. Cached per image size.
+        """
+        key = (height, width)
+        if key not in self._sampling:
+            y = np.clip((self.led_positions[:, 0] * height / self.rows).astype(np.intp), 0, height - 1)
+            x = np.clip((self.led_positions[:, 1] * width / self.cols).astype(np.intp), 0, width - 1)
+            self._sampling[key] = y * width + x
+        return self._sampling[key]
+
+    def gather(self, image: np.ndarray) -> Frame:
+        """
+        Maps an RGB image of the whole wall onto the LEDs.
+
+        Args:
+            image (np.ndarray): (height, width, 3) uint8 RGB image, e.g. a video
+                frame downsampled to (rows, cols).
+
+        Returns:
+            Frame: The (num_leds, 3) wall frame.
+        """
+        index = self.sampling_index(image.shape[0], image.shape[1])
+        return np.take(image.reshape(-1, 3), index, axis=0)
+
+
+class VideoSampler:
+    """
+    Turns decoded video frames into wall frames for a layout.
+
+    The frame is area-averaged down to the window grid (one color per window)
+    or, with per_led, to the layout's sample grid so every LED gets the color
+    under its own position; a single gather then maps it onto the LEDs.
+    Samplers are picklable, so clip compiler processes can use them.
+    """
+
+    def __init__(self, layout: Layout, per_led: bool = False, row_stride: int = 1):
+        """
+        Args:
+            layout (Layout): The wall layout.
+            per_led (bool): Sample at LED resolution instead of window resolution.
+            row_stride (int): Row stride of the downsampling, see frames.downsample().
+        """
+        self.layout = layout
+        self.per_led = per_led
+        self.row_stride = row_stride
+        self.shape = layout.sample_shape if per_led else (layout.rows, layout.cols)
+        layout.sampling_index(*self.shape)
+
+    def digest(self) -> bytes:
+        """
+        Returns a 16-byte fingerprint of the mapping from video frames to wall frames.
+        """
+        return hashlib.blake2b(
+            self.layout.digest() + np.array([*self.shape, self.row_stride]).tobytes(),
+            digest_size=16).digest()
+
+    def map(self, image: np.ndarray) -> Frame:
+        """
+        Maps a decoded (gray, BGR or BGRA) image onto the wall.
+        """
+        return self.layout.gather(downsample(image, *self.shape, self.row_stride))
+
+    def read(self, cap: cv.VideoCapture, skip: int = 0) -> Optional[Frame]:
+        """
+        Decodes the next video frame and maps it onto the wall.
+
+        Args:
+            cap (cv.VideoCapture): The opened video.
+            skip (int): Number of frames to drop first, grabbed without being retrieved.
+
+        Returns:
+            Optional[Frame]: The LED frame, or None at the end of the video.
+        """
+        for _ in range(skip):
+            if not cap.grab():
+                return None
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        return self.map(frame)
+
+
+def create_sampler(layout: Layout, settings: Dict) -> VideoSampler:
+    """
+    Creates the video mapping of a wall from its "video_resolution" and "video_row_stride" settings.
+    """
+    return VideoSampler(layout, per_led=settings["video_resolution"] == "led",
+                        row_stride=settings["video_row_stride"])
+
+
+def parse_layout(config: Dict, leds: int, windows: int) -> Layout:
+    """
+    Creates a layout from its parsed description (see the module docstring).
+
+    Args:
+        config (Dict): The "rows", "cols" and "controllers" of the wall.
+        leds (int): Default number of LEDs per controller.
+        windows (int): Default number of windows per controller.
+    """
+    controllers = [
+        ControllerLayout(
+            origin=c["origin"],
+            leds=c.get("leds", leds),
+            windows=c.get("windows", windows),
+            direction=c.get("direction", "right"),
+            wrap=c.get("wrap"),
+            serpentine=c.get("serpentine", False),
+            arrangement=c.get("arrangement", "strip"),
+            reverse=c.get("reverse", True),
+            protocol=c.get("protocol", "raw"),
+            port=c.get("port"),
+            universe=c.get("universe"),
+            name=c.get("name", c.get("ip", "")),
+        )
+        for c in config["controllers"]
+    ]
+    return Layout(config["rows"], config["cols"], controllers)
+
+
+def load_layout(path: str, leds: int, windows: int) -> Layout:
+    """
+    Loads a layout from a JSON file.
+
+    Args:
+        path (str): Path to the layout file.
+        leds (int): Default number of LEDs per controller.
+        windows (int): Default number of windows per controller.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_layout(json.load(f), leds, windows)
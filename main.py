@@ -1,11 +1,8 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import APIRouter, FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
-from threading import Thread, Event
-from typing import List, Tuple
+from typing import Dict, List, Optional, Union
 import asyncio
-import concurrent.futures
-import cv2 as cv
 import glob
 import httpx
 import json
@@ -14,10 +11,15 @@ import numpy as np
 import os
 import queue
 import requests
-import socket
 import time
 import uvicorn
 
+from clips import VIDEO_DIR, clip_cache_dir
+from config import DEFAULT_PATH, Config, load_walls
+from frames import parse_frame_message, parse_hex_differences, parse_hex_frame
+from wall import Wall
+from worker import WallProcess
+
 # --------------------------------------------------------------------------------
 #                           LOGGING CONFIGURATION
 # --------------------------------------------------------------------------------
@@ -66,489 +68,106 @@ ws_handler.setFormatter(console_formatter)
 logger.addHandler(ws_handler)
 
 # --------------------------------------------------------------------------------
-#                         WLED & VIDEO CONFIGURATION
-# --------------------------------------------------------------------------------
-
-# Controller details
-WLED_IPS = [
-    "192.168.107.123",  # Top Left
-    "192.168.107.122",  # Top Right
-    "192.168.107.120",  # Bottom Right
-    "192.168.107.121",  # Bottom Left
-]
-PORT = 19446
-
-LEDS_PER_CONTROLLER = 100
-WINDOWS_PER_CONTROLLER = 5
-LEDS_PER_WINDOW = LEDS_PER_CONTROLLER // WINDOWS_PER_CONTROLLER  # 20
-TOTAL_CONTROLLERS = len(WLED_IPS)
-TOTAL_LEDS = LEDS_PER_CONTROLLER * TOTAL_CONTROLLERS  # 400
-
-# --------------------------------------------------------------------------------
-#                           LOW-LEVEL LED LOGIC
-# --------------------------------------------------------------------------------
-
-
-def build_packet(colors: List[Tuple[int, int, int]]) -> bytes:
-    """
-    Builds the DRGB packet (no header, just RGB bytes).
-    Reverses color order first.
-
-    Args:
-        colors (List[Tuple[int, int, int]]): List of (R, G, B) tuples for all LEDs.
-    """
-    reversed_colors = colors[::-1]
-    packet = bytearray()
-    for (r, g, b) in reversed_colors:
-        packet += bytes([r, g, b])
-    return packet
-
-
-def send_packet(ip: str, port: int, packet: bytes) -> None:
-    """
-    Sends a UDP packet to a specific WLED controller.
-
-    Args:
-        ip (str): IP address of the WLED controller.
-        port (int): UDP port of the WLED controller.
-        packet (bytes): DRGB packet to send to the controller.
-    """
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.sendto(packet, (ip, port))
-        sock.close()
-    except Exception as e:
-        logging.error(f"Failed to send packet to {ip}:{port} => {e}")
-
-
-def send_frames(colors: List[Tuple[int, int, int]]) -> None:
-    """
-    Slices the color array for each controller and sends in parallel.
-
-    Args:
-        colors (List[Tuple[int, int, int]]): List of (R, G, B) tuples for all LEDs.
-    """
-    logging.debug(f"Sending {len(colors)} colors to {TOTAL_CONTROLLERS} controllers.")
-    with concurrent.futures.ThreadPoolExecutor(max_workers=TOTAL_CONTROLLERS) as executor:
-        for idx, ip in enumerate(WLED_IPS):
-            start_idx = idx * LEDS_PER_CONTROLLER
-            end_idx = start_idx + LEDS_PER_CONTROLLER
-            controller_slice = colors[start_idx:end_idx]
-            packet = build_packet(controller_slice)
-            executor.submit(send_packet, ip, PORT, packet)
-
-# --------------------------------------------------------------------------------
-#                        THREADING EVENTS & THREAD HANDLES
-# --------------------------------------------------------------------------------
-
-
-# Instead of using global booleans to stop threads, we use Event objects.
-piano_stop_event = Event()
-video_stop_event = Event()
-christmas_stop_event = Event()
-legacy_stop_event = Event()
-
-# Thread handle globals (these can remain as globals)
-pianoLoopThread = None
-video_thread = None
-christmas_thread = None
-legacy_thread = None
-
-# --------------------------------------------------------------------------------
-#                           PIANO LOGIC (VIA WEBSOCKET)
-# --------------------------------------------------------------------------------
-
-piano_states = [[(0, 0, 0) for _ in range(WINDOWS_PER_CONTROLLER)]
-                for _ in range(TOTAL_CONTROLLERS)]
-
-
-def build_piano_colors() -> List[Tuple[int, int, int]]:
-    """
-    Flattens the global piano_states into a list of LED colors of length TOTAL_LEDS.
-    """
-    colors = []
-    for c_idx in range(TOTAL_CONTROLLERS):
-        for w_idx in range(WINDOWS_PER_CONTROLLER):
-            colors.extend([piano_states[c_idx][w_idx]] * LEDS_PER_WINDOW)
-    return colors
-
-
-def piano_loop():
-    """
-    Background thread function that sends the current piano state every 0.3 seconds.
-    """
-    logging.info("Piano loop started, sending frames every 0.3s.")
-    while not piano_stop_event.is_set():
-        colors = build_piano_colors()
-        send_frames(colors)
-        time.sleep(0.3)
-    logging.info("Piano loop stopped.")
-
-
-def start_piano_loop():
-    """
-    Starts the piano loop thread if it's not already running.
-    """
-    global pianoLoopThread
-    if pianoLoopThread and pianoLoopThread.is_alive():
-        return
-    piano_stop_event.clear()
-    pianoLoopThread = Thread(target=piano_loop, daemon=True)
-    pianoLoopThread.start()
-
-
-def stop_piano_loop():
-    """
-    Stops the piano loop thread if it's running.
-    """
-    global pianoLoopThread
-    if pianoLoopThread and pianoLoopThread.is_alive():
-        logging.info("Stopping piano loop.")
-        piano_stop_event.set()
-        pianoLoopThread.join()
-        pianoLoopThread = None
-
-
-def handle_piano(controller_idx: int, window_idx: int, color: Tuple[int, int, int] = (255, 255, 255), persistent: bool = False):
-    """
-    Update the single window in the piano states.
-
-    Args:
-        controller_idx (int): Index of the controller (0-3).
-        window_idx (int): Index of the window (0-4).
-        color (Tuple[int, int, int]): RGB color tuple.
-        persistent (bool): If True, keep the current colors; otherwise, reset others to off.
-    """
-    if not (0 <= controller_idx < TOTAL_CONTROLLERS):
-        logging.error(f"Invalid controller index: {controller_idx}")
-        return
-    if not (0 <= window_idx < WINDOWS_PER_CONTROLLER):
-        logging.error(f"Invalid window index: {window_idx}")
-        return
-
-    if not persistent:
-        # Reset all windows to off
-        for c in range(TOTAL_CONTROLLERS):
-            for w in range(WINDOWS_PER_CONTROLLER):
-                piano_states[c][w] = (0, 0, 0)
-
-    # Set the chosen window's color
-    piano_states[controller_idx][window_idx] = color
-
-    # Immediately send the new frame
-    colors = build_piano_colors()
-    send_frames(colors)
-
-    if persistent:
-        start_piano_loop()
-    else:
-        stop_piano_loop()
-
-# --------------------------------------------------------------------------------
-#                         VIDEO PLAYBACK LOGIC
+#                                   WALLS
 # --------------------------------------------------------------------------------
 
+# The walls with their controllers, placement and settings, from config.json (or
+# LED_CONFIG) with LED_<SETTING> environment overrides, validated on load
+CONFIG_PATH = os.environ.get("LED_CONFIG", DEFAULT_PATH)
 
-def play_video(video_path: str, max_fps: float = None):
+def create_wall(wall_id: str, config: Config) -> Union[Wall, WallProcess]:
     """
-    Loops the given video until video_stop_event is set.
-
-    Args:
-        video_path (str): Path to the video file.
-        max_fps (float): Maximum FPS to cap the video playback.
+    Creates a wall in this process, or in a worker process with the "worker_process" setting.
     """
-    while not video_stop_event.is_set():
-        cap = cv.VideoCapture(video_path)
-        if not cap.isOpened():
-            logging.error(f"Failed to open video file: {video_path}")
-            return
-
-        fps = cap.get(cv.CAP_PROP_FPS) or 30
-        if max_fps and fps > max_fps:
-            fps = max_fps
-            logging.info(f"FPS capped to {fps}")
-        frame_duration = 1.0 / fps
-
-        logging.info(f"Playing video in a loop: {video_path} at {fps:.2f} FPS")
-        grid_rows = 4
-        grid_cols = 5
-
-        while not video_stop_event.is_set():
-            frame_start = time.time()
-            ret, frame = cap.read()
-            if not ret:
-                break
-            if video_stop_event.is_set():
-                logging.info("Stopping video playback...")
-                break
+    factory = WallProcess if config.settings["worker_process"] else Wall
+    return factory(wall_id, config, VIDEO_DIR, clip_cache_dir(wall_id, config))
 
-            # Convert frame to RGB if necessary
-            if len(frame.shape) == 2:
-                frame = cv.cvtColor(frame, cv.COLOR_GRAY2RGB)
-            elif frame.shape[2] == 4:
-                frame = cv.cvtColor(frame, cv.COLOR_BGRA2RGB)
-            else:
-                frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
-
-            resized_frame = cv.resize(
-                frame, (grid_cols, grid_rows), interpolation=cv.INTER_AREA)
-            reshaped_frame = resized_frame.reshape(-1, 3)
-            full_colors = np.repeat(
-                reshaped_frame, LEDS_PER_WINDOW, axis=0).tolist()
-
-            # Ensure exactly TOTAL_LEDS colors
-            if len(full_colors) < TOTAL_LEDS:
-                full_colors += [(0, 0, 0)] * (TOTAL_LEDS - len(full_colors))
-            elif len(full_colors) > TOTAL_LEDS:
-                full_colors = full_colors[:TOTAL_LEDS]
-
-            send_frames(full_colors)
 
-            # Sleep to honor the FPS
-            elapsed = time.time() - frame_start
-            wait_time = frame_duration - elapsed
-            if wait_time > 0:
-                time.sleep(wait_time)
+# One render pipeline per wall (see wall.py and worker.py), started in
+# lifespan; the routes without a wall id address the first one
+walls: Dict[str, Union[Wall, WallProcess]] = {wall_id: create_wall(wall_id, config)
+                          for wall_id, config in load_walls(CONFIG_PATH).items()}
+default_wall_id = next(iter(walls))
 
-        cap.release()
 
-    # Clear LEDs after stopping
-    black = [(0, 0, 0)] * TOTAL_LEDS
-    send_frames(black)
-    logging.info("Video playback stopped or finished.")
-
-
-def start_video(video_name: str):
+def get_wall(wall_id: Optional[str] = None) -> Union[Wall, WallProcess]:
     """
-    Kills any existing video thread and starts a new one looping the given video.
+    Returns the wall with the given id, or the default wall.
 
-    Args:
-        video_name (str): Name of the video file (without extension).
-    """
-    global video_thread
-    if video_thread and video_thread.is_alive():
-        video_stop_event.set()
-        video_thread.join()
-    video_stop_event.clear()
-    video_path = os.path.join(os.path.dirname(__file__), "videos", video_name)
-    video_thread = Thread(target=play_video, args=(video_path,), daemon=True)
-    video_thread.start()
-
-# --------------------------------------------------------------------------------
-#                           CHRISTMAS ANIMATION LOGIC
-# --------------------------------------------------------------------------------
-
-
-def make_christmas_frame(enabled: bool = True) -> List[Tuple[int, int, int]]:
-    """
-    Create a fixed red-green pattern with blocks of 20 LEDs each.
-
-    Args:
-        enabled (bool): If True, start with red blocks; otherwise, start with green.
-
-    Returns:
-        List[Tuple[int, int, int]]: A list of (R, G, B) tuples with red and green colors.
-    """
-    logging.debug(f"Creating Christmas frame that starts with {'red' if enabled else 'green'}")
-    colors = []
-    for i in range(TOTAL_LEDS):
-        block = i // LEDS_PER_WINDOW
-        if enabled:
-            colors.append((255, 0, 0) if block % 2 == 0 else (0, 255, 0))
-        else:
-            colors.append((0, 255, 0) if block % 2 == 0 else (255, 0, 0))
-    return colors
-
-
-def run_christmas_animation():
-    """
-    Toggles every 5 seconds between two frames (red/green).
-    """
-    logging.info(
-        "Starting Christmas animation with 0.1s sends, switching frames every 5s.")
-    enabled = True
-    while not christmas_stop_event.is_set():
-        block_start = time.monotonic()
-        while (time.monotonic() - block_start < 5) and not christmas_stop_event.is_set():
-            colors = make_christmas_frame(enabled)
-            send_frames(colors)
-            time.sleep(0.1)
-        if not christmas_stop_event.is_set():
-            enabled = not enabled
-            logging.info(f"Switched to {'Red' if enabled else 'Green'} frame.")
-
-
-def start_christmas():
-    """
-    Starts the Christmas animation.
+    Raises:
+        HTTPException: 404 if there is no such wall.
     """
-    global christmas_thread
-    stop_animation()  # Stop any ongoing animations first
-    christmas_stop_event.clear()
-    christmas_thread = Thread(target=run_christmas_animation, daemon=True)
-    christmas_thread.start()
-    logging.info("Christmas animation thread started.")
+    wall = walls.get(wall_id or default_wall_id)
+    if wall is None:
+        raise HTTPException(status_code=404, detail=f"Unknown wall: {wall_id}")
+    return wall
 
 # --------------------------------------------------------------------------------
-#                      LEGACY FUNCTIONS & GLOBALS
+#                              CONFIG RELOAD
 # --------------------------------------------------------------------------------
 
 
-def hex_to_rgb(h: str) -> Tuple[int, int, int]:
-    return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
-
-
-# Global variable holding the current legacy frame (default black)
-current_legacy_frame: List[Tuple[int, int, int]] = [(0, 0, 0)] * TOTAL_LEDS
-
-
-def run_legacy_animation():
-    """
-    Continuously sends the current legacy frame every 0.25 seconds until legacy_stop_event is set.
-    """
-    while not legacy_stop_event.is_set():
-        send_frames(current_legacy_frame)
-        logging.debug("Update legacy frame")
-        time.sleep(0.25)
-
-
-def start_legacy_sender():
-    """
-    Starts the legacy sender thread if it is not already running.
-    Stops video and Christmas animations if they are running.
-    """
-    global video_thread, christmas_thread, legacy_thread
-    if video_thread and video_thread.is_alive():
-        logging.info("Stopping video playback.")
-        video_stop_event.set()
-        video_thread.join()
-        video_thread = None
-
-    if christmas_thread and christmas_thread.is_alive():
-        logging.info("Stopping Christmas animation.")
-        christmas_stop_event.set()
-        christmas_thread.join(timeout=2)
-        christmas_thread = None
-
-    if legacy_thread is None or not legacy_thread.is_alive():
-        legacy_stop_event.clear()
-        legacy_thread = Thread(target=run_legacy_animation, daemon=True)
-        legacy_thread.start()
-        logging.info("Legacy sender thread started.")
-
-
-def make_setall_frame(color: str) -> List[Tuple[int, int, int]]:
-    """
-    Creates a legacy frame where every LED is set to the same color.
-
-    Args:
-        color (str): A 6-digit hex string (e.g. "ff8040").
-
-    Returns:
-        List[Tuple[int, int, int]]: A list of TOTAL_LEDS copies of the RGB tuple.
-    """
-    rgb = hex_to_rgb(color)
-    return [rgb] * TOTAL_LEDS
-
-
-def setAllColors(color: str) -> None:
-    """
-    Legacy command to set all LEDs to the given color.
+# Serializes config reloads
+config_lock = asyncio.Lock()
 
-    Args:
-        color (str): A 6-digit hex string (e.g. "ff8040").
-    """
-    global current_legacy_frame
-    current_legacy_frame = make_setall_frame(color)
-    logging.info(f"Legacy: Set all colors to #{color}")
 
-
-def update_matrix_legacy(colors: List[str]) -> None:
+async def reload_config() -> Dict[str, object]:
     """
-    Legacy command to update the entire LED matrix.
-
-    Args:
-        colors (List[str]): A list of 6-digit hex strings, one per LED.
+    Reloads the config file. Every wall swaps in its new config between two
+    frames without stopping its animation (see Wall.reload), new walls are
+    started and removed walls are cleared and stopped.
 
     Raises:
-        ValueError: if the list length does not match TOTAL_LEDS.
-    """
-    if len(colors) != TOTAL_LEDS:
-        raise ValueError(f"Expected {TOTAL_LEDS} colors but got {len(colors)}")
-    global current_legacy_frame
-    current_legacy_frame = [hex_to_rgb(c) for c in colors]
-    logging.info("Legacy: Full matrix update performed.")
-
-
-def update_differences(diff_list: List[List[str]]) -> None:
-    """
-    Legacy command to update individual LED colors by index.
-
-    Args:
-        diff_list (List[List[str]]): A list of [index, hex_color] pairs. 
-          For example: [["23", "ff8040"], ["45", "00ff00"]]
-
-    This function updates the global legacy frame in-place.
-    """
-    global current_legacy_frame
-    for diff in diff_list:
-        try:
-            idx = int(diff[0])
-            if not (0 <= idx < TOTAL_LEDS):
-                logging.error(f"Legacy: Index {idx} out of bounds.")
+        OSError, ValueError: if the config cannot be read or is invalid; all
+            walls keep their running config.
+    """
+    global default_wall_id
+    async with config_lock:
+        configs = await asyncio.to_thread(load_walls, CONFIG_PATH)
+        result: Dict[str, object] = {}
+        for wall_id in [wall_id for wall_id in walls if wall_id not in configs]:
+            await walls.pop(wall_id).close()
+            logging.info(f"Removed wall {wall_id}.")
+            result[wall_id] = {"removed": True}
+        for wall_id, config in configs.items():
+            if wall_id in walls:
+                result[wall_id] = await walls[wall_id].reload(config)
                 continue
-            new_color = hex_to_rgb(diff[1])
-            current_legacy_frame[idx] = new_color
-            logging.debug(f"Legacy: Updated LED {idx} to #{diff[1]}")
-        except Exception as e:
-            logging.error(f"Legacy: Error updating difference {diff}: {e}")
-
-
-# --------------------------------------------------------------------------------
-#                           STOP ANIMATION LOGIC
-# --------------------------------------------------------------------------------
+            wall = create_wall(wall_id, config)
+            await wall.start()
+            walls[wall_id] = wall
+            logging.info(f"Added wall {wall_id}: {len(config.ips)} controllers, {config.num_leds} LEDs.")
+            result[wall_id] = {"controllers": len(config.ips), "leds": config.num_leds, "added": True}
+        default_wall_id = next(iter(walls))
+    return {"path": CONFIG_PATH, "walls": result}
 
 
-def stop_animation():
+async def watch_config() -> None:
     """
-    Stops any ongoing animations, including video playback, Christmas animation,
-    legacy sender, and the piano loop.
+    Reloads the config whenever its file changes, checking every
+    "config_watch" seconds of the default wall (0 only reloads on
+    POST /config/reload).
     """
-    global video_thread, christmas_thread, legacy_thread, pianoLoopThread
-    logging.info("Stopping all ongoing animations.")
-
-    # Stop legacy sender
-    if legacy_thread and legacy_thread.is_alive():
-        logging.info("Stopping legacy sender.")
-        legacy_stop_event.set()
-        legacy_thread.join(timeout=5)
-        legacy_thread = None
-
-    # Stop video playback
-    if video_thread and video_thread.is_alive():
-        logging.info("Stopping video playback.")
-        video_stop_event.set()
-        video_thread.join()
-        video_thread = None
-
-    # Stop Christmas animation
-    if christmas_thread and christmas_thread.is_alive():
-        logging.info("Stopping Christmas animation.")
-        christmas_stop_event.set()
-        christmas_thread.join()
-        christmas_thread = None
-
-    # Stop the piano loop
-    if pianoLoopThread and pianoLoopThread.is_alive():
-        logging.info("Stopping piano loop.")
-        piano_stop_event.set()
-        pianoLoopThread.join()
-        pianoLoopThread = None
+    def modified() -> Optional[int]:
+        try:
+            return os.stat(CONFIG_PATH).st_mtime_ns
+        except OSError:
+            return None
 
-    # Clear LEDs
-    black = [(0, 0, 0)] * TOTAL_LEDS
-    send_frames(black)
-    logging.info("All animations have been stopped and LEDs cleared.")
+    last_modified = modified()
+    while True:
+        interval = get_wall().config.settings["config_watch"]
+        await asyncio.sleep(interval or 1.0)
+        if not interval:
+            continue
+        current = modified()
+        if current is None or current == last_modified:
+            continue
+        last_modified = current
+        try:
+            await reload_config()
+        except (OSError, ValueError) as e:
+            logging.error(f"Config reload failed, keeping the running config => {e}")
 
 # --------------------------------------------------------------------------------
 #                          FASTAPI APPLICATION
@@ -574,11 +193,15 @@ async def lifespan(app: FastAPI):
         app (FastAPI): The FastAPI application instance.
     """
     logging.info("Application startup: Initializing background tasks.")
+    for wall in walls.values():
+        await wall.start()
     asyncio.create_task(transfer_sync_to_async())
     asyncio.create_task(broadcast_logs())
+    asyncio.create_task(watch_config())
     yield  # hand over to the application
     logging.info("Application shutdown: Cleaning up background tasks.")
-    stop_animation()
+    for wall in walls.values():
+        await wall.close()
 
 app = FastAPI(
     title="LedControllerAPI",
@@ -597,6 +220,10 @@ app = FastAPI(
 if os.path.exists("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# The routes of a wall; included at the top level for the default wall (or the
+# wall in the wall_id query parameter) and under /walls/{wall_id}
+router = APIRouter()
+
 
 @app.get("/")
 def root():
@@ -609,16 +236,32 @@ def root():
     return FileResponse(file_path)
 
 
-@app.get("/health")
-async def health_check():
+@app.get("/walls")
+def get_walls():
+    """
+    Returns the id, controllers and active animation of every wall.
+    """
+    return {
+        wall_id: {
+            "controllers": wall.config.ips,
+            "leds": wall.num_leds,
+            "active": wall.active
+        }
+        for wall_id, wall in walls.items()
+    }
+
+
+@router.get("/health")
+async def health_check(wall_id: Optional[str] = None):
     """
     Health check endpoint to verify if the WLED controllers are reachable.
     """
+    ips = get_wall(wall_id).config.ips
     health_status = {}
     async with httpx.AsyncClient(timeout=2.0) as client:
-        tasks = [client.get(f"http://{ip}/json") for ip in WLED_IPS]
+        tasks = [client.get(f"http://{ip}/json") for ip in ips]
         responses = await asyncio.gather(*tasks, return_exceptions=True)
-        for ip, resp in zip(WLED_IPS, responses):
+        for ip, resp in zip(ips, responses):
             if isinstance(resp, Exception):
                 health_status[ip] = f"Error: {resp}"
             elif resp.status_code == 200:
@@ -628,108 +271,168 @@ async def health_check():
     return health_status
 
 
-@app.get("/info")
-async def about():
+@router.get("/info")
+async def about(wall_id: Optional[str] = None):
     """
     Returns information about the API and its capabilities.
     """
-    current_health = await health_check()
+    wall = get_wall(wall_id)
+    config, layout, active = wall.config, wall.config.layout, wall.active
+    current_health = await health_check(wall.id)
     return {
         "about": "This API controls WLED-based LED matrices via UDP.",
         "animation": {
-            "video": bool(video_thread and video_thread.is_alive()),
-            "christmas": bool(christmas_thread and christmas_thread.is_alive())
+            "active": active,
+            "video": active == "video",
+            "christmas": active == "christmas"
         },
         "connected_websockets": len(connected_websockets),
         "info": {
+            "wall": wall.id,
             "controllers": {
-                "total": TOTAL_CONTROLLERS,
+                "total": len(config.ips),
                 "ips": current_health,
-                "port": PORT,
-                "windows_per_controller": WINDOWS_PER_CONTROLLER
+                "protocols": {ip: {"protocol": c.protocol, "port": c.port or encoder.port}
+                              for ip, c, encoder in zip(config.ips, layout.controllers, wall.packet_layout.encoders)},
+                "windows_per_controller": config.windows_per_controller
+            },
+            "layout": {
+                "rows": layout.rows,
+                "cols": layout.cols
             },
             "leds": {
-                "total": TOTAL_LEDS,
-                "per_controller": LEDS_PER_CONTROLLER,
-                "per_window": LEDS_PER_WINDOW
+                "total": config.num_leds,
+                "per_controller": config.leds_per_controller,
+                "per_window": [c.leds_per_window for c in layout.controllers]
             }
         }
     }
 
 
-@app.post("/christmas")
-def christmas_endpoint():
+@router.get("/stats")
+def get_stats(wall_id: Optional[str] = None):
+    """
+    Returns the UDP send counters for every WLED controller, the render loop
+    timing stats and the metrics of the WebSocket connections to the wall.
+    """
+    wall = get_wall(wall_id)
+    return {**wall.stats(), "websockets": [c.stats() for c in connections if c.wall_id == wall.id]}
+
+
+@router.get("/frame")
+def get_frame(wall_id: Optional[str] = None):
+    """
+    Returns the colors of the last frame sent to the wall, one [r, g, b] per LED, for previews.
+    """
+    return {"frame": get_wall(wall_id).preview().tolist()}
+
+
+@app.post("/config/reload")
+async def reload_config_endpoint():
+    """
+    Reloads the controller config (see config.py) without restarting the
+    render loop; the active animation keeps playing.
+    """
+    try:
+        return await reload_config()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/christmas")
+async def christmas_endpoint(wall_id: Optional[str] = None):
     """Starts Christmas animation."""
-    start_christmas()
+    await get_wall(wall_id).start_christmas()
     return {"message": "Christmas animation started."}
 
 
-@app.get("/piano")
-def get_piano_state():
+@router.get("/piano")
+def get_piano_state(wall_id: Optional[str] = None):
     """
     Returns the current piano state (all windows) for all controllers.
     """
-    return {"piano": piano_states}
+    wall = get_wall(wall_id)
+    offsets = wall.config.window_offsets[1:]
+    return {"piano": [states.tolist() for states in np.split(wall.piano_states, offsets)]}
 
 
-@app.post("/piano/{controller_idx}/{window_idx}")
-def piano_endpoint(controller_idx: int, window_idx: int):
+@router.post("/piano/{controller_idx}/{window_idx}")
+async def piano_endpoint(controller_idx: int, window_idx: int, wall_id: Optional[str] = None):
     """
     Lights up exactly one window (20 LEDs) in white for a given controller+window.
     All other LEDs are off.
 
     Args:
         controller_idx (int): Index of the WLED controller (0-1).
-        window_idx (int): Index of the window (0-WINDOWS_PER_CONTROLLER) on the controller.
+        window_idx (int): Index of the window on the controller.
     """
-    if not (0 <= controller_idx < TOTAL_CONTROLLERS):
+    received_ns = time.monotonic_ns()
+    wall = get_wall(wall_id)
+    if not (0 <= controller_idx < len(wall.config.ips)):
         raise HTTPException(
             status_code=400, detail="Invalid controller index.")
-    if not (0 <= window_idx < WINDOWS_PER_CONTROLLER):
+    if not wall.is_valid_window(controller_idx, window_idx):
         raise HTTPException(status_code=400, detail="Invalid window index.")
-    handle_piano(controller_idx, window_idx)
+    await wall.handle_piano(controller_idx, window_idx, received_ns=received_ns)
     return {"message": f"Piano window {window_idx} on controller {controller_idx} activated."}
 
 
-@app.get("/video")
-def get_video_list():
+@router.get("/video")
+def get_video_list(details: bool = False, wall_id: Optional[str] = None):
     """
     Returns names (without extension) of all .mp4 files in the /videos folder.
+
+    Args:
+        details (bool): If True, return {"name", "compiled"} objects telling
+            which videos have an up-to-date compiled LED clip.
+    """
+    files = glob.glob(os.path.join(VIDEO_DIR, "*.mp4"))
+    names = [os.path.splitext(os.path.basename(v))[0] for v in files]
+    if not details:
+        return names
+    clip_compiler = get_wall(wall_id).clip_compiler
+    return [{"name": name, "compiled": clip_compiler.is_compiled(path)}
+            for name, path in zip(names, files)]
+
+
+@router.get("/clips")
+def get_clip_status(wall_id: Optional[str] = None):
     """
-    video_dir = os.path.join(os.path.dirname(__file__), "videos")
-    files = glob.glob(os.path.join(video_dir, "*.mp4"))
-    return [os.path.splitext(os.path.basename(v))[0] for v in files]
+    Returns the compile state (and progress) of the LED clip of every video and the clip cache usage.
+    """
+    return get_wall(wall_id).clip_compiler.status()
 
 
-@app.post("/video/{video_name}")
-def start_video_endpoint(video_name: str):
+@router.post("/video/{video_name}")
+async def start_video_endpoint(video_name: str, wall_id: Optional[str] = None):
     """
     Starts looping the given video file (by name, no extension needed).
 
     Args:
         video_name (str): Name of the video file (without extension).
     """
+    wall = get_wall(wall_id)
     if not video_name:
         raise HTTPException(status_code=400, detail="Missing video name.")
-    stop_animation()
-    start_video(video_name + ".mp4")
+    await wall.stop_animation()
+    await wall.start_video(video_name + ".mp4")
     return {"message": "Video playback started."}
 
 
-@app.delete("/christmas")
-@app.delete("/piano")
-@app.delete("/video")
-@app.delete("/video/{video_name}")
-def stop_video_endpoint(video_name: str = None):
+@router.delete("/christmas")
+@router.delete("/piano")
+@router.delete("/video")
+@router.delete("/video/{video_name}")
+async def stop_video_endpoint(video_name: str = None, wall_id: Optional[str] = None):
     """
     Stops any ongoing animation (video or Christmas).
     """
-    stop_animation()
+    await get_wall(wall_id).stop_animation()
     return {"message": "Animations stopped."}
 
 
-@app.post("/brightness/{value}")
-def set_brightness_endpoint(value: int):
+@router.post("/brightness/{value}")
+def set_brightness_endpoint(value: int, wall_id: Optional[str] = None):
     """
     Sets brightness (0-255) on all WLED controllers.
 
@@ -739,20 +442,21 @@ def set_brightness_endpoint(value: int):
     if not (0 <= value <= 255):
         raise HTTPException(
             status_code=400, detail="Brightness must be 0..255.")
-    set_brightness(value)
+    set_brightness(get_wall(wall_id), value)
     return {"message": f"Brightness set to {value}."}
 
 
-@app.get("/brightness")
-async def get_brightness():
+@router.get("/brightness")
+async def get_brightness(wall_id: Optional[str] = None):
     """
     Fetches brightness levels from all WLED controllers.
     """
+    ips = get_wall(wall_id).config.ips
     brightness_levels = {}
     async with httpx.AsyncClient() as client:
-        tasks = [client.get(f"http://{ip}/json") for ip in WLED_IPS]
+        tasks = [client.get(f"http://{ip}/json") for ip in ips]
         responses = await asyncio.gather(*tasks, return_exceptions=True)
-        for ip, resp in zip(WLED_IPS, responses):
+        for ip, resp in zip(ips, responses):
             if isinstance(resp, Exception):
                 brightness_levels[ip] = f"Error: {resp}"
             elif resp.status_code == 200:
@@ -768,11 +472,15 @@ async def get_brightness():
 # =============================================================================
 
 
-async def ws_legacy_api(websocket: WebSocket, data: bytes) -> None:
+async def ws_legacy_api(websocket: WebSocket, data: bytes, wall_id: Optional[str] = None,
+                        connection: Optional["Connection"] = None) -> None:
     """
-    Process legacy API commands sent as bytes.
+    Process legacy API commands sent as bytes. The frame commands (setall,
+    update and difference) are acknowledged according to the ack mode of
+    the connection, all other commands with "OK.".
     """
     try:
+        wall = get_wall(wall_id)
         parts = data.split(b"; ", 1)
         if len(parts) != 2:
             await websocket.send_text("Error: Invalid command format (missing separator).")
@@ -786,33 +494,40 @@ async def ws_legacy_api(websocket: WebSocket, data: bytes) -> None:
             if len(color_str) != 6:
                 await websocket.send_text("Error: Color must be a 6-digit hex string.")
                 return
-            setAllColors(color_str)
-            start_legacy_sender()
+            wall.set_all_colors(color_str)
+            await wall.start_legacy_sender()
 
         elif command == b"update":
-            colors = payload.split(b", ")
-            if len(colors) != TOTAL_LEDS:
-                await websocket.send_text(f"Error: Expected {TOTAL_LEDS} colors but got {len(colors)}.")
+            count = payload.count(b", ") + 1
+            if count != wall.num_leds:
+                await websocket.send_text(f"Error: Expected {wall.num_leds} colors but got {count}.")
                 return
-            color_list = [c.decode() for c in colors]
-            update_matrix_legacy(color_list)
-            start_legacy_sender()
+            try:
+                wall.update_matrix_legacy(parse_hex_frame(payload))
+            except ValueError:
+                # Not the canonical format, parse color by color
+                wall.update_matrix_legacy([c.decode() for c in payload.split(b", ")])
+            await wall.start_legacy_sender()
 
         elif command == b"difference":
-            parts = payload.split(b", ")
-            if len(parts) % 2 != 0:
+            if payload.count(b", ") % 2 == 0:
                 await websocket.send_text("Error: Difference command data malformed (odd number of items).")
                 return
-            diff_list = []
-            for i in range(0, len(parts), 2):
-                index = parts[i].decode().strip("()")
-                color = parts[i+1].decode().strip("()")
-                diff_list.append([index, color])
-            update_differences(diff_list)
-            start_legacy_sender()
+            try:
+                wall.apply_differences(*parse_hex_differences(payload))
+            except ValueError:
+                # Not the canonical format, parse and report the pairs one by one
+                parts = payload.split(b", ")
+                diff_list = []
+                for i in range(0, len(parts), 2):
+                    index = parts[i].decode().strip("()")
+                    color = parts[i+1].decode().strip("()")
+                    diff_list.append([index, color])
+                wall.update_differences(diff_list)
+            await wall.start_legacy_sender()
 
         elif command == b"videolist":
-            videos = get_video_list()
+            videos = get_video_list(wall_id=wall.id)
             await websocket.send_text("videos: " + ", ".join(videos))
             return
 
@@ -821,10 +536,10 @@ async def ws_legacy_api(websocket: WebSocket, data: bytes) -> None:
             if not video_name:
                 await websocket.send_text("Error: Missing video name.")
                 return
-            start_video(video_name + ".mp4")
+            await wall.start_video(video_name + ".mp4")
 
         elif command == b"stop":
-            stop_animation()
+            await wall.stop_animation()
 
         elif command == b"brightness":
             try:
@@ -832,14 +547,17 @@ async def ws_legacy_api(websocket: WebSocket, data: bytes) -> None:
             except ValueError:
                 await websocket.send_text("Error: Brightness must be an integer.")
                 return
-            set_brightness(brightness_value)
+            set_brightness(wall, brightness_value)
 
         else:
             logging.warning("Unknown legacy command: " + command.decode())
             await websocket.send_text("Unknown legacy command.")
             return
 
-        await websocket.send_text("OK.")
+        if connection is not None and command in FRAME_COMMANDS:
+            await connection.acknowledge()
+        else:
+            await websocket.send_text("OK.")
 
     except Exception as e:
         logging.error(f"Error processing legacy command: {e}")
@@ -850,10 +568,15 @@ async def ws_legacy_api(websocket: WebSocket, data: bytes) -> None:
 # =============================================================================
 
 
-async def ws_json_api(websocket: WebSocket, data: str) -> None:
+async def ws_json_api(websocket: WebSocket, data: str, wall_id: Optional[str] = None) -> None:
     """
     Process JSON API commands sent as text.
     """
+    received_ns = time.monotonic_ns()
+    wall = walls.get(wall_id or default_wall_id)
+    if wall is None:
+        await websocket.send_text(json.dumps({"error": f"Unknown wall: {wall_id}"}))
+        return
     try:
         msg = json.loads(data)
     except json.JSONDecodeError:
@@ -875,7 +598,7 @@ async def ws_json_api(websocket: WebSocket, data: str) -> None:
         return
 
     elif command == "videolist":
-        videos = get_video_list()
+        videos = get_video_list(wall_id=wall.id)
         await websocket.send_text(json.dumps({"videos": videos}))
 
     elif command == "video":
@@ -883,18 +606,18 @@ async def ws_json_api(websocket: WebSocket, data: str) -> None:
             await websocket.send_text(json.dumps({"error": "Missing video name"}))
         else:
             video_name = str(data_field).strip()
-            stop_animation()
-            start_video(video_name + ".mp4")
+            await wall.stop_animation()
+            await wall.start_video(video_name + ".mp4")
             await websocket.send_text(json.dumps({"status": "Video playback started"}))
 
     elif command == "stop":
-        stop_animation()
+        await wall.stop_animation()
         await websocket.send_text(json.dumps({"status": "All animations stopped"}))
 
     elif command == "brightness":
         try:
             brightness_value = int(data_field)
-            set_brightness(brightness_value)
+            set_brightness(wall, brightness_value)
             await websocket.send_text(json.dumps({"status": f"Brightness set to {brightness_value}"}))
         except (ValueError, TypeError):
             await websocket.send_text(json.dumps({"error": "Brightness value must be an integer"}))
@@ -910,7 +633,7 @@ async def ws_json_api(websocket: WebSocket, data: str) -> None:
                 window_idx = int(data_field["window"])
                 persistent = data_field.get("persistent", False)
                 color = data_field.get("color", (255, 255, 255))
-                handle_piano(controller_idx, window_idx, color, persistent)
+                await wall.handle_piano(controller_idx, window_idx, color, persistent, received_ns)
                 await websocket.send_text(json.dumps({
                     "status": f"Piano window {window_idx} on controller {controller_idx} activated"
                 }))
@@ -918,7 +641,7 @@ async def ws_json_api(websocket: WebSocket, data: str) -> None:
                 await websocket.send_text(json.dumps({"error": "Piano coordinates must be integers"}))
 
     elif command == "christmas":
-        start_christmas()
+        await wall.start_christmas()
         await websocket.send_text(json.dumps({"status": "Christmas animation started"}))
 
     elif command == "commands":
@@ -937,67 +660,273 @@ async def ws_json_api(websocket: WebSocket, data: str) -> None:
 # =============================================================================
 
 
-@app.websocket("/ws")
-async def ws_main(websocket: WebSocket):
+# Acknowledgement modes of the legacy frame commands, chosen with the acks
+# query parameter: "each" answers every command with "OK.", "batch" answers
+# "OK. <count>" for the commands of the last ACK_INTERVAL seconds and "none"
+# only answers errors. The frame commands only change the latest frame of the
+# wall, which is sent at most render_fps times per second, so a client that
+# does not wait for every "OK." gets its updates coalesced instead of queued.
+ACK_MODES = ("each", "batch", "none")
+ACK_INTERVAL = 0.1
+FRAME_COMMANDS = (b"setall", b"update", b"difference")
+
+
+class Connection:
+    """
+    A WebSocket client of a wall, with its ack mode and message metrics (see
+    /stats).
+    """
+
+    # Seconds over which the message rate is measured
+    RATE_WINDOW = 1.0
+
+    def __init__(self, websocket: WebSocket, wall_id: str, acks: str = "each"):
+        self.websocket = websocket
+        self.path = websocket.url.path
+        self.wall_id = wall_id
+        self.acks = acks
+        self.connected = time.monotonic()
+        self.messages = 0
+        self.bytes = 0
+        self.frame_updates = 0
+        self.skipped = 0
+        self.errors = 0
+        self.acks_sent = 0
+        self.unacked = 0
+        self.rate = 0.0
+        self._last_ack = self._rate_start = self.connected
+        self._rate_messages = 0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def receive(self) -> Optional[Dict]:
+        """
+        Receives the next message, None once the client disconnected.
+        """
+        # Starlette does not yield while messages are queued, let the render loop run
+        await asyncio.sleep(0)
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return None
+        self.messages += 1
+        self.bytes += len(message.get("bytes") or message.get("text") or "")
+        self._rate_messages += 1
+        now = time.monotonic()
+        if now - self._rate_start >= self.RATE_WINDOW:
+            self.rate = self._rate_messages / (now - self._rate_start)
+            self._rate_start, self._rate_messages = now, 0
+        return message
+
+    async def acknowledge(self) -> None:
+        """
+        Acknowledges a frame command according to the ack mode.
+        """
+        self.frame_updates += 1
+        if self.acks == "each":
+            await self.websocket.send_text("OK.")
+            self.acks_sent += 1
+        elif self.acks == "batch":
+            self.unacked += 1
+            delay = self._last_ack + ACK_INTERVAL - time.monotonic()
+            if delay <= 0:
+                await self.flush()
+            elif self._flush_task is None:  # Ack the last commands when the client goes quiet
+                self._flush_task = asyncio.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:  # Disconnected meanwhile
+            logging.debug(f"WebSocket: Could not send the batched ack => {e}")
+
+    async def flush(self) -> None:
+        """
+        Sends the batched ack of the frame commands since the last one.
+        """
+        if self.unacked:
+            await self.websocket.send_text(f"OK. {self.unacked}")
+            self.acks_sent += 1
+            self.unacked = 0
+        self._last_ack = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Removes the closed connection from connections.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        connections.remove(self)
+
+    def stats(self) -> Dict[str, object]:
+        rate, elapsed = self.rate, time.monotonic() - self._rate_start
+        if elapsed >= self.RATE_WINDOW or not rate:
+            rate = self._rate_messages / max(elapsed, 1e-3)  # Idle, or the first second
+        return {
+            "path": self.path,
+            "acks": self.acks,
+            "connected_s": round(time.monotonic() - self.connected, 1),
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "messages_per_s": round(rate, 1),
+            "frame_updates": self.frame_updates,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "acks_sent": self.acks_sent,
+        }
+
+
+# The open WebSocket connections, reported on /stats of their wall
+connections: List[Connection] = []
+
+
+async def accept_connection(websocket: WebSocket, wall_id: Optional[str],
+                            acks: str = "each") -> Optional[Connection]:
     """
-    The unified WebSocket endpoint that accepts both legacy byte messages and JSON messages.
+    Accepts a WebSocket connection to a wall, or closes it if there is no
+    such wall or ack mode. The caller closes it when done.
     """
+    if (wall_id or default_wall_id) not in walls:
+        await websocket.close(code=1008, reason=f"Unknown wall: {wall_id}")
+        return None
+    if acks not in ACK_MODES:
+        await websocket.close(code=1008, reason=f"Unknown ack mode: {acks}")
+        return None
     await websocket.accept()
+    connection = Connection(websocket, wall_id or default_wall_id, acks)
+    connections.append(connection)
+    return connection
+
+
+@router.websocket("/ws")
+async def ws_main(websocket: WebSocket, wall_id: Optional[str] = None, acks: str = "each"):
+    """
+    The unified WebSocket endpoint that accepts both legacy byte messages and JSON messages.
+    """
+    connection = await accept_connection(websocket, wall_id, acks)
+    if connection is None:
+        return
     try:
-        while True:
-            message = await websocket.receive()
+        while (message := await connection.receive()) is not None:
             if "bytes" in message and message["bytes"] is not None:
-                await ws_legacy_api(websocket, message["bytes"])
+                await ws_legacy_api(websocket, message["bytes"], wall_id, connection)
             elif "text" in message and message["text"] is not None:
-                await ws_json_api(websocket, message["text"])
+                await ws_json_api(websocket, message["text"], wall_id)
             else:
                 await websocket.send_text("Error: Invalid message format.")
+        logging.info("WebSocket disconnected in ws_main.")
     except WebSocketDisconnect:
         logging.info("WebSocket disconnected in ws_main.")
+    finally:
+        connection.close()
 
 # =============================================================================
 #  Separate endpoints for legacy and JSON clients
 # =============================================================================
 
 
-@app.websocket("/ws/v1")
-async def ws_legacy_endpoint(websocket: WebSocket):
+@router.websocket("/ws/v1")
+async def ws_legacy_endpoint(websocket: WebSocket, wall_id: Optional[str] = None, acks: str = "each"):
     """
     A dedicated endpoint for legacy clients that send raw bytes.
     """
-    await websocket.accept()
+    connection = await accept_connection(websocket, wall_id, acks)
+    if connection is None:
+        return
     try:
-        while True:
-            message = await websocket.receive()
+        while (message := await connection.receive()) is not None:
             if "bytes" in message and message["bytes"] is not None:
-                await ws_legacy_api(websocket, message["bytes"])
+                await ws_legacy_api(websocket, message["bytes"], wall_id, connection)
             else:
                 await websocket.send_text("Error: This endpoint accepts only byte messages.")
+        logging.info("WebSocket legacy endpoint disconnected.")
     except WebSocketDisconnect:
         logging.info("WebSocket legacy endpoint disconnected.")
+    finally:
+        connection.close()
 
 
-@app.websocket("/ws/v2")
-async def ws_json_endpoint(websocket: WebSocket):
+@router.websocket("/ws/v2")
+async def ws_json_endpoint(websocket: WebSocket, wall_id: Optional[str] = None):
     """
     A dedicated endpoint for JSON clients.
     """
-    await websocket.accept()
+    connection = await accept_connection(websocket, wall_id)
+    if connection is None:
+        return
     connected_websockets.append(websocket)
     try:
         while True:
             message = await websocket.receive_text()
-            await ws_json_api(websocket, message)
+            connection.messages += 1
+            connection.bytes += len(message)
+            await ws_json_api(websocket, message, wall_id)
     except WebSocketDisconnect:
         logging.info("WebSocket JSON endpoint disconnected.")
+    finally:
+        connection.close()
 
+# =============================================================================
+#  Binary frame stream for external renderers
+# =============================================================================
 
-def set_brightness(value: int):
+
+@router.websocket("/ws/frames")
+async def ws_frames_endpoint(websocket: WebSocket, wall_id: Optional[str] = None):
     """
-    Sets brightness (0-255) on all WLED controllers via /json endpoint.
+    Streams frames of an external renderer to a wall. Every binary message
+    is one frame of raw RGB bytes, 3 per LED in frame order, optionally
+    after a header with the wall id, a sequence number and a timestamp (see
+    frames.parse_frame_message). The frames are copied straight into the
+    frame buffer of the wall and sent as they arrive; frames with a sequence
+    number that is not newer than the last one are skipped. Frames are not
+    acknowledged, only invalid messages get an error.
+    """
+    connection = await accept_connection(websocket, wall_id, "none")
+    if connection is None:
+        return
+    last_sequences: Dict[str, int] = {}
+    try:
+        while (message := await connection.receive()) is not None:
+            wall = walls.get(wall_id or default_wall_id)
+            if wall is None:
+                await websocket.close(code=1008, reason=f"Unknown wall: {wall_id}")
+                break
+            data = message.get("bytes")
+            if data is None:
+                await websocket.send_text("Error: This endpoint accepts only binary frames.")
+                continue
+            try:
+                target, sequence, timestamp, rgb = parse_frame_message(data)
+                if target is not None:
+                    wall = walls.get(target)
+                    if wall is None:
+                        raise ValueError(f"Unknown wall: {target}")
+                if len(rgb) != wall.num_leds * 3:
+                    raise ValueError(f"Expected {wall.num_leds * 3} bytes of RGB for wall {wall.id}, got {len(rgb)}")
+                if sequence is not None:
+                    last = last_sequences.get(wall.id)
+                    if last is not None and not 0 < (sequence - last) % 2**32 < 2**31:
+                        connection.skipped += 1
+                        continue
+                    last_sequences[wall.id] = sequence
+                wall.push_frame(rgb, sequence, timestamp)
+                connection.frame_updates += 1
+            except ValueError as e:
+                connection.errors += 1
+                await websocket.send_text(f"Error: {e}")
+    finally:
+        connection.close()
+    logging.info(f"Frame stream disconnected after {connection.frame_updates} frames "
+                 f"({connection.skipped} out of order, {connection.errors} invalid).")
+
+
+def set_brightness(wall: Union[Wall, WallProcess], value: int):
+    """
+    Sets brightness (0-255) on all WLED controllers of a wall via /json endpoint.
     """
     payload = {"state": {"on": True, "bri": value}}
-    for ip in WLED_IPS:
+    for ip in wall.config.ips:
         try:
             requests.post(f"http://{ip}/json", json=payload, timeout=2)
             logging.info(f"Set brightness to {value} on {ip}")
@@ -1011,9 +940,10 @@ async def transfer_sync_to_async():
     """
     while True:
         try:
-            msg = sync_log_queue.get(timeout=0.1)
+            msg = sync_log_queue.get_nowait()
             await log_queue.put(msg)
         except queue.Empty:
+            # Never block the event loop, the animations run on it too
             await asyncio.sleep(0.1)
 
 
@@ -1038,5 +968,9 @@ async def broadcast_logs():
                 logging.info("Removed dead WebSocket.")
 
 
+app.include_router(router)
+app.include_router(router, prefix="/walls/{wall_id}")
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8901, reload=True)
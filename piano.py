@@ -1,7 +1,5 @@
-import socket
 import time
 import logging
-import concurrent.futures
 from typing import List, Tuple
 
 try:
@@ -10,24 +8,24 @@ except ImportError:
     print("Please install the 'keyboard' package (pip install keyboard).")
     exit(1)
 
+from config import load_config
+from frames import as_frame
+
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s %(levelname)s %(message)s")
 
-# The IPs of your four WLED controllers
-WLED_IPS = [
-    "192.168.107.123",  # Index 0 -> Top Left
-    "192.168.107.122",  # Index 1 -> Top Right
-    "192.168.107.120",  # Index 2 -> Bottom Right
-    "192.168.107.121",  # Index 3 -> Bottom Left
-]
-
-PORT = 19446             # WLED’s real-time UDP port
-LEDS_PER_CONTROLLER = 100
-WINDOWS_PER_CONTROLLER = 5
-LEDS_PER_WINDOW = LEDS_PER_CONTROLLER // WINDOWS_PER_CONTROLLER  # 20
+# The WLED controllers and their windows, from config.json (see config.py)
+CONFIG = load_config()
+WLED_IPS = CONFIG.ips
 TOTAL_CONTROLLERS = len(WLED_IPS)
-TOTAL_LEDS = LEDS_PER_CONTROLLER * TOTAL_CONTROLLERS  # 400
-BYTES_PER_LED = 3       # R, G, B
+TOTAL_LEDS = CONFIG.num_leds
+
+# Precomputed packets of every controller in its protocol, and one long-lived
+# sender; keys are handled on the keyboard thread, so the blocking threaded
+# backend stands in for asyncio
+PACKET_LAYOUT = CONFIG.create_packet_layout()
+TRANSPORT = CONFIG.create_transport(
+    PACKET_LAYOUT, "threaded" if CONFIG.settings["transport"] == "asyncio" else None)
 
 # Map each keyboard key to (controller_index, window_index)
 KEY_TO_WINDOW = {
@@ -43,43 +41,15 @@ KEY_TO_WINDOW = {
     # Bottom Right (index=2)
     'h': (2, 0), 'j': (2, 1), 'k': (2, 2), 'l': (2, 3), ';': (2, 4),
 }
-
-
-def build_packet(colors: List[Tuple[int, int, int]]) -> bytes:
-    """
-    Builds the DRGB packet (no header, just RGB bytes) for the entire LED array.
-
-    Args:
-        colors: A list of RGB tuples (0-255) representing the colors.
-
-    Returns:
-        A byte array representing the DRGB packet.
-    """
-    colors = colors[::-1]  # Reverse the order of the colors
-
-    packet = bytearray()
-    for (r, g, b) in colors:
-        packet += bytes([r, g, b])
-    return packet
-
-
-def send_packet(ip: str, port: int, packet: bytes) -> None:
-    """
-    Send a UDP packet to a specified WLED controller.
-
-    Args:
-        ip: The IP address of the WLED controller.
-        port: The port of the WLED controller.
-        packet: The DRGB packet to send.
-    """
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-        sock.sendto(packet, (ip, port))
+# Only keep the keys of windows the configured controllers have
+KEY_TO_WINDOW = {key: (controller_idx, window_idx) for key, (controller_idx, window_idx) in KEY_TO_WINDOW.items()
+                 if controller_idx < TOTAL_CONTROLLERS and window_idx < CONFIG.windows_per_controller[controller_idx]}
 
 
 def get_color_frame_for_key(key: str) -> List[Tuple[int, int, int]]:
     """
-    Build a color array of length TOTAL_LEDS (400).
-    All LEDs off (black) except the 20 LEDs corresponding to the pressed key.
+    Build a color array of length TOTAL_LEDS.
+    All LEDs off (black) except the LEDs of the window of the pressed key.
 
     Args:
         key: The keyboard key that was pressed.
@@ -97,17 +67,12 @@ def get_color_frame_for_key(key: str) -> List[Tuple[int, int, int]]:
         return colors
 
     controller_idx, window_idx = KEY_TO_WINDOW[key]
-    # The LED index range within that controller
-    start_led = window_idx * LEDS_PER_WINDOW
-    end_led = start_led + LEDS_PER_WINDOW
+    # The absolute LED range of that window in the frame
+    window = CONFIG.window_leds(controller_idx, window_idx)
 
-    # Convert the “local” controller slice to the absolute slice in the 400-LED array
-    absolute_start = controller_idx * LEDS_PER_CONTROLLER + start_led
-    absolute_end = controller_idx * LEDS_PER_CONTROLLER + end_led
-
-    # Set those 20 LEDs to white
+    # Set those LEDs to white
     new_colors = list(colors)
-    for i in range(absolute_start, absolute_end):
+    for i in range(window.start, window.stop):
         logging.debug(f"Setting LED {i} to white")
         new_colors[i] = (255, 255, 255)
 
@@ -119,24 +84,13 @@ def get_color_frame_for_key(key: str) -> List[Tuple[int, int, int]]:
 
 def send_frames_in_parallel(colors: List[Tuple[int, int, int]]) -> None:
     """
-    Slice the 400-LED color array per controller and send in parallel.
+    Build the packets of every controller and send them through the shared transport.
 
     Args:
         colors: A list of RGB tuples (0-255) representing the colors.
     """
-    with concurrent.futures.ThreadPoolExecutor(max_workers=TOTAL_CONTROLLERS) as executor:
-        futures = []
-        for idx, ip in enumerate(WLED_IPS):
-            # Slice out this controller's 100 LEDs
-            start_idx = idx * LEDS_PER_CONTROLLER
-            end_idx = start_idx + LEDS_PER_CONTROLLER
-            controller_slice = colors[start_idx:end_idx]
-            logging.debug(f"Sending to {len(controller_slice)} LEDs at {
-                          ip}: {controller_slice}")
-
-            # Build and send this subset
-            packet = build_packet(controller_slice)
-            futures.append(executor.submit(send_packet, ip, PORT, packet))
+    logging.debug(f"Sending {len(colors)} colors to {TOTAL_CONTROLLERS} controllers.")
+    TRANSPORT.send_all(PACKET_LAYOUT.build(as_frame(colors, TOTAL_LEDS)))
 
 
 def main():
@@ -169,6 +123,8 @@ def main():
             time.sleep(0.1)
     except KeyboardInterrupt:
         logging.info("Interrupted by user. Exiting...")
+    finally:
+        TRANSPORT.close()
 
 
 if __name__ == "__main__":
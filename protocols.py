@@ -0,0 +1,312 @@
+"""
+Packet encoders for the WLED realtime protocols and for DMX bridges.
+
+Every controller speaks one protocol, selected with its "protocol" key in the
+layout file:
+
+| Protocol | Port  | LEDs per packet | Packet                                        |
+| -------- | ----- | --------------- | --------------------------------------------- |
+| raw      | 19446 | 490             | RGB bytes, no header (the original protocol)  |
+| warls    | 21324 | 255             | 1, timeout, then index, R, G, B per LED       |
+| drgb     | 21324 | 490             | 2, timeout, then R, G, B per LED              |
+| drgbw    | 21324 | 367             | 3, timeout, then R, G, B, W per LED           |
+| dnrgb    | 21324 | 489             | 4, timeout, start index (16 bit), then RGB    |
+| ddp      | 4048  | 480             | 10 byte DDP header, then RGB                  |
+| e131     | 5568  | 170             | E1.31 (sACN) data packet, one DMX universe    |
+| artnet   | 6454  | 170             | Art-Net ArtDmx packet, one DMX universe       |
+
+DNRGB and DDP carry the position of their first LED, so controllers with more
+LEDs than fit in one packet are split over several; the others are limited to
+a single packet. The timeout is the number of seconds WLED stays in realtime
+mode after the last packet.
+
+E1.31 and Art-Net pack 510 channels (170 LEDs) into every universe, counting
+up from the controller's first universe, and end every frame with a sync
+packet so the bridge outputs all its universes at once. Their packets carry a
+sequence number, which the transport stamps when it actually sends them.
+
+An encoder describes the packets of one controller: how its LEDs are split,
+the headers and the constant bytes of the payload. frames.PacketLayout lays
+them out in preallocated buffers once, so encoding a frame is a single NumPy
+gather straight into the payloads.
+"""
+from typing import Dict, List, Optional, Tuple, Type
+import socket
+import struct
+import uuid
+
+import numpy as np
+
+# Seconds WLED stays in realtime mode after the last packet, well above the transport keepalive
+DEFAULT_TIMEOUT = 2
+
+
+class Encoder:
+    """
+    Packet format of a WLED realtime protocol, for one controller.
+
+    Attributes:
+        name (str): Protocol name, as used in the layout file.
+        port (int): Default UDP port of the protocol.
+        header_size (int): Bytes before the LED data of every packet.
+        channels (int): Bytes per LED.
+        color_offset (int): Byte of the red channel within an LED.
+        max_leds (int): LEDs per packet.
+        chunked (bool): Whether the LEDs may be split over several packets.
+        sequence_offset (Optional[int]): Byte of the sequence number in every
+            packet, None if the protocol has none.
+        sync_sequence_offset (Optional[int]): Byte of the sequence number in
+            the sync packet.
+        first_universe (int): Default first universe of the DMX protocols.
+    """
+
+    name = ""
+    port = 21324
+    header_size = 2
+    channels = 3
+    color_offset = 0
+    max_leds = 490
+    chunked = False
+    sequence_offset: Optional[int] = None
+    sync_sequence_offset: Optional[int] = None
+    first_universe = 0
+
+    def __init__(self, timeout: int = DEFAULT_TIMEOUT, universe: Optional[int] = None, sync: bool = False):
+        """
+        Args:
+            timeout (int): Seconds WLED stays in realtime mode after a packet (1-255).
+            universe (Optional[int]): First DMX universe, None for the protocol's default.
+            sync (bool): Output the frame on a separate sync packet only, where
+                the protocol has one (DDP's push flag; E1.31 and Art-Net
+                always end the frame with a sync packet).
+        """
+        self.timeout = timeout
+        self.universe = self.first_universe if universe is None else universe
+        self.sync = sync
+
+    def chunks(self, leds: int) -> List[Tuple[int, int]]:
+        """
+        Returns the (start, count) of the LEDs of every packet of a controller
+        with the given number of LEDs.
+        """
+        if leds > self.max_leds and not self.chunked:
+            raise ValueError(f"The {self.name} protocol carries at most {self.max_leds} LEDs, got {leds}; "
+                             f"use dnrgb or ddp for larger controllers")
+        if not leds:
+            return [(0, 0)]
+        return [(start, min(self.max_leds, leds - start)) for start in range(0, leds, self.max_leds)]
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        """
+        Returns the header of the packet carrying count LEDs from LED start on.
+        """
+        raise NotImplementedError
+
+    def trailer(self, count: int) -> bytes:
+        """
+        Returns the constant bytes after the LED data of a packet of count LEDs.
+        """
+        return b""
+
+    def fill(self, payload: np.ndarray, start: int) -> None:
+        """
+        Writes the constant bytes of a packet's (count, channels) payload,
+        around the colors.
+        """
+
+    def sync_packet(self) -> Optional[bytes]:
+        """
+        Returns the packet sent after the controller's other packets to make
+        it output them all at once, or None if the protocol has none.
+        """
+        return None
+
+
+class RawEncoder(Encoder):
+    """Headerless RGB, as accepted on WLED's port 19446."""
+
+    name = "raw"
+    port = 19446
+    header_size = 0
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        return b""
+
+
+class WarlsEncoder(Encoder):
+    """WARLS: an index byte before every LED."""
+
+    name = "warls"
+    channels = 4
+    color_offset = 1
+    max_leds = 255
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        return bytes([1, self.timeout])
+
+    def fill(self, payload: np.ndarray, start: int) -> None:
+        payload[:, 0] = np.arange(start, start + len(payload))
+
+
+class DrgbEncoder(Encoder):
+    """DRGB: RGB from the first LED on."""
+
+    name = "drgb"
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        return bytes([2, self.timeout])
+
+
+class DrgbwEncoder(Encoder):
+    """DRGBW: RGBW from the first LED on, with the white channel left off."""
+
+    name = "drgbw"
+    channels = 4
+    max_leds = 367
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        return bytes([3, self.timeout])
+
+
+class DnrgbEncoder(Encoder):
+    """DNRGB: RGB from a 16-bit start index on."""
+
+    name = "dnrgb"
+    header_size = 4
+    max_leds = 489
+    chunked = True
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        return bytes([4, self.timeout]) + start.to_bytes(2, "big")
+
+
+class DdpEncoder(Encoder):
+    """
+    DDP: RGB at a byte offset. The controller only shows the LEDs once the
+    packet with the push flag comes in: the last one of the frame or, with
+    sync, a separate push packet without data.
+    """
+
+    name = "ddp"
+    port = 4048
+    header_size = 10
+    max_leds = 480
+    chunked = True
+
+    VERSION_1 = 0x40
+    PUSH = 0x01
+    TYPE_RGB24 = 0x0B
+    DESTINATION_DISPLAY = 0x01
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        # The sequence number is left at 0 (unused), so unchanged packets stay identical
+        flags = self.VERSION_1 | (self.PUSH if last and not self.sync else 0)
+        return (bytes([flags, 0, self.TYPE_RGB24, self.DESTINATION_DISPLAY]) +
+                (start * 3).to_bytes(4, "big") + (count * 3).to_bytes(2, "big"))
+
+    def sync_packet(self) -> Optional[bytes]:
+        if not self.sync:
+            return None
+        return bytes([self.VERSION_1 | self.PUSH, 0, self.TYPE_RGB24, self.DESTINATION_DISPLAY]) + bytes(6)
+
+
+# Identifies this program as an E1.31 source; stable across restarts on the same host
+E131_CID = uuid.uuid5(uuid.NAMESPACE_DNS, f"ledcontroller.{socket.gethostname()}").bytes
+E131_SOURCE_NAME = b"LedController"
+
+
+class E131Encoder(Encoder):
+    """
+    E1.31 (streaming ACN): one data packet per universe, then a universe
+    synchronization packet on the controller's first universe.
+    """
+
+    name = "e131"
+    port = 5568
+    header_size = 126
+    max_leds = 170
+    chunked = True
+    sequence_offset = 111
+    sync_sequence_offset = 44
+    first_universe = 1
+
+    PRIORITY = 100
+    ACN_IDENTIFIER = b"ASC-E1.17\0\0\0"
+    VECTOR_ROOT_DATA = 0x04
+    VECTOR_ROOT_EXTENDED = 0x08
+    VECTOR_FRAMING_DATA = 0x02
+    VECTOR_FRAMING_SYNC = 0x01
+    VECTOR_DMP_SET_PROPERTY = 0x02
+
+    def _root(self, length: int, vector: int) -> bytes:
+        return struct.pack("!HH12sHI16s", 0x0010, 0, self.ACN_IDENTIFIER, 0x7000 | (length - 16), vector, E131_CID)
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        slots = count * 3
+        length = self.header_size + slots
+        framing = struct.pack("!HI64sBHBBH", 0x7000 | (length - 38), self.VECTOR_FRAMING_DATA,
+                              E131_SOURCE_NAME, self.PRIORITY, self.universe, 0, 0,
+                              self.universe + start // self.max_leds)
+        dmp = struct.pack("!HBBHHHB", 0x7000 | (length - 115), self.VECTOR_DMP_SET_PROPERTY,
+                          0xA1, 0, 1, slots + 1, 0)
+        return self._root(length, self.VECTOR_ROOT_DATA) + framing + dmp
+
+    def sync_packet(self) -> Optional[bytes]:
+        framing = struct.pack("!HIBHH", 0x7000 | (49 - 38), self.VECTOR_FRAMING_SYNC, 0, self.universe, 0)
+        return self._root(49, self.VECTOR_ROOT_EXTENDED) + framing
+
+
+class ArtNetEncoder(Encoder):
+    """
+    Art-Net: one ArtDmx packet per universe (15-bit port address), then an
+    ArtSync packet.
+    """
+
+    name = "artnet"
+    port = 6454
+    header_size = 18
+    max_leds = 170
+    chunked = True
+    sequence_offset = 12
+
+    ID = b"Art-Net\0"
+    OP_DMX = 0x5000
+    OP_SYNC = 0x5200
+    PROTOCOL_VERSION = 14
+
+    def header(self, start: int, count: int, last: bool) -> bytes:
+        address = self.universe + start // self.max_leds
+        # The data length must be even, see trailer()
+        length = count * 3 + count % 2
+        return self.ID + struct.pack("<H", self.OP_DMX) + struct.pack(
+            "!HBBBBH", self.PROTOCOL_VERSION, 0, 0, address & 0xFF, (address >> 8) & 0x7F, length)
+
+    def trailer(self, count: int) -> bytes:
+        return b"\0" * (count % 2)
+
+    def sync_packet(self) -> Optional[bytes]:
+        return self.ID + struct.pack("<H", self.OP_SYNC) + struct.pack("!HBB", self.PROTOCOL_VERSION, 0, 0)
+
+
+ENCODERS: Dict[str, Type[Encoder]] = {
+    encoder.name: encoder
+    for encoder in (RawEncoder, WarlsEncoder, DrgbEncoder, DrgbwEncoder, DnrgbEncoder, DdpEncoder,
+                    E131Encoder, ArtNetEncoder)
+}
+PROTOCOLS = tuple(ENCODERS)
+
+
+def create_encoder(protocol: str, timeout: int = DEFAULT_TIMEOUT, universe: Optional[int] = None,
+                   sync: bool = False) -> Encoder:
+    """
+    Creates the encoder of the given protocol for a controller.
+
+    Args:
+        protocol (str): One of PROTOCOLS.
+        timeout (int): Realtime timeout in seconds, for the protocols that carry one.
+        universe (Optional[int]): First universe, for the DMX protocols.
+        sync (bool): Output frames on a separate sync packet, see Encoder.
+    """
+    if protocol not in ENCODERS:
+        raise ValueError(f"Unknown protocol {protocol!r}, expected one of {list(PROTOCOLS)}")
+    return ENCODERS[protocol](timeout, universe, sync)
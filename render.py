@@ -0,0 +1,330 @@
+"""
+Render scheduler driving the LED wall from a single asyncio task.
+
+Every animation mode is a FrameSource. The scheduler ticks on a monotonic
+deadline clock, asks the active source for the next frame and sends it, so
+switching modes only swaps the source instead of stopping a sender loop.
+"""
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import threading
+import time
+
+import numpy as np
+
+from frames import Frame
+
+
+class TimingStat:
+    """
+    Running count, average and maximum of a duration.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        """Returns the average and maximum in milliseconds."""
+        return {
+            "avg_ms": round(self.total / max(self.count, 1) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class LatencyStat:
+    """
+    Count and percentiles of the most recent durations, e.g. from an input
+    event to its packets being sent.
+    """
+
+    # Number of recent durations the percentiles are computed over
+    WINDOW = 1000
+
+    def __init__(self):
+        self.count = 0
+        self._recent: deque = deque(maxlen=self.WINDOW)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self._recent.append(seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        """Returns the count and the p50, p99 and maximum in microseconds."""
+        recent = np.array(self._recent) * 1e6 if self._recent else np.zeros(1)
+        return {
+            "count": self.count,
+            "p50_us": round(float(np.percentile(recent, 50)), 1),
+            "p99_us": round(float(np.percentile(recent, 99)), 1),
+            "max_us": round(float(recent.max()), 1),
+        }
+
+
+class PlaybackClock:
+    """
+    Absolute per-frame deadlines for media played at a fixed frame rate.
+
+    Frame n is due at start + n * frame_ns on the monotonic clock, so a slow
+    frame never shifts the rest of the timeline and wall-clock jumps have no
+    effect. When playback falls behind, frames_behind() tells how many frames
+    to drop to get back on schedule.
+    """
+
+    def __init__(self, fps: float):
+        self.frame_ns = round(1e9 / fps)
+        self.start_ns = time.monotonic_ns()
+        self.position = 0  # index of the next frame to present
+        self.dropped_frames = 0
+        self.late_frames = 0
+
+    def deadline_ns(self, index: int) -> int:
+        """Returns the time at which frame index is due."""
+        return self.start_ns + index * self.frame_ns
+
+    def due_index(self, now_ns: int) -> int:
+        """Returns the index of the frame that should be on the wall at now_ns."""
+        return (now_ns - self.start_ns) // self.frame_ns
+
+    def frames_behind(self, now_ns: int) -> int:
+        """Returns how many frames are overdue and should be dropped."""
+        return max(self.due_index(now_ns) - self.position, 0)
+
+    def drop(self, count: int) -> None:
+        """Skips count frames."""
+        self.position += count
+        self.dropped_frames += count
+
+    def presented(self, now_ns: int) -> None:
+        """Marks the current frame as sent, counting it as late if it missed its slot."""
+        if now_ns >= self.deadline_ns(self.position + 1):
+            self.late_frames += 1
+        self.position += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "dropped_frames": self.dropped_frames,
+            "late_frames": self.late_frames,
+        }
+
+
+class FrameSource:
+    """
+    A mode producing frames for the render scheduler.
+
+    Attributes:
+        name (str): Name reported in the stats and /info.
+        fps (Optional[float]): Tick rate wanted by the source, or None to use
+            the scheduler's default rate.
+    """
+
+    name = ""
+    fps: Optional[float] = None
+
+    async def next_frame(self) -> Optional[Frame]:
+        """
+        Returns the frame for the current tick, or None when the source has finished.
+        """
+        raise NotImplementedError
+
+    def next_deadline_ns(self) -> Optional[int]:
+        """
+        Returns the monotonic time at which the next frame is due, or None to
+        tick at a fixed interval.
+        """
+        return None
+
+    def close(self) -> None:
+        """
+        Releases the source's resources. Must not block the event loop.
+        """
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns source specific counters for /stats.
+        """
+        return {}
+
+
+class FunctionSource(FrameSource):
+    """
+    A source whose frames come from a plain function, e.g. a static scene
+    that has to be resent periodically to keep WLED in realtime mode.
+    """
+
+    def __init__(self, name: str, fps: Optional[float], render: Callable[[], Frame]):
+        self.name = name
+        self.fps = fps
+        self.render = render
+
+    async def next_frame(self) -> Optional[Frame]:
+        return self.render()
+
+
+def _spin_until(deadline_ns: int, abort: threading.Event) -> None:
+    """Waits for a monotonic deadline or abort, releasing the GIL between checks."""
+    while time.monotonic_ns() < deadline_ns and not abort.is_set():
+        time.sleep(0)
+
+
+class RenderScheduler:
+    """
+    Sends the frames of the active FrameSource at the source's rate (or the
+    default rate) from a single loop, tracking render time, send time and
+    lateness of every tick.
+    """
+
+    # With precise sleeping, the last part of every wait is spent spinning on a worker thread
+    SPIN_NS = 2_000_000
+
+    def __init__(self, send: Callable[[Frame], Awaitable[None]], fps: float, clear_frame: Frame,
+                 precise_sleep: bool = False):
+        """
+        Args:
+            send (Callable[[Frame], Awaitable[None]]): Coroutine sending a frame to the wall.
+            fps (float): Default tick rate for sources that do not set their own.
+            clear_frame (Frame): Frame sent when a source finishes by itself.
+            precise_sleep (bool): If True, spin for the last SPIN_NS of every
+                wait to hit deadlines to within tens of microseconds instead
+                of the ~1ms resolution of the event loop's timers. The spin
+                runs on a worker thread, so the event loop keeps running.
+        """
+        self.send = send
+        self.fps = fps
+        self.clear_frame = clear_frame
+        self.precise_sleep = precise_sleep
+        self.source: Optional[FrameSource] = None
+        self._wake = asyncio.Event()
+        # Ends the spin of a precise sleep on its thread early
+        self._spin_abort = threading.Event()
+
+        self.ticks = 0
+        self.late_ticks = 0
+        self.resyncs = 0
+        self.render_time = TimingStat()
+        self.send_time = TimingStat()
+        self.lateness = TimingStat()
+
+    def set_source(self, source: Optional[FrameSource]) -> None:
+        """
+        Makes source the active source (None to idle) and closes the previous
+        one. The new source renders its first frame right away.
+        """
+        previous, self.source = self.source, source
+        if previous is not None and previous is not source:
+            previous.close()
+        self._wake.set()
+        self._spin_abort.set()
+
+    def is_active(self, name: str) -> bool:
+        """
+        Returns True if the active source has the given name.
+        """
+        return self.source is not None and self.source.name == name
+
+    async def _sleep_until(self, deadline_ns: int) -> bool:
+        """
+        Sleeps until the deadline or until the source is switched.
+
+        Returns:
+            bool: True if woken up by a source switch.
+        """
+        spin_ns = self.SPIN_NS if self.precise_sleep else 0
+        self._wake.clear()
+        try:
+            timeout = max(deadline_ns - spin_ns - time.monotonic_ns(), 0) / 1e9
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            return True
+        if spin_ns and time.monotonic_ns() < deadline_ns:
+            self._spin_abort.clear()
+            try:
+                await asyncio.to_thread(_spin_until, deadline_ns, self._spin_abort)
+            except asyncio.CancelledError:
+                self._spin_abort.set()
+                raise
+            return self._spin_abort.is_set()
+        return False
+
+    async def run(self) -> None:
+        """
+        The render loop; runs until cancelled.
+        """
+        deadline = time.monotonic_ns()
+        while True:
+            source = self.source
+            if source is None:
+                self._wake.clear()
+                await self._wake.wait()
+                deadline = time.monotonic_ns()
+                continue
+
+            tick_start = time.monotonic_ns()
+            lateness = tick_start - deadline
+            try:
+                frame = await source.next_frame()
+            except Exception as e:
+                logging.error(f"Render source {source.name} failed => {e}")
+                frame = None
+            if source is not self.source:
+                # Switched while rendering; the new source starts right away
+                deadline = time.monotonic_ns()
+                continue
+            if frame is None:
+                logging.info(f"Render source {source.name} finished.")
+                self.set_source(None)
+                await self.send(self.clear_frame)
+                continue
+
+            rendered = time.monotonic_ns()
+            await self.send(frame)
+            sent = time.monotonic_ns()
+
+            self.ticks += 1
+            self.render_time.add((rendered - tick_start) / 1e9)
+            self.send_time.add((sent - rendered) / 1e9)
+            self.lateness.add(lateness / 1e9)
+            if lateness > 1_000_000:
+                self.late_ticks += 1
+
+            source_deadline = source.next_deadline_ns()
+            if source_deadline is not None:
+                # The source keeps its own timeline (and drops frames when late)
+                deadline = source_deadline
+            else:
+                interval = round(1e9 / (source.fps or self.fps))
+                deadline += interval
+                if sent - deadline > interval:
+                    # More than a tick behind: skip ahead instead of bursting to catch up
+                    self.resyncs += 1
+                    deadline = sent
+            if source is not self.source:
+                deadline = time.monotonic_ns()
+                continue
+            if await self._sleep_until(deadline):
+                deadline = time.monotonic_ns()
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns the active source and the per-tick timing stats.
+        """
+        return {
+            "source": self.source.name if self.source else None,
+            "fps": self.source.fps or self.fps if self.source else None,
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "resyncs": self.resyncs,
+            "render_time": self.render_time.as_dict(),
+            "send_time": self.send_time.as_dict(),
+            "lateness": self.lateness.as_dict(),
+            "source_stats": self.source.stats() if self.source else {},
+        }
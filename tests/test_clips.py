@@ -0,0 +1,83 @@
+"""
+Tests of the compiled LED clip files.
+"""
+import os
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+from clips import (HEADER, HEADER_SIZE, MAGIC, VERSION, LedClip, compile_clip, compile_progress, open_clip,
+                   refresh_clip)
+from config import Config
+from layout import VideoSampler
+
+FRAMES = 6
+
+
+@pytest.fixture
+def sampler():
+    config = Config({"rows": 1, "cols": 5, "controllers": [{"ip": "10.0.0.1", "origin": [0, 0]}]}, environ={})
+    return VideoSampler(config.layout)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / "test.avi")
+    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"MJPG"), 10, (64, 32))
+    for i in range(FRAMES):
+        writer.write(np.full((32, 64, 3), i * 40, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_header_round_trip(sampler, video, tmp_path):
+    clip_path = compile_clip(video, sampler, str(tmp_path / "test.ledclip"))
+    clip = LedClip(clip_path)
+    st = os.stat(video)
+    assert (clip.fps, clip.grid_rows, clip.grid_cols, clip.num_leds) == (10, 1, 5, 100)
+    assert clip.frame_count == FRAMES
+    assert (clip.source_size, clip.source_mtime) == (st.st_size, st.st_mtime_ns)
+    assert clip.mapping_hash == sampler.digest()
+    assert os.path.getsize(clip_path) == HEADER_SIZE + FRAMES * 100 * 3
+    assert clip.frames.shape == (FRAMES, 100, 3)
+
+    cap = cv.VideoCapture(video)
+    expected = [sampler.read(cap) for _ in range(FRAMES)]
+    cap.release()
+    assert np.array_equal(clip.frames, np.stack(expected))
+    assert open_clip(video, sampler, clip_path) is not None
+    assert compile_progress(clip_path) is None
+
+
+def test_header_is_padded(sampler, video, tmp_path):
+    clip_path = compile_clip(video, sampler, str(tmp_path / "test.ledclip"))
+    with open(clip_path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    assert header.startswith(MAGIC) and HEADER.unpack_from(header)[1] == VERSION
+    assert header[HEADER.size:] == bytes(HEADER_SIZE - HEADER.size)
+
+
+def test_other_versions_are_rejected(sampler, video, tmp_path):
+    clip_path = compile_clip(video, sampler, str(tmp_path / "test.ledclip"))
+    with open(clip_path, "r+b") as f:
+        f.write(b"LEDCLIP2")
+    with pytest.raises(ValueError):
+        LedClip(clip_path)
+    assert open_clip(video, sampler, clip_path) is None
+
+
+def test_touched_video_is_revalidated(sampler, video, tmp_path):
+    clip_path = compile_clip(video, sampler, str(tmp_path / "test.ledclip"))
+    st = os.stat(video)
+    os.utime(video, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert open_clip(video, sampler, clip_path) is None
+    assert refresh_clip(video, sampler, clip_path) is False
+    assert LedClip(clip_path).source_mtime == os.stat(video).st_mtime_ns
+    assert open_clip(video, sampler, clip_path) is not None
+
+
+def test_other_mapping_is_not_used(video, tmp_path):
+    config = Config({"rows": 1, "cols": 5, "controllers": [{"ip": "10.0.0.1", "origin": [0, 0]}]}, environ={})
+    clip_path = compile_clip(video, VideoSampler(config.layout), str(tmp_path / "test.ledclip"))
+    assert open_clip(video, VideoSampler(config.layout, per_led=True), clip_path) is None
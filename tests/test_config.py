@@ -0,0 +1,86 @@
+"""
+Tests of the config parsing, validation and LED_<NAME> overrides.
+"""
+import json
+
+import pytest
+
+from config import DEFAULT_WALL, SETTINGS, Config, load_walls, parse_walls
+
+
+def wall(*ips, **extra):
+    return {"rows": 1, "cols": 5 * len(ips),
+            "controllers": [{"ip": ip, "origin": [0, 5 * i]} for i, ip in enumerate(ips)], **extra}
+
+
+def test_defaults():
+    config = Config(wall("10.0.0.1", "10.0.0.2"), environ={})
+    assert config.settings == SETTINGS
+    assert config.num_leds == 200
+    assert config.window_offsets.tolist() == [0, 5]
+    assert config.window_leds(1, 2) == slice(140, 160)
+
+
+def test_settings_from_the_file_and_the_environment():
+    data = wall("10.0.0.1", settings={"transport": "batch", "render_fps": 60})
+    config = Config(data, environ={"LED_RENDER_FPS": "24", "LED_SYNC": "off", "LED_KEEPALIVE": "0"})
+    assert config.settings["transport"] == "batch"
+    assert config.settings["render_fps"] == 24.0
+    assert config.settings["sync"] is False
+    assert config.settings["keepalive"] == 0.0
+
+
+@pytest.mark.parametrize("data, environ, message", [
+    (wall("10.0.0.1", settings={"colour": 1}), {}, "unknown settings"),
+    (wall("10.0.0.1"), {"LED_SYNC": "maybe"}, "must be a boolean"),
+    (wall("10.0.0.1"), {"LED_RENDER_FPS": "fast"}, "must be a float"),
+    (wall("10.0.0.1"), {"LED_RENDER_FPS": "0"}, "must be positive"),
+    (wall("10.0.0.1"), {"LED_TRANSPORT": "carrier-pigeon"}, "unknown transport"),
+    (wall("10.0.0.1", "10.0.0.1"), {}, "listed twice"),
+    (wall("10.0.0.256"), {}, "invalid IP address"),
+    ({"controllers": []}, {}, "no controllers"),
+])
+def test_invalid_configs(data, environ, message):
+    with pytest.raises(ValueError, match=message):
+        Config(data, "test.json", environ)
+
+
+def test_single_wall_file():
+    walls = parse_walls(wall("10.0.0.1"), environ={})
+    assert list(walls) == [DEFAULT_WALL]
+
+
+def test_walls_share_the_top_level_defaults():
+    data = {"leds": 50, "settings": {"transport": "batch", "sync": False},
+            "walls": {"shop": wall("10.0.0.1"), "window": wall("10.0.0.2", settings={"sync": True})}}
+    walls = parse_walls(data, environ={"LED_RENDER_FPS": "50"})
+    assert list(walls) == ["shop", "window"]
+    assert walls["shop"].num_leds == 50
+    assert walls["shop"].settings["sync"] is False and walls["window"].settings["sync"] is True
+    assert all(config.settings["transport"] == "batch" and config.settings["render_fps"] == 50.0
+               for config in walls.values())
+
+
+def test_walls_cannot_share_controllers():
+    data = {"walls": {"shop": wall("10.0.0.1"), "window": wall("10.0.0.1")}}
+    with pytest.raises(ValueError, match="on walls shop and window"):
+        parse_walls(data, environ={})
+
+
+def test_load_walls_reads_json_and_toml(tmp_path):
+    json_path = tmp_path / "config.json"
+    json_path.write_text(json.dumps(wall("10.0.0.1")))
+    assert load_walls(str(json_path))[DEFAULT_WALL].ips == ["10.0.0.1"]
+    toml_path = tmp_path / "config.toml"
+    toml_path.write_text('rows = 1\ncols = 5\n[[controllers]]\nip = "10.0.0.3"\norigin = [0, 0]\n')
+    assert load_walls(str(toml_path))[DEFAULT_WALL].ips == ["10.0.0.3"]
+
+
+def test_precise_sleep_sharing_a_process_is_a_warning(caplog):
+    data = {"walls": {"shop": wall("10.0.0.1", settings={"precise_sleep": True}), "window": wall("10.0.0.2")}}
+    assert parse_walls(data, environ={})["shop"].settings["precise_sleep"] is True
+    assert "precise_sleep on wall shop shares a process" in caplog.text
+    caplog.clear()
+    data["walls"]["shop"]["settings"]["worker_process"] = True
+    parse_walls(data, environ={})
+    assert not caplog.text
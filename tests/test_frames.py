@@ -0,0 +1,100 @@
+"""
+Tests of the frame helpers: packet building, the legacy hex payloads and
+binary frame messages.
+"""
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+
+from frames import (FRAME_HEADER, FRAME_MAGIC, PacketLayout, as_frame, parse_frame_message,
+                    parse_hex_differences, parse_hex_frame)
+from wall import hex_to_rgb
+
+
+def legacy_build_packet(colors: List[Tuple[int, int, int]]) -> bytes:
+    """The original per-LED builder of the raw protocol."""
+    packet = bytearray()
+    for (r, g, b) in colors[::-1]:
+        packet += bytes([r, g, b])
+    return bytes(packet)
+
+
+def random_frame(num_leds: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (num_leds, 3), dtype=np.uint8)
+
+
+def test_raw_packets_match_legacy_builder():
+    layout = PacketLayout([100, 100])
+    frame = random_frame(200)
+    colors = [tuple(color) for color in frame.tolist()]
+    assert [bytes(packet) for packet in layout.build(frame)] == [
+        legacy_build_packet(colors[:100]), legacy_build_packet(colors[100:])]
+
+
+def test_packet_layout_keeps_unreversed_controllers():
+    frame = random_frame(20)
+    packets = PacketLayout([10, 10], reverse=[False, True]).build(frame)
+    assert bytes(packets[0]) == frame[:10].tobytes()
+    assert bytes(packets[1]) == frame[10:][::-1].tobytes()
+
+
+def test_as_frame_pads_and_truncates():
+    assert as_frame([(1, 2, 3)], 3).tolist() == [[1, 2, 3], [0, 0, 0], [0, 0, 0]]
+    assert as_frame(np.ones((5, 3), dtype=np.uint8), 2).shape == (2, 3)
+
+
+def test_parse_hex_frame_matches_hex_to_rgb():
+    colors = ["ff8040", "00FF00", "0a0b0c", "000000"]
+    frame = parse_hex_frame(", ".join(colors).encode())
+    assert frame.tolist() == [list(hex_to_rgb(color)) for color in colors]
+    assert frame.flags.writeable
+
+
+@pytest.mark.parametrize("payload", [b"", b"ff8040,00ff00", b"ff8040, 00ff0", b"ff8040, 00ffzz", b"ff80400, 00ff00"])
+def test_parse_hex_frame_rejects_other_formats(payload):
+    with pytest.raises(ValueError):
+        parse_hex_frame(payload)
+
+
+def test_parse_hex_differences_matches_hex_to_rgb():
+    indices, colors = parse_hex_differences(b"(23, ff8040), (5, 00ff00)")
+    assert indices.tolist() == [23, 5]
+    assert colors.tolist() == [list(hex_to_rgb("ff8040")), list(hex_to_rgb("00ff00"))]
+    indices, colors = parse_hex_differences(b"7, 0a0b0c")
+    assert indices.tolist() == [7] and colors.tolist() == [[10, 11, 12]]
+
+
+@pytest.mark.parametrize("payload", [b"(1, ff0000), (2)", b"(x, ff0000)", b"(-1, ff0000)", b"(1, fff)", b"(1, ff00001)"])
+def test_parse_hex_differences_rejects_other_formats(payload):
+    with pytest.raises(ValueError):
+        parse_hex_differences(payload)
+
+
+def test_parse_frame_message_bare():
+    wall_id, sequence, timestamp, rgb = parse_frame_message(bytes(range(12)))
+    assert (wall_id, sequence, timestamp) == (None, None, None)
+    assert bytes(rgb) == bytes(range(12))
+
+
+def test_parse_frame_message_header():
+    rgb = bytes(range(12))
+    message = FRAME_HEADER.pack(FRAME_MAGIC, 7, 123456, 4) + b"shop" + rgb
+    wall_id, sequence, timestamp, data = parse_frame_message(message)
+    assert (wall_id, sequence, timestamp, bytes(data)) == ("shop", 7, 123456, rgb)
+    message = FRAME_HEADER.pack(FRAME_MAGIC, 8, 0, 0) + rgb
+    assert parse_frame_message(message)[0] is None
+
+
+def test_parse_frame_message_checks_the_magic_before_the_size():
+    # As long as a bare frame of 4 LEDs, but the header says it is a frame of 1 LED for another wall
+    message = FRAME_HEADER.pack(FRAME_MAGIC, 1, 0, 1) + b"w" + bytes(3)
+    assert len(message) == 21
+    wall_id, _, _, rgb = parse_frame_message(message)
+    assert wall_id == "w" and len(rgb) == 3
+
+
+@pytest.mark.parametrize("message", [FRAME_MAGIC + bytes(5), FRAME_HEADER.pack(FRAME_MAGIC, 1, 0, 9) + b"ab"])
+def test_parse_frame_message_rejects_truncated_headers(message):
+    with pytest.raises(ValueError):
+        parse_frame_message(message)
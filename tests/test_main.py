@@ -0,0 +1,67 @@
+"""
+Tests of the API routes, on a config of two walls of different sizes.
+"""
+import json
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from frames import FRAME_HEADER, FRAME_MAGIC
+
+# 100 LEDs per controller: shop has 100 LEDs, window 200
+CONFIG = {"rows": 1, "cols": 10, "walls": {
+    "shop": {"controllers": [{"ip": "127.0.0.1", "origin": [0, 0]}]},
+    "window": {"controllers": [{"ip": "127.0.0.2", "origin": [0, 0]}, {"ip": "127.0.0.3", "origin": [0, 5]}]},
+}}
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    path = tmp_path_factory.mktemp("config") / "config.json"
+    path.write_text(json.dumps(CONFIG))
+    previous = os.environ.get("LED_CONFIG")
+    os.environ["LED_CONFIG"] = str(path)
+    try:
+        import main
+        with TestClient(main.app) as client:
+            yield client
+    finally:
+        if previous is None:
+            del os.environ["LED_CONFIG"]
+        else:
+            os.environ["LED_CONFIG"] = previous
+
+
+def header(wall_id: str, sequence: int) -> bytes:
+    return FRAME_HEADER.pack(FRAME_MAGIC, sequence, 0, len(wall_id)) + wall_id.encode()
+
+
+def wait_for_frame(client: TestClient, path: str, color: int) -> bool:
+    for _ in range(100):
+        if client.get(path).json()["frame"][0] == [color] * 3:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_frame_stream_checks_the_size_of_the_target_wall(client):
+    with client.websocket_connect("/ws/frames") as websocket:
+        # A frame for window, on a connection of shop
+        websocket.send_bytes(header("window", 1) + bytes([7]) * 600)
+        assert wait_for_frame(client, "/walls/window/frame", 7)
+
+        # As long as a bare frame of shop, but window needs 600 bytes
+        message = header("window", 2)
+        message += bytes([8]) * (300 - len(message))
+        assert len(message) == 300
+        websocket.send_bytes(message)
+        assert websocket.receive_text() == "Error: Expected 600 bytes of RGB for wall window, got 277"
+
+        websocket.send_bytes(header("shop", 1) + bytes([9]) * 600)
+        assert websocket.receive_text() == "Error: Expected 300 bytes of RGB for wall shop, got 600"
+
+        websocket.send_bytes(bytes([5]) * 300)
+        assert wait_for_frame(client, "/walls/shop/frame", 5)
+        assert client.get("/walls/window/frame").json()["frame"][0] == [7] * 3
@@ -0,0 +1,66 @@
+"""
+Tests of the protocol encoders against a reference that encodes every LED
+one by one.
+"""
+from typing import List
+
+import numpy as np
+import pytest
+
+from frames import PacketLayout
+from protocols import ENCODERS, PROTOCOLS, create_encoder
+
+
+def reference_packets(leds_per_controller: List[int], protocol: str, frame: np.ndarray,
+                      sync: bool = False) -> List[bytes]:
+    """
+    Encodes a frame LED by LED, in the order PacketLayout sends the packets.
+    """
+    packets, syncs = [], []
+    offset = 0
+    for leds in leds_per_controller:
+        encoder = create_encoder(protocol, sync=sync)
+        colors = [tuple(color) for color in frame[offset:offset + leds].tolist()][::-1]
+        offset += leds
+        chunks = encoder.chunks(leds)
+        for n, (start, count) in enumerate(chunks):
+            payload = bytearray()
+            for i, (r, g, b) in enumerate(colors[start:start + count]):
+                if protocol == "warls":
+                    payload += bytes([start + i, r, g, b])
+                elif protocol == "drgbw":
+                    payload += bytes([r, g, b, 0])
+                else:
+                    payload += bytes([r, g, b])
+            packets.append(encoder.header(start, count, n == len(chunks) - 1) + payload + encoder.trailer(count))
+        sync_packet = encoder.sync_packet()
+        if sync_packet is not None:
+            (syncs if sync else packets).append(sync_packet)
+    return packets + syncs
+
+
+def random_frame(num_leds: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (num_leds, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("protocol", PROTOCOLS)
+@pytest.mark.parametrize("sync", [False, True])
+def test_packet_layout_matches_reference(protocol, sync):
+    encoder = ENCODERS[protocol]
+    leds = [100, 37, 1000, 100] if encoder.chunked else [100, 37, encoder.max_leds, 100]
+    layout = PacketLayout(leds, protocols=[protocol] * len(leds), sync=sync)
+    for seed in range(2):  # The second build reuses the buffers of the first
+        frame = random_frame(sum(leds), seed)
+        packets = [bytes(packet) for packet in layout.build(frame)]
+        assert packets == reference_packets(leds, protocol, frame, sync)
+
+
+def test_packet_headers():
+    frame = random_frame(600)
+    drgb, = PacketLayout([100], protocols=["drgb"]).build(frame[:100])
+    assert drgb[:2] == bytes([2, 2])
+    dnrgb = PacketLayout([600], protocols=["dnrgb"]).build(frame)
+    assert [bytes(packet[:4]) for packet in dnrgb] == [bytes([4, 2, 0, 0]), bytes([4, 2, 489 >> 8, 489 & 0xFF])]
+    ddp = PacketLayout([600], protocols=["ddp"]).build(frame)
+    assert [packet[0] for packet in ddp] == [0x40, 0x41]  # Push on the last packet
+    assert int.from_bytes(ddp[1][4:8], "big") == 480 * 3
@@ -0,0 +1,60 @@
+"""
+Tests of the render scheduler's precise sleep.
+"""
+import asyncio
+import time
+
+import numpy as np
+
+from render import RenderScheduler
+
+
+async def send(frame):
+    pass
+
+
+def scheduler() -> RenderScheduler:
+    scheduler = RenderScheduler(send, 30, np.zeros((1, 3), dtype=np.uint8), precise_sleep=True)
+    scheduler.SPIN_NS = 10_000_000_000  # Spin for the whole wait
+    return scheduler
+
+
+def test_precise_sleep_reaches_the_deadline():
+    async def run():
+        deadline = time.monotonic_ns() + 20_000_000
+        woken = await scheduler()._sleep_until(deadline)
+        return woken, time.monotonic_ns() - deadline
+
+    woken, late_ns = asyncio.run(run())
+    assert not woken and 0 <= late_ns < 10_000_000
+
+
+def test_source_switch_ends_the_spin():
+    async def run():
+        spinning = scheduler()
+        asyncio.get_running_loop().call_later(0.05, spinning.set_source, None)
+        start = time.monotonic()
+        woken = await spinning._sleep_until(time.monotonic_ns() + 2_000_000_000)
+        return woken, time.monotonic() - start
+
+    woken, elapsed = asyncio.run(run())
+    assert woken and elapsed < 1
+
+
+def test_cancelling_the_loop_ends_the_spin():
+    async def run():
+        spinning = scheduler()
+        task = asyncio.create_task(spinning._sleep_until(time.monotonic_ns() + 2_000_000_000))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        start = time.monotonic()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return spinning._spin_abort.is_set(), time.monotonic() - start
+
+    # asyncio.run() waits for the spinning thread when it shuts down the default executor
+    start = time.monotonic()
+    aborted, _ = asyncio.run(run())
+    assert aborted and time.monotonic() - start < 1
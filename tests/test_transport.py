@@ -0,0 +1,158 @@
+"""
+Tests of the delta suppression and keepalive of the transports.
+"""
+from typing import List
+import asyncio
+import socket
+import threading
+
+from transport import AsyncUdpTransport, Controller, Transport, UdpTransport
+
+
+class RecordingTransport(Transport):
+    """Records the packets sent to every destination instead of sending them."""
+
+    def __init__(self, count: int, keepalive=None, groups=None, sequences=None):
+        super().__init__([Controller(f"10.0.0.{i + 1}", 21324) for i in range(count)], keepalive, groups, sequences)
+        self.sent: List[List[bytes]] = []
+
+    def send(self, controller_idx: int, packet: bytes) -> None:
+        self.sent[-1].append((controller_idx, bytes(packet)))
+
+    def _send_all(self, packets: List[bytes]) -> None:
+        for idx, packet in enumerate(packets):
+            self.send(idx, packet)
+
+    def send_frame(self, packets: List[bytes]) -> List[int]:
+        self.sent.append([])
+        self.send_all(packets)
+        return [idx for idx, _ in self.sent[-1]]
+
+
+def test_without_keepalive_every_packet_is_sent():
+    transport = RecordingTransport(2)
+    assert transport.send_frame([b"a", b"b"]) == [0, 1]
+    assert transport.send_frame([b"a", b"b"]) == [0, 1]
+
+
+def test_unchanged_packets_are_suppressed():
+    transport = RecordingTransport(3, keepalive=60)
+    assert transport.send_frame([b"a", b"b", b"c"]) == [0, 1, 2]
+    assert transport.send_frame([b"a", b"x", b"c"]) == [1]
+    assert transport.send_frame([b"a", b"x", b"c"]) == []
+    stats = transport.stats()
+    assert stats["packets_suppressed"] == 5
+
+
+def test_buffers_rewritten_in_place_are_compared_by_content():
+    transport = RecordingTransport(2, keepalive=60)
+    buffer = bytearray(b"aabb")
+    packets = [memoryview(buffer)[:2], memoryview(buffer)[2:]]
+    assert transport.send_frame(packets) == [0, 1]
+    buffer[2:] = b"cc"
+    assert transport.send_frame(packets) == [1]
+    assert transport.sent[-1] == [(1, b"cc")]
+
+
+def test_keepalive_resends_unchanged_packets():
+    transport = RecordingTransport(2, keepalive=1e-9)
+    transport.send_frame([b"a", b"b"])
+    assert transport.send_frame([b"a", b"b"]) == [0, 1]
+
+
+def test_packets_of_a_controller_are_sent_together():
+    transport = RecordingTransport(3, keepalive=60, groups=[0, 0, 1])
+    transport.send_frame([b"a", b"b", b"c"])
+    assert transport.send_frame([b"a", b"x", b"c"]) == [0, 1]
+
+
+def test_sequence_numbers_are_stamped_after_the_comparison():
+    transport = RecordingTransport(1, keepalive=60, sequences=[1])
+    packet = bytearray(b"s\0")
+    assert transport.send_frame([packet]) == [0]
+    assert transport.sent[-1] == [(0, b"s\x01")]
+    packet[1] = 0
+    assert transport.send_frame([packet]) == []  # Same content apart from the sequence number
+    packet[0] = ord("t")
+    transport.send_frame([packet])
+    assert transport.sent[-1] == [(0, b"t\x02")]
+
+
+def test_send_packets_updates_the_keepalive_state():
+    transport = RecordingTransport(2, keepalive=60)
+    transport.send_frame([b"a", b"b"])
+    transport.sent.append([])
+    transport.send_packets([1], [b"a", b"x"])
+    assert transport.sent[-1] == [(1, b"x")]
+    assert transport.send_frame([b"a", b"x"]) == []
+
+
+def test_asyncio_transport_skips_controllers_it_cannot_open():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+    port = receiver.getsockname()[1]
+
+    async def run():
+        transport = AsyncUdpTransport(["not-a-host.invalid", "127.0.0.1"], port)
+        await transport.open()
+        try:
+            transport.send_all([b"a", b"b"])
+            await asyncio.sleep(0)
+            return transport.controllers
+        finally:
+            transport.close()
+
+    controllers = asyncio.run(run())
+    assert receiver.recv(16) == b"b"
+    receiver.close()
+    assert controllers[0].errors == 1
+    assert controllers[1].packets_sent == 1
+
+
+def test_asyncio_transport_retries_lazily():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+
+    async def run():
+        transport = AsyncUdpTransport(["not-a-host.invalid"], receiver.getsockname()[1], keepalive=60)
+        transport.RETRY_INTERVAL = 0
+        await transport.open()
+        try:
+            transport.send_all([b"a"])
+            assert transport.controllers[0].packets_sent == 0
+            transport.controllers[0].ip = "127.0.0.1"  # The host resolves again
+            await asyncio.gather(*transport._opening.values())
+            # The frame dropped before the reopen is sent again, although it did not change
+            transport.send_all([b"a"])
+            return transport.controllers[0]
+        finally:
+            transport.close()
+
+    controller = asyncio.run(run())
+    assert receiver.recv(16) == b"a"
+    receiver.close()
+    assert controller.errors == 1 and controller.packets_sent == 1
+
+
+def test_threaded_transport_sends_off_the_event_loop():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+    transport = UdpTransport(["127.0.0.1"] * 2, receiver.getsockname()[1])
+    threads = []
+    send_all = transport.send_all
+
+    def record(packets):
+        threads.append(threading.current_thread())
+        send_all(packets)
+
+    transport.send_all = record
+    try:
+        asyncio.run(transport.send_all_async([b"a", b"b"]))
+        assert sorted(receiver.recv(16) for _ in range(2)) == [b"a", b"b"]
+    finally:
+        transport.close()
+        receiver.close()
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,58 @@
+"""
+Tests of the send paths of a wall.
+"""
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+
+from config import Config
+from wall import Wall
+
+
+def test_piano_key_waits_for_a_threaded_frame_in_flight(tmp_path):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+    config = Config({"rows": 1, "cols": 5,
+                     "controllers": [{"ip": "127.0.0.1", "origin": [0, 0], "port": receiver.getsockname()[1]}],
+                     "settings": {"transport": "threaded", "sync": False, "keepalive": 0, "clip_workers": 0}},
+                    environ={})
+
+    def packet(window: int) -> bytes:
+        frame = np.zeros((config.num_leds, 3), dtype=np.uint8)
+        frame[config.window_leds(0, window)] = 255
+        return frame[::-1].tobytes()
+
+    async def run():
+        wall = Wall("default", config, str(tmp_path), str(tmp_path / "clips"))
+        try:
+            await wall.handle_piano(0, 0)
+
+            # Hold the next frame on the transport's send thread
+            in_flight = threading.Event()
+            send_group = wall.transport._send_group
+
+            def slow_send_group(*args):
+                in_flight.set()
+                time.sleep(0.1)
+                send_group(*args)
+
+            wall.transport._send_group = slow_send_group
+            frame_task = asyncio.create_task(wall.send_frames(wall.piano_frame))
+            while not in_flight.is_set():
+                await asyncio.sleep(0.001)
+            await wall.handle_piano(0, 1)
+            await frame_task
+            assert wall.piano_partial_sends == 1
+        finally:
+            wall.transport.close()
+            wall.clip_compiler.close()
+
+    asyncio.run(run())
+    received = [receiver.recv(65536) for _ in range(3)]
+    receiver.close()
+    # The frame in flight goes out whole and before the key, not rewritten by it
+    assert received == [packet(0), packet(0), packet(1)]
@@ -0,0 +1,64 @@
+"""
+Tests of the frame shared by a wall's worker process.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from config import Config
+from worker import SharedFrame, WallProcess
+
+
+def test_round_trip():
+    shared = SharedFrame(4)
+    try:
+        reader = SharedFrame(4, shared.name)
+        frame = np.arange(12, dtype=np.uint8).reshape(4, 3)
+        shared.write(frame, "video")
+        assert np.array_equal(reader.read()[0], frame) and reader.read()[1] == "video"
+        shared.write(None, None)
+        assert np.array_equal(reader.read()[0], frame) and reader.read()[1] is None
+        reader.close()
+    finally:
+        shared.close(unlink=True)
+
+
+def test_unfinished_write_returns_the_last_frame():
+    shared = SharedFrame(2)
+    try:
+        shared.READ_TIMEOUT = 0.01
+        shared.write(np.full((2, 3), 7, dtype=np.uint8), "solid")
+        shared.read()
+        shared._sequence[0] += 1  # A writer that died halfway
+        shared._frame[:] = 9
+        frame, active = shared.read()
+        assert frame.tolist() == [[7, 7, 7]] * 2 and active == "solid"
+    finally:
+        shared.close(unlink=True)
+
+
+def test_timed_out_requests_are_not_left_pending(tmp_path):
+    config = Config({"rows": 1, "cols": 5, "controllers": [{"ip": "10.0.0.1", "origin": [0, 0]}]}, environ={})
+    wall = WallProcess("default", config, str(tmp_path), str(tmp_path / "clips"))
+    wall.TIMEOUT = 0.01
+    wall._send = lambda request_id, method, args: None  # A worker that never replies
+    with pytest.raises(TimeoutError):
+        wall.request("stats")
+    assert wall._pending == {}
+
+
+def test_active_animation_is_read_without_waiting():
+    shared = SharedFrame(2)
+    try:
+        shared.write(None, "legacy")
+        assert shared.read_active() == "legacy"
+        shared._sequence[0] += 1  # A write in progress
+        shared._name[:] = 0
+        start = time.monotonic()
+        assert shared.read_active() == "legacy"
+        assert time.monotonic() - start < shared.READ_TIMEOUT / 10
+        shared._sequence[0] += 1
+        assert shared.read_active() is None
+    finally:
+        shared.close(unlink=True)
@@ -0,0 +1,738 @@
+"""
+UDP transport for the WLED realtime protocol.
+
+Three backends are available:
+
+- "asyncio": one connected datagram endpoint per controller on the running
+  event loop, for animations written as asyncio tasks.
+- "threaded": one connected socket per controller, kept open for the lifetime
+  of the process, with a persistent worker pool pushing the packets in parallel.
+- "batch": a single non-blocking socket that submits all packets of a frame in
+  one sendmmsg() call on Linux, or a tight sendto() loop elsewhere, from the
+  calling thread.
+
+Every backend sends a list of packets to a list of (ip, port) destinations,
+one packet each; a controller whose frame spans several packets (see
+protocols.py) appears once per packet, and the packets of a controller are
+grouped so they are always sent together, in order. Protocols with sequence
+numbers (E1.31, Art-Net) get them stamped into the packet right before it is
+sent.
+
+With a keepalive interval set, every backend skips controllers whose packets
+did not change since the last send, resending them only once per keepalive so
+WLED does not leave realtime mode.
+
+Every backend reports the inter-controller skew: per frame, the time between
+the first and the last controller receiving the last of its packets. The
+asyncio and batch backends send a frame as one back-to-back burst from a
+single thread; the threaded one does so too when created with sync.
+"""
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple, Union
+import asyncio
+import concurrent.futures
+import ctypes
+import ctypes.util
+import errno
+import logging
+import select
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+BACKENDS = ("asyncio", "threaded", "batch")
+
+
+class Controller:
+    """
+    Send counters of a single WLED controller, or of one packet of a
+    controller whose frame spans several packets.
+    """
+
+    def __init__(self, ip: str, port: int):
+        self.ip = ip
+        self.port = port
+        self.name = ip  # key in the stats, made unique by the transport
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.errors = 0
+        self.packets_suppressed = 0
+        # Last packet handed to the controller and when, for delta suppression
+        self.last_packet: Optional[bytearray] = None
+        self._last_view: Optional[memoryview] = None
+        self.last_sent_ns = 0
+        self.sequence = 0
+
+    def remember(self, packet: bytes) -> None:
+        """
+        Copies a packet into the controller's last packet buffer, which is
+        only reallocated when the packet size changes.
+        """
+        if self.last_packet is None or len(self.last_packet) != len(packet):
+            self.last_packet = bytearray(packet)
+            self._last_view = memoryview(self.last_packet)
+        else:
+            self._last_view[:] = packet
+
+    def forget(self) -> None:
+        """
+        Forgets the last packet after it could not be sent, so the next frame
+        sends the controller's packet again even if it did not change.
+        """
+        self.last_packet = None
+        self._last_view = None
+        self.last_sent_ns = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "packets_sent": self.packets_sent,
+            "packets_suppressed": self.packets_suppressed,
+            "bytes_sent": self.bytes_sent,
+            "errors": self.errors,
+        }
+
+
+class ControllerSocket(Controller):
+    """
+    A connected UDP socket to a single WLED controller.
+
+    The socket is created once and only re-created after a send error
+    (e.g. ECONNREFUSED after the controller rebooted).
+    """
+
+    def __init__(self, ip: str, port: int):
+        super().__init__(ip, port)
+        self.sock = None
+        self.sockets_opened = 0
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self) -> None:
+        """Create and connect the socket, leaving it closed on failure."""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect((self.ip, self.port))
+        except OSError as e:
+            logging.error(f"Failed to open socket to {self.ip}:{self.port} => {e}")
+            self.errors += 1
+            return
+        self.sock = sock
+        self.sockets_opened += 1
+
+    def _close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, packet: bytes) -> None:
+        """
+        Sends a packet to the controller, re-creating the socket on error.
+
+        Args:
+            packet (bytes): Packet to send to the controller.
+        """
+        with self._lock:
+            if self.sock is None:
+                self._open()
+                if self.sock is None:
+                    self.forget()
+                    return
+            try:
+                self.sock.send(packet)
+            except OSError as e:
+                logging.error(f"Failed to send packet to {self.ip}:{self.port} => {e}")
+                self.errors += 1
+                self._close()
+                self.forget()
+                return
+            self.packets_sent += 1
+            self.bytes_sent += len(packet)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), "sockets_opened": self.sockets_opened}
+
+
+class Transport:
+    """
+    Base class of the transport backends, tracking the per-frame send latency
+    and the number of send syscalls.
+    """
+
+    backend = ""
+
+    # Number of recent frames the skew percentiles are computed over
+    SKEW_WINDOW = 1000
+
+    def __init__(self, controllers: List[Controller], keepalive: Optional[float] = None,
+                 groups: Optional[List[int]] = None, sequences: Optional[List[Optional[int]]] = None):
+        """
+        Args:
+            controllers (List[Controller]): One destination per packet, in frame order.
+            keepalive (Optional[float]): If set, packets identical to the last
+                one sent to a controller are skipped, unless it was sent more
+                than keepalive seconds ago.
+            groups (Optional[List[int]]): Controller of every packet; when one
+                packet of a controller is sent, all of them are. By default
+                every packet goes to a controller of its own.
+            sequences (Optional[List[Optional[int]]]): Byte of the sequence
+                number of every packet (None for packets without), counting
+                1-255 per destination. The packets must be writable.
+        """
+        self.controllers = controllers
+        self.keepalive_ns = round(keepalive * 1e9) if keepalive else None
+        self.groups = groups
+        self.sequences = sequences if sequences and any(s is not None for s in sequences) else None
+        # Send time of the last packet of every controller in the current frame
+        self._marks: Dict[int, int] = {}
+        self._skews: deque = deque(maxlen=self.SKEW_WINDOW)
+        self.skew_ns_max = 0
+        totals = Counter(c.ip for c in controllers)
+        seen: Counter = Counter()
+        for controller in controllers:
+            if totals[controller.ip] > 1:
+                controller.name = f"{controller.ip}#{seen[controller.ip]}"
+                seen[controller.ip] += 1
+        self.frames_sent = 0
+        self.syscalls = 0
+        self.send_ns_total = 0
+        self.send_ns_max = 0
+
+    async def open(self) -> None:
+        """
+        Binds the transport to the running event loop.
+        The blocking backends open their sockets on creation, so this is a no-op.
+        """
+
+    def send(self, controller_idx: int, packet: bytes) -> None:
+        """
+        Sends a packet to a single controller from the calling thread.
+
+        Args:
+            controller_idx (int): Index of the destination in the IP list.
+            packet (bytes): Packet to send to the controller.
+        """
+        raise NotImplementedError
+
+    def _send_all(self, packets: List[bytes]) -> None:
+        raise NotImplementedError
+
+    def send_all(self, packets: List[bytes]) -> None:
+        """
+        Sends one packet per destination and waits until all are sent.
+
+        Args:
+            packets (List[bytes]): One packet per destination, in the order of the IP list.
+        """
+        self._marks = {}
+        start = time.perf_counter_ns()
+        if self.keepalive_ns is None:
+            self._stamp(packets, range(len(packets)))
+            self._send_all(packets)
+        else:
+            self._send_changed(packets)
+        elapsed = time.perf_counter_ns() - start
+        self.frames_sent += 1
+        self.send_ns_total += elapsed
+        self.send_ns_max = max(self.send_ns_max, elapsed)
+        if len(self._marks) > 1:
+            skew = max(self._marks.values()) - min(self._marks.values())
+            self._skews.append(skew)
+            self.skew_ns_max = max(self.skew_ns_max, skew)
+
+    def send_packets(self, indices: List[int], packets: List[bytes]) -> None:
+        """
+        Sends some of the packets of a frame right away from the calling
+        thread, e.g. all packets of one controller, bypassing the keepalive
+        check but keeping its state up to date for the next frame.
+
+        Args:
+            indices (List[int]): Destinations to send to.
+            packets (List[bytes]): One packet per destination, in the order of the IP list.
+        """
+        now = time.monotonic_ns()
+        for idx in indices:
+            controller = self.controllers[idx]
+            if self.keepalive_ns is not None:
+                controller.remember(packets[idx])
+            controller.last_sent_ns = now
+        self._stamp(packets, indices)
+        for idx in indices:
+            self.send(idx, packets[idx])
+
+    def _mark(self, idx: int, now_ns: Optional[int] = None) -> None:
+        """
+        Records when the packet of destination idx was handed to the kernel.
+        """
+        self._marks[self.groups[idx] if self.groups else idx] = now_ns or time.perf_counter_ns()
+
+    def _send_changed(self, packets: List[bytes]) -> None:
+        """
+        Sends only the packets that changed or are due for a keepalive.
+        """
+        now = time.monotonic_ns()
+        changed = []
+        for idx, (controller, packet) in enumerate(zip(self.controllers, packets)):
+            # bytearray comparison is a memcmp against the packet's buffer, without a copy
+            if controller.last_packet == packet and now - controller.last_sent_ns < self.keepalive_ns:
+                continue
+            controller.remember(packet)
+            changed.append(idx)
+        if self.groups is not None and changed:
+            # A controller may only show its LEDs once all its packets are in (e.g. on DDP's push flag)
+            touched = {self.groups[idx] for idx in changed}
+            changed = [idx for idx, group in enumerate(self.groups) if group in touched]
+        sending = set(changed)
+        for idx, controller in enumerate(self.controllers):
+            if idx in sending:
+                controller.last_sent_ns = now
+            else:
+                controller.packets_suppressed += 1
+        self._stamp(packets, changed)
+        if len(changed) == len(packets):
+            self._send_all(packets)
+        else:
+            for idx in changed:
+                self.send(idx, packets[idx])
+
+    def _stamp(self, packets: List[bytes], indices) -> None:
+        """
+        Writes the next sequence number into the given packets, after the
+        comparison with the last packet so unchanged packets stay equal.
+        """
+        if self.sequences is None:
+            return
+        for idx in indices:
+            offset = self.sequences[idx]
+            if offset is not None:
+                controller = self.controllers[idx]
+                controller.sequence = controller.sequence % 255 + 1
+                packets[idx][offset] = controller.sequence
+
+    async def send_all_async(self, packets: List[bytes]) -> None:
+        """
+        Coroutine variant of send_all. UDP sends never wait on the network,
+        so the backends sending from the calling thread simply send inline.
+
+        Args:
+            packets (List[bytes]): One packet per destination, in the order of the IP list.
+        """
+        self.send_all(packets)
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns the frame latency, syscall and per-controller send counters.
+        """
+        frames = max(self.frames_sent, 1)
+        skews = np.array(self._skews) / 1000 if self._skews else np.zeros(1)
+        return {
+            "backend": self.backend,
+            "keepalive_s": self.keepalive_ns / 1e9 if self.keepalive_ns else None,
+            "frames_sent": self.frames_sent,
+            "packets_sent": sum(c.packets_sent for c in self.controllers),
+            "packets_suppressed": sum(c.packets_suppressed for c in self.controllers),
+            "syscalls": self.syscalls,
+            "syscalls_per_frame": round(self.syscalls / frames, 2),
+            "send_latency_us": {
+                "avg": round(self.send_ns_total / frames / 1000, 1),
+                "max": round(self.send_ns_max / 1000, 1),
+            },
+            "skew_us": {
+                "avg": round(float(skews.mean()), 1),
+                "p99": round(float(np.percentile(skews, 99)), 1),
+                "max": round(self.skew_ns_max / 1000, 1),
+            },
+            "controllers": {c.name: c.stats() for c in self.controllers},
+        }
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class UdpTransport(Transport):
+    """
+    Long-lived sender owning one ControllerSocket per WLED controller and a
+    persistent worker pool to push the per-controller packets in parallel.
+    The packets of a controller spanning several packets are sent in order
+    by the same worker. With sync, all packets are sent back-to-back from the
+    calling thread instead, so the controllers update together.
+    """
+
+    backend = "threaded"
+
+    def __init__(self, ips: List[str], port: Union[int, List[int]], keepalive: Optional[float] = None,
+                 groups: Optional[List[int]] = None, sequences: Optional[List[Optional[int]]] = None,
+                 sync: bool = False):
+        super().__init__([ControllerSocket(ip, p) for ip, p in zip(ips, _ports(ips, port))],
+                         keepalive, groups, sequences)
+        self.sync = sync
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(set(groups)) if groups else len(ips), thread_name_prefix="wled-send")
+
+    def send(self, controller_idx: int, packet: bytes) -> None:
+        self.syscalls += 1
+        self.controllers[controller_idx].send(packet)
+        self._mark(controller_idx)
+
+    def _send_group(self, indices: List[int], packets: List[bytes]) -> None:
+        for idx, packet in zip(indices, packets):
+            self.controllers[idx].send(packet)
+            self._mark(idx)
+
+    def _send_all(self, packets: List[bytes]) -> None:
+        self.syscalls += len(packets)
+        if self.sync:
+            self._send_group(list(range(len(packets))), packets)
+            return
+        jobs: Dict[int, Tuple[List[int], List[bytes]]] = {}
+        for idx, packet in enumerate(packets):
+            job = jobs.setdefault(self.groups[idx] if self.groups else idx, ([], []))
+            job[0].append(idx)
+            job[1].append(packet)
+        futures = [self._executor.submit(self._send_group, *job) for job in jobs.values()]
+        concurrent.futures.wait(futures)
+
+    async def send_all_async(self, packets: List[bytes]) -> None:
+        """
+        Coroutine variant of send_all. Without sync, the frame is sent and
+        waited for from a thread of the loop's default executor, so the
+        event loop keeps running while the workers send.
+        """
+        if self.sync:
+            self.send_all(packets)
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.send_all, packets)
+
+    def stats(self) -> Dict[str, object]:
+        return {**super().stats(), "sync": self.sync}
+
+    def close(self) -> None:
+        """
+        Shuts down the worker pool and closes all sockets.
+        """
+        self._executor.shutdown(wait=True)
+        for controller in self.controllers:
+            controller.close()
+
+
+# --------------------------------------------------------------------------------
+#                              sendmmsg() BINDINGS
+# --------------------------------------------------------------------------------
+
+
+class _SockaddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+
+class _Iovec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_Iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _Msghdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+def _load_sendmmsg():
+    """
+    Returns libc's sendmmsg(), or None when it is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_Mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class BatchUdpTransport(Transport):
+    """
+    Sends all packets of a frame from a single non-blocking socket in the
+    calling thread: one sendmmsg() call on Linux, a sendto() loop elsewhere.
+    """
+
+    backend = "batch"
+
+    # How long to wait for the socket to become writable when the send buffer is full
+    WRITE_TIMEOUT = 0.01
+
+    def __init__(self, ips: List[str], port: Union[int, List[int]], use_sendmmsg: bool = True,
+                 keepalive: Optional[float] = None, groups: Optional[List[int]] = None,
+                 sequences: Optional[List[Optional[int]]] = None):
+        super().__init__([Controller(ip, p) for ip, p in zip(ips, _ports(ips, port))],
+                         keepalive, groups, sequences)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.addresses = [(c.ip, c.port) for c in self.controllers]
+        self.use_sendmmsg = use_sendmmsg and _sendmmsg is not None
+
+        # Message headers are built once; only the iovecs change per frame
+        count = len(ips)
+        self._names = (_SockaddrIn * count)()
+        self._iovecs = (_Iovec * count)()
+        self._msgs = (_Mmsghdr * count)()
+        for i, (ip, port) in enumerate(self.addresses):
+            self._names[i].sin_family = socket.AF_INET
+            self._names[i].sin_port = socket.htons(port)
+            self._names[i].sin_addr[:] = list(socket.inet_aton(ip))
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._names[i])
+            hdr.msg_namelen = ctypes.sizeof(_SockaddrIn)
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+        self._bound_packets = None
+
+    def _wait_writable(self) -> bool:
+        _, writable, _ = select.select([], [self.sock], [], self.WRITE_TIMEOUT)
+        return bool(writable)
+
+    def _sendto(self, controller_idx: int, packet: bytes) -> None:
+        controller = self.controllers[controller_idx]
+        error = None
+        for _ in range(2):
+            self.syscalls += 1
+            try:
+                self.sock.sendto(packet, self.addresses[controller_idx])
+            except BlockingIOError as e:
+                error = e
+                if self._wait_writable():
+                    continue
+                break
+            except OSError as e:
+                error = e
+                break
+            else:
+                controller.packets_sent += 1
+                controller.bytes_sent += len(packet)
+                self._mark(controller_idx)
+                return
+        logging.error(f"Failed to send packet to {controller.ip}:{controller.port} => {error}")
+        controller.errors += 1
+
+    def send(self, controller_idx: int, packet: bytes) -> None:
+        self._sendto(controller_idx, packet)
+
+    def _send_all(self, packets: List[bytes]) -> None:
+        if not self.use_sendmmsg:
+            for idx, packet in enumerate(packets):
+                self._sendto(idx, packet)
+            return
+
+        # Point each iovec at its packet. A PacketLayout hands out the same list
+        # of views into its buffer every frame, so the iovecs are only rebound
+        # when a different list comes in; the list keeps the buffers alive.
+        if packets is not self._bound_packets:
+            for iovec, packet in zip(self._iovecs, packets):
+                buf = np.frombuffer(packet, dtype=np.uint8)
+                iovec.iov_base = buf.ctypes.data
+                iovec.iov_len = buf.nbytes
+            self._bound_packets = packets
+
+        fd = self.sock.fileno()
+        first, count = 0, len(packets)
+        while first < count:
+            self.syscalls += 1
+            start = time.perf_counter_ns()
+            sent = _sendmmsg(fd, ctypes.byref(self._msgs[first]), count - first, 0)
+            if sent > 0:
+                # The kernel hands the messages over one by one during the call, so
+                # the call's duration bounds the skew between them
+                end = time.perf_counter_ns()
+                for idx in range(first, first + sent):
+                    self.controllers[idx].packets_sent += 1
+                    self.controllers[idx].bytes_sent += len(packets[idx])
+                    self._mark(idx, start if idx == first else end)
+                first += sent
+                continue
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK) and self._wait_writable():
+                continue
+            # Skip the message that failed and carry on with the rest
+            controller = self.controllers[first]
+            logging.error(f"Failed to send packet to {controller.ip}:{controller.port} => "
+                          f"{errno.errorcode.get(err, err)}")
+            controller.errors += 1
+            first += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {**super().stats(), "sendmmsg": self.use_sendmmsg}
+
+    def close(self) -> None:
+        """
+        Closes the socket.
+        """
+        self.sock.close()
+
+
+class _ControllerProtocol(asyncio.DatagramProtocol):
+    """
+    Counts the errors (e.g. ICMP port unreachable) reported for a controller.
+    """
+
+    def __init__(self, controller: Controller):
+        self.controller = controller
+
+    def error_received(self, exc: Exception) -> None:
+        logging.error(f"Failed to send packet to {self.controller.ip}:{self.controller.port} => {exc}")
+        self.controller.errors += 1
+
+
+class AsyncUdpTransport(Transport):
+    """
+    Sends through one asyncio datagram endpoint per controller.
+
+    The endpoints are created by open() on the running event loop and, like
+    every asyncio transport, must only be used from that loop's thread. A
+    controller whose endpoint cannot be created (e.g. its host does not
+    resolve) is skipped, and its endpoint is created again from send(), at
+    most once per RETRY_INTERVAL seconds.
+    """
+
+    backend = "asyncio"
+
+    RETRY_INTERVAL = 1.0
+
+    def __init__(self, ips: List[str], port: Union[int, List[int]], keepalive: Optional[float] = None,
+                 groups: Optional[List[int]] = None, sequences: Optional[List[Optional[int]]] = None):
+        super().__init__([Controller(ip, p) for ip, p in zip(ips, _ports(ips, port))],
+                         keepalive, groups, sequences)
+        self.endpoints: List[Optional[asyncio.DatagramTransport]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._opening: Dict[int, asyncio.Task] = {}
+        self._last_attempt = [0.0] * len(self.controllers)
+
+    async def open(self) -> None:
+        """
+        Creates the datagram endpoints on the running event loop.
+        """
+        self.close()
+        self._loop = asyncio.get_running_loop()
+        self.endpoints = [None] * len(self.controllers)
+        for idx in range(len(self.controllers)):
+            await self._open(idx)
+
+    async def _open(self, controller_idx: int) -> None:
+        """Creates the endpoint of a controller, leaving it None on failure."""
+        controller = self.controllers[controller_idx]
+        self._last_attempt[controller_idx] = time.monotonic()
+        try:
+            endpoint, _ = await self._loop.create_datagram_endpoint(
+                lambda: _ControllerProtocol(controller), remote_addr=(controller.ip, controller.port))
+        except OSError as e:
+            logging.error(f"Failed to open endpoint to {controller.ip}:{controller.port} => {e}")
+            controller.errors += 1
+            return
+        if self._loop is None:  # Closed while resolving
+            endpoint.close()
+            return
+        self.endpoints[controller_idx] = endpoint
+
+    def _reopen(self, controller_idx: int) -> None:
+        """Starts creating the endpoint of a controller again, unless it was tried just now."""
+        if (controller_idx in self._opening or
+                time.monotonic() - self._last_attempt[controller_idx] < self.RETRY_INTERVAL):
+            return
+        task = self._loop.create_task(self._open(controller_idx))
+        self._opening[controller_idx] = task
+        task.add_done_callback(lambda _: self._opening.pop(controller_idx, None))
+
+    def send(self, controller_idx: int, packet: bytes) -> None:
+        if self._loop is None:
+            raise RuntimeError("AsyncUdpTransport.open() must be awaited before sending.")
+        controller = self.controllers[controller_idx]
+        endpoint = self.endpoints[controller_idx]
+        if endpoint is None or endpoint.is_closing():
+            self.endpoints[controller_idx] = None
+            controller.forget()
+            self._reopen(controller_idx)
+            return
+        # sendto() copies the packet if it cannot be sent right away
+        endpoint.sendto(packet)
+        self._mark(controller_idx)
+        self.syscalls += 1
+        controller.packets_sent += 1
+        controller.bytes_sent += len(packet)
+
+    def _send_all(self, packets: List[bytes]) -> None:
+        for idx, packet in enumerate(packets):
+            self.send(idx, packet)
+
+    def close(self) -> None:
+        """
+        Closes the datagram endpoints.
+        """
+        for task in list(self._opening.values()):
+            task.cancel()
+        self._opening = {}
+        for endpoint in self.endpoints:
+            if endpoint is not None:
+                endpoint.close()
+        self.endpoints = []
+        self._loop = None
+
+
+def _ports(ips: List[str], port: Union[int, List[int]]) -> List[int]:
+    """Returns the port of every destination, given one port for all or one each."""
+    return [port] * len(ips) if isinstance(port, int) else list(port)
+
+
+def create_transport(ips: List[str], port: Union[int, List[int]], backend: str = "asyncio",
+                     keepalive: Optional[float] = None, groups: Optional[List[int]] = None,
+                     sequences: Optional[List[Optional[int]]] = None, sync: bool = False) -> Transport:
+    """
+    Creates the transport backend with the given name.
+
+    Args:
+        ips (List[str]): IP address of every destination, i.e. of the WLED
+            controller of every packet of a frame.
+        port (Union[int, List[int]]): UDP port of the WLED controllers, or of every destination.
+        backend (str): One of BACKENDS.
+        keepalive (Optional[float]): Resend interval of unchanged packets, or
+            None to send every packet.
+        groups (Optional[List[int]]): Controller of every destination, see Transport.
+        sequences (Optional[List[Optional[int]]]): Sequence number byte of every packet, see Transport.
+        sync (bool): Send every frame as one burst from the calling thread;
+            the asyncio and batch backends always do.
+    """
+    if backend == "asyncio":
+        return AsyncUdpTransport(ips, port, keepalive, groups, sequences)
+    if backend == "threaded":
+        return UdpTransport(ips, port, keepalive, groups, sequences, sync)
+    if backend == "batch":
+        return BatchUdpTransport(ips, port, keepalive=keepalive, groups=groups, sequences=sequences)
+    raise ValueError(f"Unknown transport backend: {backend} (expected one of {', '.join(BACKENDS)})")
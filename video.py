@@ -1,32 +1,33 @@
-import socket
 import time
 import logging
-import concurrent.futures
-from typing import List, Tuple
 import cv2  # OpenCV for video processing
-import numpy as np  # For numerical operations
 import argparse
-import asyncio
+import os
 import keyboard  # Ensure you have installed 'keyboard' package
 
+from config import load_config
+from frames import Frame, as_frame
+from layout import create_sampler
+from render import PlaybackClock
+
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s %(levelname)s %(message)s")
 
-# The IPs of your four WLED controllers
-WLED_IPS = [
-    "192.168.107.123",  # Index 0 -> Top Left
-    "192.168.107.122",  # Index 1 -> Top Right
-    "192.168.107.120",  # Index 2 -> Bottom Right
-    "192.168.107.121",  # Index 3 -> Bottom Left
-]
-
-PORT = 19446             # WLED’s real-time UDP port
-LEDS_PER_CONTROLLER = 100
-WINDOWS_PER_CONTROLLER = 5
-LEDS_PER_WINDOW = LEDS_PER_CONTROLLER // WINDOWS_PER_CONTROLLER  # 20
+# The WLED controllers and where their windows are on the wall, from config.json (see config.py)
+CONFIG = load_config()
+WLED_IPS = CONFIG.ips
 TOTAL_CONTROLLERS = len(WLED_IPS)
-TOTAL_LEDS = LEDS_PER_CONTROLLER * TOTAL_CONTROLLERS  # 400
-BYTES_PER_LED = 3       # R, G, B
+TOTAL_LEDS = CONFIG.num_leds
+LAYOUT = CONFIG.layout
+
+# Maps decoded frames onto the wall at the "video_resolution" of the config (per window or per LED)
+SAMPLER = create_sampler(LAYOUT, CONFIG.settings)
+
+# Precomputed packets of every controller in its protocol, and one long-lived
+# sender; playback is synchronous, so the blocking threaded backend stands in for asyncio
+PACKET_LAYOUT = CONFIG.create_packet_layout()
+TRANSPORT = CONFIG.create_transport(
+    PACKET_LAYOUT, "threaded" if CONFIG.settings["transport"] == "asyncio" else None)
 
 
 def parse_arguments():
@@ -57,81 +58,15 @@ def parse_arguments():
     return parser.parse_args()
 
 
-def build_packet(colors: List[Tuple[int, int, int]]) -> bytes:
-    """
-    Builds the DRGB packet (no header, just RGB bytes) for the entire LED array.
-
-    Args:
-        colors: A list of RGB tuples (0-255) representing the colors.
-
-    Returns:
-        A byte array representing the DRGB packet.
-    """
-    colors = colors[::-1]  # Reverse the order of the colors
-
-    packet = bytearray()
-    for (r, g, b) in colors:
-        packet += bytes([r, g, b])
-    return packet
-
-
-def send_packet(sock: socket.socket, ip: str, port: int, packet: bytes) -> None:
-    try:
-        sock.sendto(packet, (ip, port))
-    except Exception as e:
-        logging.error(f"Failed to send packet to {ip}:{port}: {e}")
-
-
-async def send_packet_async(ip: str, port: int, packet: bytes) -> None:
-    """
-    Asynchronously send a UDP packet to a specified WLED controller.
-
-    Args:
-        ip: The IP address of the WLED controller.
-        port: The port of the WLED controller.
-        packet: The DRGB packet to send.
-    """
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, send_packet, ip, port, packet)
-
-
-async def send_frames_async(colors: List[Tuple[int, int, int]]) -> None:
+def send_frames(colors: Frame) -> None:
     """
-    Asynchronously slice the 400-LED color array per controller and send.
+    Build the packets of every controller and send them through the shared transport.
 
     Args:
-        colors: A list of RGB tuples (0-255) representing the colors.
+        colors: A (TOTAL_LEDS, 3) uint8 frame.
     """
-    tasks = []
-    for idx, ip in enumerate(WLED_IPS):
-        # Slice out this controller's 100 LEDs
-        start_idx = idx * LEDS_PER_CONTROLLER
-        end_idx = start_idx + LEDS_PER_CONTROLLER
-        controller_slice = colors[start_idx:end_idx]
-        packet = build_packet(controller_slice)
-        tasks.append(send_packet_async(ip, PORT, packet))
-    await asyncio.gather(*tasks)
-
-
-def send_frames(colors: List[Tuple[int, int, int]]) -> None:
-    """
-    Slice the 400-LED color array per controller and send in parallel.
-
-    Args:
-        colors: A list of RGB tuples (0-255) representing the colors.
-    """
-    with concurrent.futures.ThreadPoolExecutor(max_workers=TOTAL_CONTROLLERS) as executor:
-        futures = []
-        for idx, ip in enumerate(WLED_IPS):
-            # Slice out this controller's 100 LEDs
-            start_idx = idx * LEDS_PER_CONTROLLER
-            end_idx = start_idx + LEDS_PER_CONTROLLER
-            controller_slice = colors[start_idx:end_idx]
-            logging.debug(f"Sending to {ip}: {controller_slice}")
-
-            # Build and send this subset
-            packet = build_packet(controller_slice)
-            futures.append(executor.submit(send_packet, ip, PORT, packet))
+    logging.debug(f"Sending {len(colors)} colors to {TOTAL_CONTROLLERS} controllers.")
+    TRANSPORT.send_all(PACKET_LAYOUT.build(colors))
 
 
 def play_video(video_path: str, loop: bool = False, max_fps: float = None) -> None:
@@ -155,93 +90,37 @@ def play_video(video_path: str, loop: bool = False, max_fps: float = None) -> No
         if max_fps and fps > max_fps:
             fps = max_fps
             logging.info(f"FPS capped to {fps}")
-        frame_duration = 1.0 / fps
 
         logging.info(f"Playing video: {video_path} at {fps} FPS")
 
-        # Determine the layout of windows (e.g., 4 controllers x 5 windows)
-        num_windows = TOTAL_CONTROLLERS * WINDOWS_PER_CONTROLLER  # 20 windows
-
-        # Define the grid size for window mapping (e.g., 4 rows x 5 columns)
-        grid_rows = 4
-        grid_cols = 5
-
+        # Every frame is due at an absolute time on the monotonic clock, so
+        # a slow frame does not push back the ones after it
+        clock = PlaybackClock(fps)
         while True:
-            frame_start_time = time.time()
-            ret, frame = cap.read()
-            if not ret:
-                logging.info("Video playback finished.")
-                break  # Exit inner loop to either restart or end
-
+            skip = clock.frames_behind(time.monotonic_ns())
+            if skip:
+                logging.warning(f"Playback is {skip} frame(s) behind; skipping them.")
+                clock.drop(skip)
             try:
-                # Check the number of channels in the frame
-                if len(frame.shape) == 2:
-                    # Grayscale image, convert to RGB
-                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
-                    logging.debug("Converted grayscale frame to RGB.")
-                elif frame.shape[2] == 4:
-                    # Frame with alpha channel, remove it
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
-                    logging.debug("Converted BGRA frame to RGB.")
-                elif frame.shape[2] == 3:
-                    # BGR to RGB
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    logging.debug("Converted BGR frame to RGB.")
-                else:
-                    logging.error(f"Unexpected number of channels: {
-                                  frame.shape[2]}")
-                    continue  # Skip this frame
-
-                # Resize the frame to match the grid size
-                resized_frame = cv2.resize(
-                    frame, (grid_cols, grid_rows), interpolation=cv2.INTER_AREA)
-                logging.debug(f"Resized frame shape: {resized_frame.shape}")
-
-                # Ensure resized_frame has shape (grid_rows, grid_cols, 3)
-                if resized_frame.shape != (grid_rows, grid_cols, 3):
-                    logging.error(f"Resized frame has unexpected shape: {
-                                  resized_frame.shape}")
-                    continue  # Skip this frame
-
-                # Extract colors for each window
-                # Shape: (num_windows, 3)
-                reshaped_frame = resized_frame.reshape(-1, 3)
-                window_colors = [tuple(pixel.tolist())
-                                 for pixel in reshaped_frame]
-                logging.debug(f"Window colors: {window_colors}")
-
-                # Validate window_colors length
-                if len(window_colors) != num_windows:
-                    logging.error(f"Expected {num_windows} window colors, got {
-                                  len(window_colors)}")
-                    continue  # Skip this frame
-
-                # Build the full LED color list using NumPy for efficiency
-                full_colors = np.repeat(
-                    reshaped_frame, LEDS_PER_WINDOW, axis=0).tolist()
-
-                # Ensure the color list has exactly TOTAL_LEDS entries
-                if len(full_colors) < TOTAL_LEDS:
-                    full_colors += [(0, 0, 0)] * \
-                        (TOTAL_LEDS - len(full_colors))
-                elif len(full_colors) > TOTAL_LEDS:
-                    full_colors = full_colors[:TOTAL_LEDS]
-
-                # Send the colors to the WLED controllers
-                send_frames(full_colors)
-
-                # Wait to match the video's frame rate
-                elapsed = time.time() - frame_start_time
-                time_to_wait = frame_duration - elapsed
-                if time_to_wait > 0:
-                    time.sleep(time_to_wait)
-                else:
-                    logging.warning(f"Frame processing is slower ({
-                                    elapsed:.3f}s) than frame duration ({frame_duration:.3f}s).")
-
+                # Grab the overdue frames without decoding them, then map the
+                # next one onto the wall at the configured video resolution
+                colors = SAMPLER.read(cap, skip)
             except Exception as e:
                 logging.error(f"An error occurred while processing frame: {e}")
+                clock.drop(1)
                 continue  # Continue with the next frame
+            if colors is None:
+                logging.info("Video playback finished.")
+                break  # Exit inner loop to either restart or end
+
+            # Send the colors to the WLED controllers
+            send_frames(as_frame(colors, TOTAL_LEDS))
+            clock.presented(time.monotonic_ns())
+
+            # Wait for the deadline of the next frame
+            time_to_wait = clock.deadline_ns(clock.position) - time.monotonic_ns()
+            if time_to_wait > 0:
+                time.sleep(time_to_wait / 1e9)
 
         cap.release()
 
@@ -312,6 +191,7 @@ def main():
     else:
         logging.info(f"Starting video playback: {args.video}")
         play_video(args.video, loop=args.loop, max_fps=args.max_fps)
+    TRANSPORT.close()
     logging.info("Playback ended.")
 
 
@@ -0,0 +1,844 @@
+"""
+An LED wall: its controllers and everything that drives them.
+
+Every wall owns the packet layout and transport of its controllers, its own
+render loop with the active animation, and the piano, legacy and video state,
+so one process can run several walls independently (see config.py for how
+they are configured). The render loops of the walls run as separate tasks
+on the event loop; video decoding and clip compiling happen off the loop, so
+one wall never holds up the frames of another.
+"""
+from threading import Event, Thread
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+import asyncio
+import logging
+import os
+import queue
+import time
+
+import cv2 as cv
+import numpy as np
+
+from clips import ClipCompiler, ClipSource
+from config import RESTART_SETTINGS, Config
+from frames import Frame, PacketLayout, as_frame, new_frame
+from layout import VideoSampler, create_sampler
+from render import FrameSource, FunctionSource, LatencyStat, PlaybackClock, RenderScheduler, TimingStat
+from transport import Transport
+
+
+def hex_to_rgb(h: str) -> Tuple[int, int, int]:
+    return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
+
+
+class VideoSource(FrameSource):
+    """
+    Loops a video file in real time on a PlaybackClock: every frame has an
+    absolute deadline, and frames that are already overdue are dropped.
+
+    A decoder thread reads and downsamples frames ahead into a bounded queue
+    (the lookahead), so decoder hiccups such as keyframes or slow disk reads
+    are absorbed before they reach the wall. When the decoder falls behind
+    the clock it skips the overdue frames with grab() instead of decoding them.
+    """
+
+    name = "video"
+
+    # Marks the end of playback in the frame queue
+    END = None
+
+    def __init__(self, video_path: str, sampler: VideoSampler, max_fps: float = None, lookahead: int = 8,
+                 start_frame: int = 0):
+        """
+        Args:
+            video_path (str): Path to the video file.
+            sampler (VideoSampler): Maps the decoded frames onto the wall.
+            max_fps (float): Maximum FPS to cap the video playback.
+            lookahead (int): Number of decoded frames buffered ahead of the clock.
+            start_frame (int): Frame to start at, e.g. to take over from
+                another source after a config reload.
+        """
+        self.video_path = video_path
+        self.sampler = sampler
+        self.max_fps = max_fps
+        self.lookahead = lookahead
+        self.start_frame = start_frame
+        self.fps = None
+        self.clock: Optional[PlaybackClock] = None
+        self.underruns = 0
+        self._frames = queue.Queue(maxsize=lookahead)
+        self._stop = Event()
+        self._decoder = Thread(target=self._decode, name="video-decode", daemon=True)
+        self._decoder.start()
+
+    def _put(self, item) -> None:
+        while not self._stop.is_set():
+            try:
+                self._frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _open(self) -> Optional[cv.VideoCapture]:
+        cap = cv.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            logging.error(f"Failed to open video file: {self.video_path}")
+            return None
+        if self.fps is None:
+            fps = cap.get(cv.CAP_PROP_FPS) or 30
+            if self.max_fps and fps > self.max_fps:
+                fps = self.max_fps
+                logging.info(f"FPS capped to {fps}")
+            self.fps = fps
+            if self.start_frame:
+                frame_count = int(cap.get(cv.CAP_PROP_FRAME_COUNT))
+                cap.set(cv.CAP_PROP_POS_FRAMES, self.start_frame % frame_count if frame_count > 0 else 0)
+        logging.info(f"Playing video in a loop: {self.video_path} at {self.fps:.2f} FPS")
+        return cap
+
+    def _decode(self) -> None:
+        """
+        Decoder thread: fills the frame queue until stopped. Frame indices keep
+        counting across loops of the video, so the clock never restarts.
+        """
+        index = 0
+        cap = None
+        frames_in_pass = 0
+        try:
+            while not self._stop.is_set():
+                if cap is None:
+                    cap = self._open()
+                    if cap is None:
+                        break
+                    frames_in_pass = 0
+
+                # Catch up with the clock without decoding the overdue frames
+                skip = 0
+                if self.clock is not None:
+                    skip = max(self.clock.due_index(time.monotonic_ns()) - index, 0)
+                colors = self.sampler.read(cap, skip)
+                if colors is None:
+                    cap.release()
+                    cap = None
+                    if frames_in_pass == 0 and not skip:
+                        break  # Empty video
+                    index += skip  # Skipped past the end, continue with the next loop
+                    continue
+                index += skip
+                self._put((index, colors))
+                index += 1
+                frames_in_pass += 1
+        finally:
+            if cap is not None:
+                cap.release()
+            self._put(self.END)
+
+    def _wait_for_frame(self):
+        while not self._stop.is_set():
+            try:
+                return self._frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self.END
+
+    async def next_frame(self) -> Optional[Frame]:
+        while True:
+            try:
+                item = self._frames.get_nowait()
+            except queue.Empty:
+                if self.clock is not None:
+                    self.underruns += 1
+                item = await asyncio.to_thread(self._wait_for_frame)
+            if item is self.END or self._stop.is_set():
+                return None
+
+            index, colors = item
+            if self.clock is None:
+                self.clock = PlaybackClock(self.fps)
+            now = time.monotonic_ns()
+            target = self.clock.position + self.clock.frames_behind(now)
+            if index < target and not self._frames.empty():
+                continue  # Overdue, and a newer frame is already decoded
+            if index > self.clock.position:
+                self.clock.drop(index - self.clock.position)
+            self.clock.presented(now)
+            return colors
+
+    async def wait_buffered(self, timeout: float = 2.0) -> None:
+        """
+        Waits until the first frame is decoded (or the decoder gave up), so
+        the source can take over from another one without a gap.
+        """
+        deadline = time.monotonic() + timeout
+        while self._frames.empty() and self._decoder.is_alive() and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+
+    @property
+    def position(self) -> int:
+        """Frame of the video to present next."""
+        return self.start_frame + (self.clock.position if self.clock else 0)
+
+    def next_deadline_ns(self) -> Optional[int]:
+        if self.clock is None:
+            return None
+        return self.clock.deadline_ns(self.clock.position)
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        logging.info("Video playback stopped or finished.")
+
+    def stats(self) -> Dict[str, object]:
+        stats = self.clock.stats() if self.clock else {}
+        return {
+            **stats,
+            "underruns": self.underruns,
+            "buffered_frames": self._frames.qsize(),
+            "lookahead": self.lookahead,
+        }
+
+
+def piano_windows(config: Config) -> List[Tuple[int, slice]]:
+    """
+    Returns the controller and LED slice of every window, numbered across
+    the controllers as in Wall.piano_states.
+    """
+    return [(controller_idx, config.window_leds(controller_idx, window_idx))
+            for controller_idx, windows in enumerate(config.windows_per_controller)
+            for window_idx in range(windows)]
+
+
+def make_christmas_frame(config: Config, enabled: bool = True) -> Frame:
+    """
+    Create a fixed red-green pattern, alternating every window.
+
+    Args:
+        config (Config): The wall.
+        enabled (bool): If True, start with red blocks; otherwise, start with green.
+
+    Returns:
+        Frame: A (num_leds, 3) frame with red and green colors.
+    """
+    logging.debug(f"Creating Christmas frame that starts with {'red' if enabled else 'green'}")
+    even_block = config.led_windows % 2 == 0
+    first, second = ((255, 0, 0), (0, 255, 0)) if enabled else ((0, 255, 0), (255, 0, 0))
+    colors = new_frame(config.num_leds, second)
+    colors[even_block] = first
+    return colors
+
+
+class ChristmasSource(FrameSource):
+    """
+    Toggles every 5 seconds between two frames (red/green), sent every 0.1 seconds.
+    """
+
+    name = "christmas"
+    fps = 10
+
+    def __init__(self, config: Config):
+        self.frames = [make_christmas_frame(config, True), make_christmas_frame(config, False)]
+        self.start = time.monotonic()
+        self.index = 0
+
+    async def next_frame(self) -> Optional[Frame]:
+        index = int((time.monotonic() - self.start) // 5) % 2
+        if index != self.index:
+            self.index = index
+            logging.info(f"Switched to {'Red' if index == 0 else 'Green'} frame.")
+        return self.frames[index]
+
+
+class StreamSource(FrameSource):
+    """
+    A latest-frame slot: the frames pushed by an external renderer (see
+    Wall.push_frame) or the frame of the legacy commands. A changed frame is
+    sent as soon as possible, but at most max_fps times per second; changes
+    arriving faster are coalesced into the next send, so a flooding client
+    costs one send per tick. While nothing changes, the frame is resent
+    every 0.25 seconds.
+    """
+
+    name = "stream"
+
+    # Seconds between resends of the last frame
+    KEEPALIVE = 0.25
+
+    def __init__(self, num_leds: int, name: Optional[str] = None, max_fps: Optional[float] = None):
+        """
+        Args:
+            num_leds (int): Number of LEDs of the wall.
+            name (Optional[str]): Name of the source, "stream" by default.
+            max_fps (Optional[float]): Maximum sends per second, None for no limit.
+        """
+        if name:
+            self.name = name
+        self.fps = max_fps
+        self.frame = new_frame(num_leds)
+        self.frames_pushed = 0
+        self.frames_replaced = 0
+        self.sequence: Optional[int] = None
+        self.timestamp: Optional[int] = None
+        # From the first change of the frame to its send
+        self.latency = TimingStat()
+        self._changed_ns: Optional[int] = None
+        self._sent_ns = 0
+        self._pushed = asyncio.Event()
+
+    def push(self, rgb: bytes, sequence: Optional[int] = None, timestamp: Optional[int] = None) -> None:
+        """
+        Copies a frame of RGB bytes into the frame buffer.
+
+        Raises:
+            ValueError: if rgb is not 3 bytes per LED.
+        """
+        if len(rgb) != self.frame.nbytes:
+            raise ValueError(f"Expected {self.frame.nbytes} bytes of RGB, got {len(rgb)}")
+        np.copyto(self.frame, np.frombuffer(rgb, dtype=np.uint8).reshape(self.frame.shape))
+        self.changed(sequence, timestamp)
+
+    def changed(self, sequence: Optional[int] = None, timestamp: Optional[int] = None) -> None:
+        """
+        Marks the frame as changed, after writing to it in place.
+        """
+        if self._changed_ns is None:
+            self._changed_ns = time.monotonic_ns()
+        else:
+            self.frames_replaced += 1  # Coalesced with the previous change
+        self.frames_pushed += 1
+        self.sequence, self.timestamp = sequence, timestamp
+        self._pushed.set()
+
+    async def next_frame(self) -> Optional[Frame]:
+        if not self._pushed.is_set():
+            try:
+                await asyncio.wait_for(self._pushed.wait(), self.KEEPALIVE)
+            except asyncio.TimeoutError:
+                pass
+        self._pushed.clear()
+        self._sent_ns = time.monotonic_ns()
+        if self._changed_ns is not None:
+            self.latency.add((self._sent_ns - self._changed_ns) / 1e9)
+            self._changed_ns = None
+        return self.frame
+
+    def next_deadline_ns(self) -> Optional[int]:
+        if not self.fps:
+            return time.monotonic_ns()  # Paced by the pushed frames
+        return self._sent_ns + round(1e9 / self.fps)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "frames_pushed": self.frames_pushed,
+            "frames_replaced": self.frames_replaced,
+            "latency": self.latency.as_dict(),
+            "sequence": self.sequence,
+            "timestamp": self.timestamp,
+        }
+
+
+class Wall:
+    """
+    One LED wall: its controllers, render loop and animation state.
+
+    Attributes:
+        id (str): The wall id, as used in the routes.
+        config (Config): The controllers, layout and settings of the wall.
+        packet_layout (PacketLayout): Precomputed packets of every controller.
+        transport (Transport): Sends the packets, opened by start().
+        video_sampler (VideoSampler): Maps decoded video frames onto the wall.
+        scheduler (RenderScheduler): Sends the frames of the active animation.
+        clip_compiler (ClipCompiler): Compiles the videos into LED clips for this wall's mapping.
+        piano_states (np.ndarray): One RGB color per window, numbered across
+            the controllers in frame order; window w of controller c is
+            piano_states[config.window_offsets[c] + w].
+        piano_frame (Frame): piano_states expanded to the LEDs, updated
+            window by window.
+        legacy_frame (Frame): The frame of the legacy commands.
+        frame (Frame): The last frame sent to the wall.
+    """
+
+    def __init__(self, wall_id: str, config: Config, video_dir: str, clip_cache_dir: str):
+        """
+        Args:
+            wall_id (str): The wall id.
+            config (Config): The controllers, layout and settings of the wall.
+            video_dir (str): Directory with the .mp4 videos.
+            clip_cache_dir (str): Directory for the compiled clips of this wall.
+        """
+        self.id = wall_id
+        self.config = config
+        self.video_dir = video_dir
+        self.packet_layout = config.create_packet_layout()
+        self.transport = config.create_transport(self.packet_layout)
+        self.video_sampler = create_sampler(config.layout, config.settings)
+
+        # Every animation mode is a frame source; the scheduler sends the frames
+        # of the active one from a single task started by start()
+        self.scheduler = RenderScheduler(self.send_frames, config.settings["render_fps"],
+                                         new_frame(config.num_leds), config.settings["precise_sleep"])
+        self.render_task: Optional[asyncio.Task] = None
+
+        self.piano_states = np.zeros((config.num_windows, 3), dtype=np.uint8)
+        self.piano_frame: Frame = new_frame(config.num_leds)
+        self._piano_windows = piano_windows(config)
+        self._piano_lit: Set[int] = set()
+        # Resends the piano state every 0.3 seconds while persistent windows are lit
+        self.piano_source = FunctionSource("piano", 1 / 0.3, self.build_piano_colors)
+        # From receiving a key event to sending its packets
+        self.piano_latency = LatencyStat()
+        self.piano_partial_sends = 0
+
+        # Sends the legacy frame whenever a command changed it, at most at the
+        # render rate, and every 0.25 seconds in between
+        self.legacy_source = StreamSource(config.num_leds, "legacy", config.settings["render_fps"])
+        # Sends the frames of an external renderer as they arrive
+        self.stream_source = StreamSource(config.num_leds)
+        self.frame: Frame = new_frame(config.num_leds)
+
+        self.clip_compiler = ClipCompiler(video_dir, clip_cache_dir, self.video_sampler,
+                                          int(config.settings["clip_cache_mb"] * 1024 * 1024),
+                                          config.settings["clip_workers"])
+        # Serializes config reloads
+        self._reload_lock = asyncio.Lock()
+        # Held while the shared packet buffer is built and sent, which may
+        # continue on a send thread while the event loop runs (see send_frames)
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def num_leds(self) -> int:
+        return self.config.num_leds
+
+    @property
+    def legacy_frame(self) -> Frame:
+        return self.legacy_source.frame
+
+    @legacy_frame.setter
+    def legacy_frame(self, frame: Frame) -> None:
+        self.legacy_source.frame = frame
+
+    @property
+    def active(self) -> Optional[str]:
+        """Name of the active animation, None when idle."""
+        return self.scheduler.source.name if self.scheduler.source else None
+
+    def preview(self) -> Frame:
+        """
+        Returns a copy of the last frame sent to the wall.
+        """
+        return self.frame.copy()
+
+    async def start(self) -> None:
+        """
+        Opens the transport and starts the render loop and the clip compiler,
+        on the running event loop.
+        """
+        await self.transport.open()
+        self.render_task = asyncio.create_task(self.scheduler.run(), name=f"render-{self.id}")
+        loop = asyncio.get_running_loop()
+        self.clip_compiler.start(
+            on_compiled=lambda video_path: loop.call_soon_threadsafe(self.switch_to_clip, video_path))
+
+    async def close(self) -> None:
+        """
+        Clears the LEDs and stops the render loop, the clip compiler and the transport.
+        """
+        await self.stop_animation()
+        if self.render_task is not None:
+            self.render_task.cancel()
+        self.clip_compiler.close()
+        self.transport.close()
+
+    async def send_frames(self, colors: Frame) -> None:
+        """
+        Builds the packets of every controller (reversed per controller, in its
+        realtime protocol) and sends them.
+
+        Must run on the event loop. The send lock is held until the frame is
+        sent, also while the threaded transport sends it from a worker thread,
+        so the shared packet buffer and the transport's keepalive and
+        sequence state are only used by one send at a time.
+
+        Args:
+            colors (Frame): (num_leds, 3) uint8 frame for all LEDs of the wall.
+        """
+        logging.debug(f"Sending {len(colors)} colors to {len(self.config.ips)} controllers of wall {self.id}.")
+        if len(colors) != self.config.num_leds:
+            # Rendered for the wall before a config reload
+            colors = as_frame(colors, self.config.num_leds)
+        async with self._send_lock:
+            self.frame = colors
+            await self.transport.send_all_async(self.packet_layout.build(colors))
+
+    def send_controllers(self, colors: Frame, controllers: Iterable[int]) -> None:
+        """
+        Builds and sends only the packets of the given controllers, right
+        away, for a frame that differs from the last one sent only on them.
+        Must be called with the send lock held.
+
+        Args:
+            colors (Frame): (num_leds, 3) uint8 frame for all LEDs of the wall.
+            controllers (Iterable[int]): Index of every changed controller.
+        """
+        self.frame = colors
+        for controller_idx in controllers:
+            self.transport.send_packets(self.packet_layout.build_controller(colors, controller_idx),
+                                        self.packet_layout.packets)
+
+    # ----------------------------------------------------------------------------
+    #                                   PIANO
+    # ----------------------------------------------------------------------------
+
+    def build_piano_colors(self) -> Frame:
+        """
+        Returns the piano frame, piano_states expanded to the LEDs.
+        """
+        return self.piano_frame
+
+    def set_piano_window(self, window: int, color: Tuple[int, int, int]) -> int:
+        """
+        Sets a window, numbered across the controllers, in piano_states and
+        piano_frame.
+
+        Returns:
+            int: The controller of the window.
+        """
+        controller_idx, leds = self._piano_windows[window]
+        self.piano_states[window] = color
+        self.piano_frame[leds] = color
+        if any(color):
+            self._piano_lit.add(window)
+        else:
+            self._piano_lit.discard(window)
+        return controller_idx
+
+    def is_valid_window(self, controller_idx: int, window_idx: int) -> bool:
+        controllers = self.config.layout.controllers
+        return 0 <= controller_idx < len(controllers) and 0 <= window_idx < controllers[controller_idx].windows
+
+    async def handle_piano(self, controller_idx: int, window_idx: int, color: Tuple[int, int, int] = (255, 255, 255),
+                           persistent: bool = False, received_ns: Optional[int] = None):
+        """
+        Update the single window in the piano states.
+
+        Only the changed windows of the piano frame are updated. While the
+        wall shows the piano frame, only the packets of the controllers with
+        a changed window are built and sent, right away on the open sockets;
+        otherwise the whole piano frame is sent.
+
+        Args:
+            controller_idx (int): Index of the controller (0-3).
+            window_idx (int): Index of the window on the controller (0-4).
+            color (Tuple[int, int, int]): RGB color tuple.
+            persistent (bool): If True, keep the current colors; otherwise, reset others to off.
+            received_ns (Optional[int]): time.monotonic_ns() when the key event
+                was received, for the latency on /stats; now by default.
+        """
+        received_ns = received_ns or time.monotonic_ns()
+        if not (0 <= controller_idx < len(self.config.ips)):
+            logging.error(f"Invalid controller index: {controller_idx}")
+            return
+        if not self.is_valid_window(controller_idx, window_idx):
+            logging.error(f"Invalid window index: {window_idx}")
+            return
+
+        changed = {controller_idx}
+        if not persistent:
+            # Reset all lit windows to off
+            for window in list(self._piano_lit):
+                changed.add(self.set_piano_window(window, (0, 0, 0)))
+
+        # Set the chosen window's color
+        self.set_piano_window(int(self.config.window_offsets[controller_idx]) + window_idx, color)
+
+        # Immediately send the changed controllers, or the whole frame if the wall showed something
+        # else; a frame still being sent goes out first (the lock is free, without waiting, otherwise)
+        async with self._send_lock:
+            partial = self.frame is self.piano_frame
+            if partial:
+                self.send_controllers(self.piano_frame, sorted(changed))
+                self.piano_partial_sends += 1
+        if not partial:
+            await self.send_frames(self.piano_frame)
+        self.piano_latency.add((time.monotonic_ns() - received_ns) / 1e9)
+
+        scheduler = self.scheduler
+        if persistent:
+            # Keep resending the piano state
+            if scheduler.source is not self.piano_source:
+                scheduler.set_source(self.piano_source)
+        elif scheduler.source is self.piano_source:
+            logging.info("Stopping piano loop.")
+            scheduler.set_source(None)
+
+    # ----------------------------------------------------------------------------
+    #                                   VIDEO
+    # ----------------------------------------------------------------------------
+
+    def create_video_source(self, video_path: str, max_fps: float = None, start_frame: int = 0) -> VideoSource:
+        return VideoSource(video_path, self.video_sampler, max_fps, self.config.settings["video_lookahead"],
+                           start_frame)
+
+    def switch_to_clip(self, video_path: str) -> None:
+        """
+        Replaces a decoding VideoSource of video_path by its compiled clip,
+        continuing at the same frame.
+        """
+        source = self.scheduler.source
+        if not (isinstance(source, VideoSource) and source.video_path == video_path):
+            return
+        clip = self.clip_compiler.open(video_path)
+        if clip is None:
+            return
+        self.scheduler.set_source(ClipSource(clip, source.max_fps, start_frame=source.position,
+                                             video_path=video_path))
+
+    async def start_video(self, video_name: str):
+        """
+        Switches the scheduler to looping the given video: from its compiled LED
+        clip if it has an up-to-date one, otherwise by decoding it while the clip
+        is compiled in the background.
+
+        Args:
+            video_name (str): Name of the video file (without extension).
+        """
+        video_path = os.path.join(self.video_dir, video_name)
+        clip = self.clip_compiler.open(video_path)
+        if clip is not None:
+            self.scheduler.set_source(ClipSource(clip, video_path=video_path))
+            return
+
+        self.scheduler.set_source(self.create_video_source(video_path))
+        if os.path.exists(video_path):
+            self.clip_compiler.request(video_path, urgent=True)
+
+    # ----------------------------------------------------------------------------
+    #                                 CHRISTMAS
+    # ----------------------------------------------------------------------------
+
+    async def start_christmas(self):
+        """
+        Starts the Christmas animation.
+        """
+        await self.stop_animation()  # Stop any ongoing animations first
+        logging.info(
+            "Starting Christmas animation with 0.1s sends, switching frames every 5s.")
+        self.scheduler.set_source(ChristmasSource(self.config))
+
+    # ----------------------------------------------------------------------------
+    #                                   LEGACY
+    # ----------------------------------------------------------------------------
+
+    async def start_legacy_sender(self):
+        """
+        Switches the scheduler to the legacy sender if it is not already active.
+        """
+        if self.scheduler.source is not self.legacy_source:
+            self.scheduler.set_source(self.legacy_source)
+            logging.info("Legacy sender started.")
+
+    def set_all_colors(self, color: str) -> None:
+        """
+        Legacy command to set all LEDs to the given color.
+
+        Args:
+            color (str): A 6-digit hex string (e.g. "ff8040").
+        """
+        self.legacy_frame[:] = hex_to_rgb(color)
+        self.legacy_source.changed()
+        logging.info(f"Legacy: Set all colors to #{color}")
+
+    def update_matrix_legacy(self, colors: Union[List[str], Frame]) -> None:
+        """
+        Legacy command to update the entire LED matrix.
+
+        Args:
+            colors (Union[List[str], Frame]): A list of 6-digit hex strings,
+                one per LED, or the frame parsed from them (see frames.parse_hex_frame).
+
+        Raises:
+            ValueError: if the list length does not match the number of LEDs.
+        """
+        if len(colors) != self.num_leds:
+            raise ValueError(f"Expected {self.num_leds} colors but got {len(colors)}")
+        if not isinstance(colors, np.ndarray):
+            colors = [hex_to_rgb(c) for c in colors]
+        self.legacy_frame[:] = as_frame(colors, self.num_leds)
+        self.legacy_source.changed()
+        logging.info("Legacy: Full matrix update performed.")
+
+    def update_differences(self, diff_list: List[List[str]]) -> None:
+        """
+        Legacy command to update individual LED colors by index.
+
+        Args:
+            diff_list (List[List[str]]): A list of [index, hex_color] pairs.
+              For example: [["23", "ff8040"], ["45", "00ff00"]]
+
+        This function updates the legacy frame in-place.
+        """
+        for diff in diff_list:
+            try:
+                idx = int(diff[0])
+                if not (0 <= idx < self.num_leds):
+                    logging.error(f"Legacy: Index {idx} out of bounds.")
+                    continue
+                new_color = hex_to_rgb(diff[1])
+                self.legacy_frame[idx] = new_color
+                logging.debug(f"Legacy: Updated LED {idx} to #{diff[1]}")
+            except Exception as e:
+                logging.error(f"Legacy: Error updating difference {diff}: {e}")
+        self.legacy_source.changed()
+
+    def apply_differences(self, indices: np.ndarray, colors: Frame) -> None:
+        """
+        Legacy command to update individual LED colors by index, parsed by
+        frames.parse_hex_differences: scatters the colors into the legacy
+        frame in one go. Indices out of bounds are skipped; of repeated
+        indices, the last color wins.
+
+        Args:
+            indices (np.ndarray): LED index of every color.
+            colors (Frame): The colors.
+        """
+        if len(indices) and (indices.min() < 0 or indices.max() >= self.num_leds):
+            in_bounds = (indices >= 0) & (indices < self.num_leds)
+            for idx in indices[~in_bounds]:
+                logging.error(f"Legacy: Index {idx} out of bounds.")
+            indices, colors = indices[in_bounds], colors[in_bounds]
+        if len(indices) > 1:
+            # Fancy assignment does not define which of repeated indices wins
+            _, last = np.unique(indices[::-1], return_index=True)
+            if len(last) < len(indices):
+                keep = len(indices) - 1 - last
+                indices, colors = indices[keep], colors[keep]
+        self.legacy_frame[indices] = colors
+        self.legacy_source.changed()
+
+    # ----------------------------------------------------------------------------
+    #                                   STREAM
+    # ----------------------------------------------------------------------------
+
+    def push_frame(self, rgb: bytes, sequence: Optional[int] = None, timestamp: Optional[int] = None) -> None:
+        """
+        Shows a frame of an external renderer, switching to the stream source if needed.
+
+        Args:
+            rgb (bytes): 3 bytes (R, G, B) per LED, in frame order.
+            sequence (Optional[int]): Sequence number of the frame, reported in the stats.
+            timestamp (Optional[int]): Timestamp of the frame, reported in the stats.
+
+        Raises:
+            ValueError: if rgb is not 3 bytes per LED.
+        """
+        self.stream_source.push(rgb, sequence, timestamp)
+        if self.scheduler.source is not self.stream_source:
+            self.scheduler.set_source(self.stream_source)
+            logging.info("Frame stream started.")
+
+    # ----------------------------------------------------------------------------
+    #                                    STOP
+    # ----------------------------------------------------------------------------
+
+    async def stop_animation(self):
+        """
+        Stops any ongoing animation (video playback, Christmas animation, legacy
+        sender, frame stream or the piano loop) and clears the LEDs.
+        """
+        scheduler = self.scheduler
+        logging.info(f"Stopping all ongoing animations on wall {self.id}.")
+        if scheduler.source is not None:
+            logging.info(f"Stopping {scheduler.source.name} animation.")
+        scheduler.set_source(None)
+
+        # Clear LEDs
+        await self.send_frames(new_frame(self.num_leds))
+        logging.info("All animations have been stopped and LEDs cleared.")
+
+    # ----------------------------------------------------------------------------
+    #                               CONFIG RELOAD
+    # ----------------------------------------------------------------------------
+
+    async def reload(self, config: Config) -> Dict[str, object]:
+        """
+        Swaps in a new config for the wall between two frames, without
+        stopping the active animation.
+
+        The packet layout, transport and video mapping are built (in a worker
+        thread) and opened off the hot path first; the swap itself does not
+        yield to the event loop, so no frame is sent half on the old and half
+        on the new config. A video on a changed mapping continues from the
+        same frame, decoded on the new one ahead of the swap (and compiled
+        again in the background).
+        """
+        async with self._reload_lock:
+            def prepare() -> Tuple[PacketLayout, Transport, VideoSampler]:
+                packet_layout = config.create_packet_layout()
+                return (packet_layout, config.create_transport(packet_layout),
+                        create_sampler(config.layout, config.settings))
+
+            packet_layout, transport, sampler = await asyncio.to_thread(prepare)
+            scheduler = self.scheduler
+            source = scheduler.source
+            replacement = None
+            remapped = sampler.digest() != self.video_sampler.digest()
+            try:
+                await transport.open()
+                if remapped and isinstance(source, (VideoSource, ClipSource)) and source.video_path:
+                    replacement = VideoSource(source.video_path, sampler, source.max_fps,
+                                              config.settings["video_lookahead"], source.position)
+                    await replacement.wait_buffered()
+                await self._send_lock.acquire()
+            except BaseException:
+                transport.close()
+                if replacement is not None:
+                    replacement.close()
+                raise
+
+            # The swap, between two frames (and not while one is being sent)
+            try:
+                previous, previous_transport = self.config, self.transport
+                self.config = config
+                self.packet_layout, self.transport = packet_layout, transport
+                self.video_sampler = self.clip_compiler.sampler = sampler
+                if config.num_windows != previous.num_windows:
+                    self.piano_states = np.zeros((config.num_windows, 3), dtype=np.uint8)
+                self.piano_frame = self.piano_states[config.led_windows]
+                self._piano_windows = piano_windows(config)
+                self._piano_lit = set(np.flatnonzero(self.piano_states.any(axis=1)).tolist())
+                self.legacy_frame = as_frame(self.legacy_frame, config.num_leds)
+                self.stream_source.frame = as_frame(self.stream_source.frame, config.num_leds)
+                scheduler.fps = self.legacy_source.fps = config.settings["render_fps"]
+                scheduler.precise_sleep = config.settings["precise_sleep"]
+                scheduler.clear_frame = new_frame(config.num_leds)
+                if replacement is not None:
+                    if scheduler.source is source:
+                        scheduler.set_source(replacement)
+                    else:
+                        replacement.close()  # Switched while it was buffering
+                        replacement = None
+                elif isinstance(scheduler.source, ChristmasSource):
+                    scheduler.source.frames = [make_christmas_frame(config, True),
+                                               make_christmas_frame(config, False)]
+                previous_transport.close()
+            finally:
+                self._send_lock.release()
+
+        if replacement is not None:
+            self.clip_compiler.request(replacement.video_path, urgent=True)
+        for name in RESTART_SETTINGS:
+            if config.settings[name] != previous.settings[name]:
+                logging.warning(f"Setting {name} of wall {self.id} only takes effect after a restart.")
+        logging.info(f"Reloaded wall {self.id}: {len(config.ips)} controllers, {config.num_leds} LEDs.")
+        return {"controllers": len(config.ips), "leds": config.num_leds, "remapped": remapped}
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns the UDP send counters of the wall's controllers, its render
+        loop timing stats and the piano key latency.
+        """
+        return {
+            "transport": self.transport.stats(),
+            "render": self.scheduler.stats(),
+            "piano": {"latency": self.piano_latency.as_dict(), "partial_sends": self.piano_partial_sends},
+        }
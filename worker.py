@@ -0,0 +1,540 @@
+"""
+Runs a wall in its own worker process.
+
+A wall with the "worker_process" setting is driven by a WallProcess in the
+API process instead of a Wall: the API stays the control plane, while the
+wall's render loop, video decoding and transport run on the event loop of a
+worker process with its own GIL, so several video walls scale across cores.
+
+The WallProcess sends the commands of the routes (start_video,
+stop_animation, handle_piano, ...) over a pipe to the worker, which runs
+them on its Wall one at a time in the order they were sent, so the
+semantics are those of a Wall in the API process. The worker replies over
+a second pipe, which also carries its log records. The last frame sent to
+the wall and the active animation are shared back in shared memory, so
+previews and /walls never wait for the worker.
+"""
+from concurrent.futures import Future
+from logging.handlers import QueueHandler
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock, Thread
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import asyncio
+import functools
+import inspect
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import Config
+from frames import Frame, as_frame
+from layout import create_sampler
+from wall import Wall, hex_to_rgb
+
+
+class SharedFrame:
+    """
+    The last frame of a wall and its active animation, in shared memory.
+
+    Written by the worker on every send and read by the API process. A
+    sequence number, odd while a write is in progress, lets readers retry
+    instead of returning a torn frame, for at most READ_TIMEOUT seconds (a
+    worker may die halfway through a write).
+    """
+
+    NAME_SIZE = 16
+    HEADER_SIZE = 8 + NAME_SIZE
+    READ_TIMEOUT = 0.1
+
+    def __init__(self, num_leds: int, name: Optional[str] = None):
+        """
+        Args:
+            num_leds (int): Number of LEDs of the wall.
+            name (Optional[str]): Shared memory block to attach to; a new
+                block is created by default.
+        """
+        self.num_leds = num_leds
+        self.shm = SharedMemory(name=name, create=name is None, size=self.HEADER_SIZE + num_leds * 3)
+        self._sequence = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf)
+        self._name = np.ndarray((self.NAME_SIZE,), dtype=np.uint8, buffer=self.shm.buf, offset=8)
+        self._frame = np.ndarray((num_leds, 3), dtype=np.uint8, buffer=self.shm.buf, offset=self.HEADER_SIZE)
+        if name is None:
+            self._sequence[0] = 0
+            self._name[:] = 0
+            self._frame[:] = 0
+        # Last consistent reads, returned when no consistent read is possible
+        self._last: Tuple[Frame, Optional[str]] = (np.zeros((num_leds, 3), dtype=np.uint8), None)
+        self._last_active: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, frame: Optional[Frame], active: Optional[str]) -> None:
+        """
+        Publishes a frame (None to keep the current one) and the active animation.
+        """
+        self._sequence[0] += 1
+        if frame is not None:
+            self._frame[:] = frame if len(frame) == self.num_leds else as_frame(frame, self.num_leds)
+        encoded = (active or "").encode()[:self.NAME_SIZE]
+        self._name[:] = 0
+        self._name[:len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        self._sequence[0] += 1
+
+    def read(self) -> Tuple[Frame, Optional[str]]:
+        """
+        Returns a copy of the frame and the active animation, or those of
+        the last consistent read if the writer does not finish its write
+        within READ_TIMEOUT.
+        """
+        deadline = time.monotonic() + self.READ_TIMEOUT
+        while time.monotonic() < deadline:
+            sequence = int(self._sequence[0])
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            frame = self._frame.copy()
+            active = self._name.tobytes().rstrip(b"\0").decode() or None
+            if int(self._sequence[0]) == sequence:
+                self._last = (frame, active)
+                self._last_active = active
+                return frame.copy(), active
+        logging.warning(f"Shared frame {self.name} is still being written after {self.READ_TIMEOUT}s; "
+                        f"returning the last frame read")
+        return self._last[0].copy(), self._last[1]
+
+    def read_active(self) -> Optional[str]:
+        """
+        Returns the active animation without waiting: if a write is in
+        progress, the one of the last consistent read is returned instead.
+        """
+        sequence = int(self._sequence[0])
+        if sequence % 2 == 0:
+            active = self._name.tobytes().rstrip(b"\0").decode() or None
+            if int(self._sequence[0]) == sequence:
+                self._last_active = active
+        return self._last_active
+
+    def close(self, unlink: bool = False) -> None:
+        del self._sequence, self._name, self._frame
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class WorkerWall(Wall):
+    """
+    The Wall inside a worker process, publishing every frame it sends and
+    its active animation in a SharedFrame.
+    """
+
+    def __init__(self, wall_id: str, config: Config, video_dir: str, clip_cache_dir: str, shared: SharedFrame):
+        super().__init__(wall_id, config, video_dir, clip_cache_dir)
+        self.shared = shared
+
+    async def send_frames(self, colors: Frame) -> None:
+        await super().send_frames(colors)
+        self.shared.write(self.frame, self.active)
+
+    def send_controllers(self, colors: Frame, controllers: Iterable[int]) -> None:
+        super().send_controllers(colors, controllers)
+        self.shared.write(self.frame, self.active)
+
+    def publish(self) -> None:
+        self.shared.write(None, self.active)
+
+    async def reload(self, config: Config, shared_name: Optional[str] = None) -> Dict[str, object]:
+        """
+        Reloads the wall (see Wall.reload), moving to the SharedFrame
+        shared_name if the API process created a new one for a new LED count.
+        """
+        result = await super().reload(config)
+        if shared_name is not None:
+            previous, self.shared = self.shared, SharedFrame(config.num_leds, shared_name)
+            previous.close()
+            self.shared.write(self.frame, self.active)
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        return {**super().stats(), "process": {"pid": os.getpid(), "cpu_time": time.process_time()}}
+
+
+class _Outbox:
+    """
+    Queue of a QueueHandler that sends the log records over the reply pipe.
+    """
+
+    def __init__(self, send):
+        self.send = send
+
+    def put_nowait(self, record: logging.LogRecord) -> None:
+        self.send(("log", record))
+
+
+def run_worker(wall_id: str, config: Config, video_dir: str, clip_cache_dir: str, shared_name: str,
+               commands: Connection, replies: Connection, log_level: int) -> None:
+    """
+    Entry point of the worker process: runs the commands of the WallProcess
+    on a WorkerWall until it is closed or the API process goes away.
+    """
+    send_lock = Lock()
+
+    def send(message) -> None:
+        with send_lock:
+            replies.send(message)
+
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(_Outbox(send))]
+    root.setLevel(log_level)
+    wall = WorkerWall(wall_id, config, video_dir, clip_cache_dir, SharedFrame(config.num_leds, shared_name))
+    asyncio.run(_serve(wall, commands, send))
+    # Let the stopped video decoders leave OpenCV before the process exits
+    for thread in threading.enumerate():
+        if thread.name == "video-decode":
+            thread.join()
+
+
+async def _serve(wall: WorkerWall, commands: Connection, send) -> None:
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def receive() -> None:
+        while True:
+            try:
+                message = commands.recv()
+            except (EOFError, OSError):
+                message = None  # The API process is gone
+            loop.call_soon_threadsafe(inbox.put_nowait, message)
+            if message is None:
+                return
+
+    Thread(target=receive, name="wall-commands", daemon=True).start()
+    started = False
+    while True:
+        message = await inbox.get()
+        if message is None:
+            if started:
+                await wall.close()
+            break
+        request_id, method, args = message
+        try:
+            if method == "start":
+                await wall.start()
+                started = True
+                result = None
+            else:
+                result = functools.reduce(getattr, method.split("."), wall)
+                if callable(result):
+                    result = result(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+        except Exception as e:
+            if request_id is None:
+                logging.error(f"Wall {wall.id}: {method} failed => {e}")
+            result = e
+            ok = False
+        else:
+            ok = True
+        wall.publish()
+        if request_id is not None:
+            try:
+                send((request_id, ok, result))
+            except Exception as e:  # e.g. an exception that cannot be pickled
+                send((request_id, False, RuntimeError(f"{method} failed => {e}")))
+        if method == "close" or not started:
+            break
+    wall.shared.close()
+
+
+class RemoteClipCompiler:
+    """
+    The parts of the ClipCompiler of a worker the routes use.
+    """
+
+    def __init__(self, wall: "WallProcess", cache_dir: str):
+        self.wall = wall
+        self.cache_dir = cache_dir
+
+    def status(self) -> Dict[str, object]:
+        return self.wall.request("clip_compiler.status")
+
+    def is_compiled(self, video_path: str) -> bool:
+        return self.wall.request("clip_compiler.is_compiled", video_path)
+
+
+class WallProcess:
+    """
+    Runs a Wall in a worker process; a drop-in for Wall in the API process.
+
+    The async methods run the command in the worker and return its result.
+    The legacy commands and streamed frames, which the WebSocket API sends
+    at a high rate, are sent without waiting for the worker; they are still
+    applied before any later command. The synchronous queries (stats(),
+    piano_states and the clip status) block for the worker's reply, and are
+    only used from the synchronous routes, which FastAPI runs in its thread
+    pool.
+    """
+
+    # Seconds to wait for the reply to a synchronous query, and for the worker to exit
+    TIMEOUT = 5.0
+
+    def __init__(self, wall_id: str, config: Config, video_dir: str, clip_cache_dir: str):
+        """
+        Args:
+            wall_id (str): The wall id.
+            config (Config): The controllers, layout and settings of the wall.
+            video_dir (str): Directory with the .mp4 videos.
+            clip_cache_dir (str): Directory for the compiled clips of this wall.
+        """
+        self.id = wall_id
+        self.config = config
+        self.video_dir = video_dir
+        self.packet_layout = config.create_packet_layout()
+        self.video_sampler = create_sampler(config.layout, config.settings)
+        self.clip_compiler = RemoteClipCompiler(self, clip_cache_dir)
+        self.process: Optional[multiprocessing.Process] = None
+        self._shared: Optional[SharedFrame] = None
+        self._commands: Optional[Connection] = None
+        self._replies: Optional[Connection] = None
+        self._send_lock = Lock()
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._reload_lock = asyncio.Lock()
+
+    @property
+    def num_leds(self) -> int:
+        return self.config.num_leds
+
+    @property
+    def active(self) -> Optional[str]:
+        """
+        Name of the active animation, None when idle. Read without waiting for
+        the worker, as it is checked on the event loop for every legacy command.
+        """
+        return self._shared.read_active() if self._shared else None
+
+    def preview(self) -> Frame:
+        """
+        Returns a copy of the last frame sent to the wall.
+        """
+        return self._shared.read()[0]
+
+    @property
+    def piano_states(self) -> np.ndarray:
+        return self.request("piano_states")
+
+    def is_valid_window(self, controller_idx: int, window_idx: int) -> bool:
+        controllers = self.config.layout.controllers
+        return 0 <= controller_idx < len(controllers) and 0 <= window_idx < controllers[controller_idx].windows
+
+    # ----------------------------------------------------------------------------
+    #                                  COMMANDS
+    # ----------------------------------------------------------------------------
+
+    def _send(self, request_id: Optional[int], method: str, args: tuple) -> None:
+        if self.process is None or not self.process.is_alive():
+            raise RuntimeError(f"The worker process of wall {self.id} is not running")
+        with self._send_lock:
+            self._commands.send((request_id, method, args))
+
+    def _submit(self, method: str, *args) -> Tuple[int, Future]:
+        request_id = next(self._ids)
+        future: Future = Future()
+        self._pending[request_id] = future
+        try:
+            self._send(request_id, method, args)
+        except BaseException:
+            self._pending.pop(request_id, None)
+            raise
+        return request_id, future
+
+    async def call(self, method: str, *args):
+        """
+        Runs a method of the worker's Wall and returns its result.
+        """
+        _, future = self._submit(method, *args)
+        return await asyncio.wrap_future(future)
+
+    def request(self, method: str, *args):
+        """
+        Like call(), blocking the calling thread for the result.
+
+        Raises:
+            TimeoutError: if the worker does not reply within TIMEOUT; a late
+                reply is then dropped.
+        """
+        request_id, future = self._submit(method, *args)
+        try:
+            return future.result(self.TIMEOUT)
+        except TimeoutError:
+            self._pending.pop(request_id, None)
+            raise
+
+    def post(self, method: str, *args) -> None:
+        """
+        Runs a method of the worker's Wall without waiting for it; errors are logged by the worker.
+        """
+        self._send(None, method, args)
+
+    def _receive(self) -> None:
+        """
+        Reply thread: resolves the pending commands and logs the worker's log records.
+        """
+        while True:
+            try:
+                message = self._replies.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "log":
+                record = message[1]
+                logging.getLogger(record.name).handle(record)
+                continue
+            request_id, ok, result = message
+            future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+        error = RuntimeError(f"The worker process of wall {self.id} exited")
+        for request_id in list(self._pending):
+            self._pending.pop(request_id).set_exception(error)
+
+    # ----------------------------------------------------------------------------
+    #                                 LIFECYCLE
+    # ----------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """
+        Starts the worker process and, in it, the wall's transport, render
+        loop and clip compiler.
+        """
+        context = multiprocessing.get_context("spawn")
+        commands, self._commands = context.Pipe(duplex=False)
+        self._replies, replies = context.Pipe(duplex=False)
+        self._shared = SharedFrame(self.config.num_leds)
+        # Not a daemon, as it starts the clip compiler processes
+        self.process = context.Process(
+            target=run_worker, name=f"wall-{self.id}",
+            args=(self.id, self.config, self.video_dir, self.clip_compiler.cache_dir, self._shared.name,
+                  commands, replies, logging.getLogger().getEffectiveLevel()))
+        self.process.start()
+        commands.close()
+        replies.close()
+        Thread(target=self._receive, name=f"wall-{self.id}-replies", daemon=True).start()
+        try:
+            await self.call("start")
+        except BaseException:
+            await self._join()  # The worker exits when the start fails
+            raise
+        logging.info(f"Started wall {self.id} in worker process {self.process.pid}.")
+
+    async def close(self) -> None:
+        """
+        Clears the LEDs, stops the wall and waits for the worker process to exit.
+        """
+        if self.process is None:
+            return
+        try:
+            await asyncio.wait_for(self.call("close"), self.TIMEOUT)
+        except (asyncio.TimeoutError, RuntimeError) as e:
+            logging.error(f"Failed to close wall {self.id} => {e}")
+        await self._join()
+
+    async def _join(self) -> None:
+        """
+        Waits for the worker process to exit and releases the pipes and the shared frame.
+        """
+        await asyncio.to_thread(self.process.join, self.TIMEOUT)
+        if self.process.is_alive():
+            logging.warning(f"Terminating the worker process of wall {self.id}.")
+            self.process.terminate()
+            await asyncio.to_thread(self.process.join)
+        self._commands.close()
+        self._shared.close(unlink=True)
+        self._shared = None
+        self.process = None
+
+    # ----------------------------------------------------------------------------
+    #                                 ANIMATIONS
+    # ----------------------------------------------------------------------------
+
+    async def handle_piano(self, controller_idx: int, window_idx: int, color: Tuple[int, int, int] = (255, 255, 255),
+                           persistent: bool = False, received_ns: Optional[int] = None):
+        # The monotonic clock is system wide, so the worker's latency includes the pipe
+        await self.call("handle_piano", controller_idx, window_idx, color, persistent,
+                        received_ns or time.monotonic_ns())
+
+    async def start_video(self, video_name: str):
+        await self.call("start_video", video_name)
+
+    async def start_christmas(self):
+        await self.call("start_christmas")
+
+    async def start_legacy_sender(self):
+        if self.active != "legacy":  # Skip the round trip for every legacy frame command
+            await self.call("start_legacy_sender")
+
+    async def stop_animation(self):
+        await self.call("stop_animation")
+
+    def set_all_colors(self, color: str) -> None:
+        self.post("set_all_colors", color)
+
+    def update_matrix_legacy(self, colors: Union[List[str], Frame]) -> None:
+        if len(colors) != self.num_leds:
+            raise ValueError(f"Expected {self.num_leds} colors but got {len(colors)}")
+        if not isinstance(colors, np.ndarray):
+            # Parsed here, so invalid colors fail the command
+            colors = as_frame([hex_to_rgb(c) for c in colors], self.num_leds)
+        self.post("update_matrix_legacy", colors)
+
+    def update_differences(self, diff_list: List[List[str]]) -> None:
+        self.post("update_differences", diff_list)
+
+    def apply_differences(self, indices: np.ndarray, colors: Frame) -> None:
+        self.post("apply_differences", indices, colors)
+
+    def push_frame(self, rgb: bytes, sequence: Optional[int] = None, timestamp: Optional[int] = None) -> None:
+        if len(rgb) != self.num_leds * 3:
+            raise ValueError(f"Expected {self.num_leds * 3} bytes of RGB, got {len(rgb)}")
+        self.post("push_frame", bytes(rgb), sequence, timestamp)
+
+    # ----------------------------------------------------------------------------
+    #                               CONFIG RELOAD
+    # ----------------------------------------------------------------------------
+
+    async def reload(self, config: Config) -> Dict[str, object]:
+        """
+        Reloads the wall in the worker (see Wall.reload), with a new
+        SharedFrame if the number of LEDs changed.
+        """
+        async with self._reload_lock:
+            shared = SharedFrame(config.num_leds) if config.num_leds != self.config.num_leds else None
+            try:
+                result = await self.call("reload", config, shared.name if shared else None)
+            except BaseException:
+                if shared is not None:
+                    shared.close(unlink=True)
+                raise
+            self.config = config
+            self.packet_layout = config.create_packet_layout()
+            self.video_sampler = create_sampler(config.layout, config.settings)
+            if shared is not None:
+                previous, self._shared = self._shared, shared
+                previous.close(unlink=True)
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Returns the stats of the wall (see Wall.stats) and of its worker process.
+        """
+        return self.request("stats")